@@ -0,0 +1,405 @@
+"""
+Content-addressed store for fetched and derived files.
+
+Every file is stored once as a blob named by the SHA-256 of its content. Deliveries of the fetcher
+and the outputs of the image tools are hardlinked (or reflinked) to the blob instead of copied, so
+fetching a specimen again or for another list costs neither copy I/O nor disk space. The store also
+remembers which output a tool wrote for which input content and settings, so the sharpen and
+scalebar tools link the result of an earlier run instead of computing it again.
+
+The store is optional and used when the ORD_CAS environment variable is set (see open_store()):
+    ORD_CAS=<folder>            Folder of the store, on the same volume as the deliveries and specimen
+                                folders (hardlinks don't work across volumes, then files are copied)
+    ORD_CAS_MAX_GB=<GB>         Size of the blobs, the least recently used are evicted above it
+    ORD_CAS_LINK=hardlink|reflink|copy
+                                How files are materialized (default hardlink, falling back to reflink
+                                and copy). Reflinks (Btrfs, XFS) are independent copies sharing the blocks.
+
+Evicting a blob only frees its space once no delivery links to it anymore. Hardlinked files share
+the blob, so tools must call release(path) before overwriting a file in place.
+
+    python cas.py stats
+    python cas.py evict --max-gb 500
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+import io_scheduler
+
+LINK_METHODS = ('hardlink', 'reflink', 'copy')
+CHUNK_SIZE = 1024 * 1024
+# ioctl of Linux that clones the blocks of one file into another (Btrfs, XFS)
+FICLONE = 0x40049409
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs(last_used);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    digest TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS derived (
+    key TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    info TEXT
+);
+"""
+
+
+def derived_key(tool, source_digest, settings):
+    """Key of the output of a tool for an input content and its settings (a JSON serializable dict)."""
+    state = json.dumps([tool, source_digest, settings], sort_keys=True, default=str)
+    return hashlib.sha256(state.encode()).hexdigest()
+
+
+def release(path):
+    """
+    Removes a file that shares its content with the store or other deliveries, so it can be written
+    again without changing them. Files with a single link are left alone.
+    """
+    try:
+        if os.stat(path).st_nlink > 1:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _reflink(src, dst):
+    import fcntl
+    with open(src, 'rb') as source, open(dst, 'wb') as target:
+        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+
+
+class ContentStore:
+    """
+    Blobs in <root>/objects/<2 characters>/<digest> and an SQLite index of the blobs, the known
+    content of source files (by path, size and modification time) and the derived outputs.
+
+    Parameters:
+        root (str): Folder of the store, created if it doesn't exist.
+        max_bytes (int): Size budget of the blobs (None for no limit).
+        link (str): First materialization method to try, see LINK_METHODS.
+    """
+
+    def __init__(self, root, max_bytes=None, link='hardlink'):
+        if link not in LINK_METHODS:
+            raise ValueError(f"Invalid link method '{link}'. Choose from {', '.join(LINK_METHODS)}.")
+        self.root = root
+        self.max_bytes = max_bytes
+        self.methods = LINK_METHODS[LINK_METHODS.index(link):]
+        os.makedirs(os.path.join(root, 'tmp'), exist_ok=True)
+        # The image tools write from the pipeline threads, one connection and the counters are shared behind a lock
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(os.path.join(root, 'index.sqlite'), timeout=30, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.executescript(SCHEMA)
+        self.stats = {'hits': 0, 'misses': 0, 'bytes_saved': 0, 'bytes_stored': 0, 'evicted': 0}
+        self.stats.update({method: 0 for method in LINK_METHODS})
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _count(self, **amounts):
+        with self.lock:
+            for name, amount in amounts.items():
+                self.stats[name] += amount
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    def _blob(self, digest):
+        """Returns the path of a blob, or None if it's missing or was changed through a hardlink."""
+        row = self.connection.execute('SELECT size, mtime FROM blobs WHERE digest = ?', (digest,)).fetchone()
+        if row is None:
+            return None
+        path = self.blob_path(digest)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            stat = None
+        if stat is None or stat.st_size != row['size'] or stat.st_mtime != row['mtime']:
+            self._drop(digest)
+            return None
+        return path
+
+    def _drop(self, digest):
+        with self.connection:
+            self.connection.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+            self.connection.execute('DELETE FROM derived WHERE digest = ?', (digest,))
+        try:
+            os.remove(self.blob_path(digest))
+        except FileNotFoundError:
+            pass
+
+    def _add_blob(self, digest, path):
+        """Moves or links the file at path into the store, unless the blob already exists. Returns the blob path (call with the lock held)."""
+        blob = self._blob(digest)
+        if blob is not None:
+            return blob
+        blob = self.blob_path(digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        if os.path.dirname(path) == os.path.join(self.root, 'tmp'):
+            os.replace(path, blob)
+        else:
+            try:
+                os.link(path, blob)
+            except OSError:
+                shutil.copyfile(path, blob)
+        stat = os.stat(blob)
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?)',
+                                    (digest, stat.st_size, stat.st_mtime, time.time()))
+        self.stats['bytes_stored'] += stat.st_size
+        return blob
+
+    def _remember(self, path, digest):
+        stat = os.stat(path)
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)',
+                                    (os.path.abspath(path), stat.st_size, stat.st_mtime, digest))
+
+    def source_digest(self, path):
+        """Returns the digest of a file if the store knows its current content (without reading it), else None."""
+        with self.lock:
+            row = self.connection.execute('SELECT * FROM sources WHERE path = ?', (os.path.abspath(path),)).fetchone()
+        if row is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return row['digest'] if (stat.st_size, stat.st_mtime) == (row['size'], row['mtime']) else None
+
+    def read_source(self, path):
+        """Reads a whole file through the I/O scheduler and remembers the digest of its content."""
+        data = io_scheduler.read_file(path)
+        with self.lock:
+            self._remember(path, hashlib.sha256(data).hexdigest())
+        return data
+
+    def materialize(self, digest, dst):
+        """
+        Makes dst a file with the content of a blob: a hardlink, a reflink or a copy of it.
+
+        Returns:
+            bool: False if the blob isn't in the store.
+        """
+        with self.lock:
+            blob = self._blob(digest)
+            if blob is None:
+                return False
+            self.connection.execute('UPDATE blobs SET last_used = ? WHERE digest = ?', (time.time(), digest))
+        if os.path.exists(dst) and os.path.samefile(blob, dst):
+            # Already linked, rename() would do nothing and leave the temporary file behind
+            with self.lock:
+                self._remember(dst, digest)
+            return True
+        # Written next to dst and renamed, so an existing dst (maybe linked elsewhere) is replaced, not changed
+        temporary = f"{dst}.{uuid.uuid4().hex[:8]}.tmp"
+        for method in self.methods:
+            try:
+                if method == 'hardlink':
+                    os.link(blob, temporary)
+                elif method == 'reflink':
+                    _reflink(blob, temporary)
+                else:
+                    shutil.copyfile(blob, temporary)
+                break
+            except (OSError, ImportError):
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+                if method == self.methods[-1]:
+                    raise
+        os.replace(temporary, dst)
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        with self.lock:
+            self._remember(dst, digest)
+            self.stats[method] += 1
+        return True
+
+    def copy_file(self, src, dst):
+        """
+        Copies a file like io_scheduler.copy_file (with modification time and permissions), through the
+        store. A source whose content is already stored isn't read at all, other sources are read once
+        into the store. Usable as copy_function.
+        """
+        digest = self.source_digest(src)
+        if digest is not None and self.materialize(digest, dst):
+            self._count(hits=1, bytes_saved=os.path.getsize(dst))
+            return dst
+        self._count(misses=1)
+        temporary = os.path.join(self.root, 'tmp', uuid.uuid4().hex)
+        hasher = hashlib.sha256()
+        with io_scheduler.open_file(src) as source, open(temporary, 'wb') as target:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                target.write(chunk)
+        digest = hasher.hexdigest()
+        # Like copy2, the deliveries linked to the blob get the modification time and permissions of the source
+        shutil.copystat(src, temporary)
+        with self.lock:
+            self._add_blob(digest, temporary)
+            if os.path.exists(temporary):
+                # Same content was stored from another source
+                os.remove(temporary)
+            self._remember(src, digest)
+        self.materialize(digest, dst)
+        self.evict()
+        return dst
+
+    def materialize_derived(self, key, dst):
+        """Links the stored output of derived_key() to dst. Returns False if there is none."""
+        with self.lock:
+            row = self.connection.execute('SELECT digest FROM derived WHERE key = ?', (key,)).fetchone()
+        if row is None or not self.materialize(row['digest'], dst):
+            return False
+        self._count(hits=1, bytes_saved=os.path.getsize(dst))
+        return True
+
+    def derived_info(self, key):
+        """Returns the info stored with a derived output, or None."""
+        with self.lock:
+            row = self.connection.execute('SELECT info FROM derived WHERE key = ?', (key,)).fetchone()
+        return json.loads(row['info']) if row is not None and row['info'] else None
+
+    def store_derived(self, key, path, info=None):
+        """
+        Adds an output a tool has written to the store and replaces it with a link to the blob.
+        info (a JSON serializable dict, e.g. measurements of the input) is kept with it, see derived_info().
+        """
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        with self.lock:
+            self.stats['misses'] += 1
+            existed = self._blob(digest) is not None
+            self._add_blob(digest, path)
+            with self.connection:
+                self.connection.execute('INSERT OR REPLACE INTO derived VALUES (?, ?, ?)',
+                                        (key, digest, json.dumps(info) if info is not None else None))
+        if existed:
+            # Identical output of another run, share its blob
+            self.materialize(digest, path)
+        else:
+            with self.lock:
+                self._remember(path, digest)
+        self.evict()
+        return digest
+
+    def evict(self, max_bytes=None):
+        """Removes the least recently used blobs until the blobs fit into max_bytes (default: the budget)."""
+        max_bytes = max_bytes if max_bytes is not None else self.max_bytes
+        if max_bytes is None:
+            return 0
+        evicted = 0
+        with self.lock:
+            total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+            if total <= max_bytes:
+                return 0
+            for row in self.connection.execute('SELECT digest, size FROM blobs ORDER BY last_used').fetchall():
+                if total <= max_bytes:
+                    break
+                self._drop(row['digest'])
+                total -= row['size']
+                evicted += 1
+            self.stats['evicted'] += evicted
+        return evicted
+
+    def usage(self):
+        """Returns the number of blobs and their size in bytes."""
+        with self.lock:
+            row = self.connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs').fetchone()
+        return row[0], row[1]
+
+    def print_report(self):
+        """Prints the hits of this run, the bytes not copied and the size of the store."""
+        blobs, size = self.usage()
+        links = ", ".join(f"{self.stats[method]} {method}" for method in LINK_METHODS if self.stats[method])
+        print(f"\nContent store {self.root}: {self.stats['hits']} hits, {self.stats['misses']} misses, "
+              f"{self.stats['bytes_saved'] / 1e6:.1f} MB not copied ({links or 'nothing materialized'}), "
+              f"{self.stats['evicted']} evicted, {blobs} blobs with {size / 1e9:.2f} GB")
+
+
+def open_store(path=None, max_gb=None):
+    """
+    Opens the store at path or, without a path, the one given in the ORD_CAS environment variable.
+
+    Returns:
+        ContentStore: The store, or None if no store is configured.
+    """
+    path = path or os.environ.get('ORD_CAS')
+    if not path:
+        return None
+    max_gb = max_gb or float(os.environ.get('ORD_CAS_MAX_GB') or 0) or None
+    return ContentStore(path, int(max_gb * 1e9) if max_gb else None, os.environ.get('ORD_CAS_LINK', 'hardlink'))
+
+
+_default_store = None
+_default_opened = False
+
+
+def default_store():
+    """The store of ORD_CAS, opened once per process (None if it isn't set)."""
+    global _default_store, _default_opened
+    if not _default_opened:
+        _default_store = open_store()
+        _default_opened = True
+    return _default_store
+
+
+def copy_file(src, dst):
+    """Copies a file through the store of ORD_CAS, or with io_scheduler.copy_file without it. Usable as copy_function."""
+    store = default_store()
+    if store is None:
+        return io_scheduler.copy_file(src, dst)
+    return store.copy_file(src, dst)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show or shrink the content-addressed store.")
+    parser.add_argument('--store', default=os.environ.get('ORD_CAS'), help="Folder of the store (default: ORD_CAS).")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help="Print the number and size of the blobs.")
+    evict_parser = commands.add_parser('evict', help="Remove the least recently used blobs.")
+    evict_parser.add_argument('--max-gb', type=float, required=True, help="Size the blobs are reduced to.")
+    args = parser.parse_args()
+    if not args.store:
+        parser.error("No store given, use --store or set ORD_CAS.")
+
+    with open_store(args.store) as store:
+        if args.command == 'evict':
+            print(f"{store.evict(int(args.max_gb * 1e9))} blobs evicted")
+        blobs, size = store.usage()
+        derived = store.connection.execute('SELECT COUNT(*) FROM derived').fetchone()[0]
+        print(f"{blobs} blobs with {size / 1e9:.2f} GB, {derived} derived outputs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,459 @@
+"""
+SQLite catalog of the specimen archive (<root>/<collection>/<specimen id>/...).
+
+The tools look up collections, specimen folders, image counts, pixel pitches, redof poses and
+models here instead of walking the archive on the network drive. `python catalog.py update <root>`
+builds the catalog and afterwards only rescans folders whose modification time changed.
+
+The tools use the catalog given in the ORD_CATALOG environment variable (see open_catalog()),
+without it they read the file system as before.
+"""
+import argparse
+import datetime
+import os
+import re
+import sqlite3
+import time
+
+DEFAULT_CATALOG = 'catalog.sqlite'
+IMAGE_EXTENSIONS = ('.jpeg', '.jpg', '.png', '.bmp', '.tiff', '.gif')
+PIXEL_PITCH_PREFIX = '2.5.'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS collections (
+    name TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    scanned_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS specimens (
+    collection TEXT NOT NULL REFERENCES collections(name) ON DELETE CASCADE,
+    specimen_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    edof_count INTEGER NOT NULL,
+    edof_mtime REAL,
+    redof_count INTEGER NOT NULL,
+    redof_mtime REAL,
+    pixel_pitch REAL,
+    pdf_mtime REAL,
+    model_mtime REAL,
+    obj_bytes INTEGER,
+    mtl_bytes INTEGER,
+    texture_bytes INTEGER,
+    glb_bytes INTEGER,
+    scanned_at REAL NOT NULL,
+    PRIMARY KEY (collection, specimen_id)
+);
+CREATE INDEX IF NOT EXISTS specimens_id ON specimens(specimen_id);
+CREATE TABLE IF NOT EXISTS poses (
+    collection TEXT NOT NULL,
+    specimen_id TEXT NOT NULL,
+    file TEXT NOT NULL,
+    elevation REAL NOT NULL,
+    rotation REAL NOT NULL,
+    FOREIGN KEY (collection, specimen_id) REFERENCES specimens(collection, specimen_id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS poses_specimen ON poses(collection, specimen_id);
+"""
+
+
+def _mtime(path):
+    """Returns the modification time of path, or None if it doesn't exist."""
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _size(path):
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return None
+
+
+def parse_pose(filename):
+    """
+    Parses the elevation and rotation from a redof file name (<name>_<elevation>_<rotation>.jpeg).
+
+    Returns:
+        tuple: (elevation, rotation) or None if the name doesn't contain a pose.
+    """
+    parts = os.path.splitext(filename)[0].split('_')
+    try:
+        return float(parts[-2]), float(parts[-1])
+    except (IndexError, ValueError):
+        return None
+
+
+def read_pixel_pitch(specimen_folder):
+    """
+    Reads the Object Pixel Pitch from the ScanInformation.pdf of a specimen folder.
+
+    Returns:
+        float: The pixel pitch in um, or None if the PDF or the value is missing.
+    """
+    try:
+        from PyPDF2 import PdfReader
+        with open(os.path.join(specimen_folder, 'ScanInformation.pdf'), 'rb') as pdf_file:
+            lines = PdfReader(pdf_file).pages[0].extract_text().split('\n')
+    except Exception:
+        return None
+    for index, line in enumerate(lines):
+        if line.startswith(PIXEL_PITCH_PREFIX):
+            parts = line.split(': ')
+            if len(parts) > 1 and parts[1]:
+                value = parts[1]
+            else:
+                value = lines[index + 1] if index + 1 < len(lines) else ''
+            try:
+                return float(value)
+            except ValueError:
+                return None
+    return None
+
+
+def scan_specimen(specimen_folder):
+    """
+    Collects the catalog entry of one specimen folder.
+
+    Returns:
+        tuple: (dict of the specimens columns, list of (file, elevation, rotation) poses)
+    """
+    specimen_id = os.path.basename(os.path.normpath(specimen_folder))
+    entry = {'path': specimen_folder, 'mtime': _mtime(specimen_folder), 'scanned_at': time.time()}
+    poses = []
+    for folder in ('edof', 'redof'):
+        path = os.path.join(specimen_folder, folder)
+        entry[f'{folder}_mtime'] = _mtime(path)
+        try:
+            files = [f for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTENSIONS)]
+        except OSError:
+            files = []
+        entry[f'{folder}_count'] = len(files)
+        if folder == 'redof':
+            for file in sorted(files):
+                pose = parse_pose(file)
+                if pose is not None:
+                    poses.append((file, *pose))
+
+    pdf_path = os.path.join(specimen_folder, 'ScanInformation.pdf')
+    entry['pdf_mtime'] = _mtime(pdf_path)
+    entry['pixel_pitch'] = read_pixel_pitch(specimen_folder) if entry['pdf_mtime'] is not None else None
+
+    model_folder = os.path.join(specimen_folder, 'Model')
+    entry['model_mtime'] = _mtime(model_folder)
+    for column, extension in (('obj_bytes', '.obj'), ('mtl_bytes', '.mtl'), ('texture_bytes', '.png'), ('glb_bytes', '.glb')):
+        entry[column] = _size(os.path.join(model_folder, specimen_id + extension)) if entry['model_mtime'] is not None else None
+    return entry, poses
+
+
+class Catalog:
+    """
+    Specimen catalog stored in an SQLite file.
+
+    Parameters:
+        path (str): Path of the database file, created if it doesn't exist.
+    """
+
+    def __init__(self, path=DEFAULT_CATALOG):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        # WAL lets the tools read while a scan is writing
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.executescript(SCHEMA)
+        self.connection.create_function('REGEXP', 2, lambda pattern, value: re.search(pattern, value) is not None,
+                                        deterministic=True)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def update(self, root, full=False, verbose=True):
+        """
+        Scans the archive root incrementally. A specimen is rescanned if the modification time of its
+        folder, edof/redof/Model folder or ScanInformation.pdf changed; specimens and collections that
+        no longer exist are removed.
+
+        Parameters:
+            root (str): Archive folder containing the collection folders (e.g. '02 FINAL').
+            full (bool): Rescan every specimen.
+            verbose (bool): Print a line per collection.
+
+        Returns:
+            dict: Number of 'scanned', 'unchanged' and 'removed' specimens.
+        """
+        stats = {'scanned': 0, 'unchanged': 0, 'removed': 0}
+        known_collections = {row['name']: row for row in self.connection.execute('SELECT * FROM collections')}
+        collections = sorted(entry.name for entry in os.scandir(root) if entry.is_dir())
+        for name in set(known_collections) - set(collections):
+            stats['removed'] += self.connection.execute('DELETE FROM specimens WHERE collection = ?', (name,)).rowcount
+            self.connection.execute('DELETE FROM collections WHERE name = ?', (name,))
+
+        for name in collections:
+            collection_path = os.path.join(root, name)
+            mtime = _mtime(collection_path)
+            known = {row['specimen_id']: row for row in
+                     self.connection.execute('SELECT * FROM specimens WHERE collection = ?', (name,))}
+            collection = known_collections.get(name)
+            if not full and collection is not None and collection['mtime'] == mtime and collection['path'] == collection_path:
+                # No specimen folder was added or removed, reuse the known list
+                specimen_ids = sorted(known)
+            else:
+                specimen_ids = sorted(entry.name for entry in os.scandir(collection_path) if entry.is_dir())
+            # An upsert, INSERT OR REPLACE would delete the collection's specimens through the foreign key
+            self.connection.execute('INSERT INTO collections VALUES (?, ?, ?, ?) ON CONFLICT(name) DO UPDATE SET '
+                                    'path = excluded.path, mtime = excluded.mtime, scanned_at = excluded.scanned_at',
+                                    (name, collection_path, mtime, time.time()))
+
+            for specimen_id in set(known) - set(specimen_ids):
+                self.connection.execute('DELETE FROM specimens WHERE collection = ? AND specimen_id = ?', (name, specimen_id))
+                stats['removed'] += 1
+
+            scanned = 0
+            for specimen_id in specimen_ids:
+                specimen_folder = os.path.join(collection_path, specimen_id)
+                row = known.get(specimen_id)
+                if not full and row is not None and self._unchanged(row, specimen_folder):
+                    stats['unchanged'] += 1
+                    continue
+                if not os.path.isdir(specimen_folder):
+                    self.connection.execute('DELETE FROM specimens WHERE collection = ? AND specimen_id = ?', (name, specimen_id))
+                    stats['removed'] += 1
+                    continue
+                entry, poses = scan_specimen(specimen_folder)
+                self._store(name, specimen_id, entry, poses)
+                scanned += 1
+            self.connection.commit()
+            stats['scanned'] += scanned
+            if verbose:
+                print(f"{name}: {len(specimen_ids)} specimens, {scanned} rescanned")
+        self.connection.commit()
+        return stats
+
+    @staticmethod
+    def _unchanged(row, specimen_folder):
+        return (row['path'] == specimen_folder
+                and row['mtime'] == _mtime(specimen_folder)
+                and row['edof_mtime'] == _mtime(os.path.join(specimen_folder, 'edof'))
+                and row['redof_mtime'] == _mtime(os.path.join(specimen_folder, 'redof'))
+                and row['model_mtime'] == _mtime(os.path.join(specimen_folder, 'Model'))
+                and row['pdf_mtime'] == _mtime(os.path.join(specimen_folder, 'ScanInformation.pdf')))
+
+    def _store(self, collection, specimen_id, entry, poses):
+        columns = ['collection', 'specimen_id', *entry]
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO specimens ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            (collection, specimen_id, *entry.values()))
+        self.connection.execute('DELETE FROM poses WHERE collection = ? AND specimen_id = ?', (collection, specimen_id))
+        self.connection.executemany('INSERT INTO poses VALUES (?, ?, ?, ?, ?)',
+                                    [(collection, specimen_id, *pose) for pose in poses])
+
+    def collections(self):
+        """Returns the rows of all collections, sorted by name."""
+        return self.connection.execute('SELECT * FROM collections ORDER BY name').fetchall()
+
+    def collection_path(self, collection_nr):
+        """Returns the path of the first collection whose name starts with collection_nr (like fetcher.py), or None."""
+        for row in self.collections():
+            if row['name'].startswith(collection_nr):
+                return row['path']
+        return None
+
+    def match_collections(self, selection):
+        """
+        Returns the names of the collections matching a selection of collection numbers.
+
+        Parameters:
+            selection (str): A prefix ('02'), a range of numbers ('01-03'), a comma separated
+                list of both ('01,04-06') or '*' for all collections.
+
+        Returns:
+            list: Matching collection names, sorted.
+        """
+        names = [row['name'] for row in self.collections()]
+        if selection.strip() == '*':
+            return names
+        matches = set()
+        for part in selection.split(','):
+            part = part.strip()
+            if '-' in part:
+                first, last = (int(value) for value in part.split('-', 1))
+                for name in names:
+                    number = re.match(r'\d+', name)
+                    if number and first <= int(number.group()) <= last:
+                        matches.add(name)
+            elif part:
+                matches.update(name for name in names if name.startswith(part))
+        return sorted(matches)
+
+    def specimen(self, specimen_id, collection=None):
+        """Returns the row of a specimen (optionally within a collection or a list of collections), or None."""
+        query, parameters = 'SELECT * FROM specimens WHERE specimen_id = ?', [specimen_id]
+        if isinstance(collection, str):
+            query += ' AND collection = ?'
+            parameters.append(collection)
+        elif collection is not None:
+            query += f" AND collection IN ({', '.join('?' * len(collection))})"
+            parameters.extend(collection)
+        return self.connection.execute(query + ' ORDER BY collection', parameters).fetchone()
+
+    def specimen_by_path(self, specimen_folder):
+        """Returns the row of the specimen stored in specimen_folder, or None if it isn't in the catalog."""
+        wanted = os.path.normcase(os.path.abspath(specimen_folder))
+        for row in self.connection.execute('SELECT * FROM specimens WHERE specimen_id = ?',
+                                           (os.path.basename(os.path.normpath(specimen_folder)),)):
+            if os.path.normcase(os.path.abspath(row['path'])) == wanted:
+                return row
+        return None
+
+    def specimens(self, collection=None, root=None, has_glb=None):
+        """
+        Returns specimen rows sorted by collection and ID.
+
+        Parameters:
+            collection (str): Only specimens of this collection.
+            root (str): Only specimens whose folder is directly inside this folder.
+            has_glb (bool): Only specimens with (True) or without (False) a Model/<id>.glb.
+        """
+        query, parameters = 'SELECT * FROM specimens WHERE 1', []
+        if collection is not None:
+            query += ' AND collection = ?'
+            parameters.append(collection)
+        if has_glb is not None:
+            query += ' AND glb_bytes IS NOT NULL' if has_glb else ' AND glb_bytes IS NULL'
+        rows = self.connection.execute(query + ' ORDER BY collection, specimen_id', parameters).fetchall()
+        if root is not None:
+            root = os.path.normcase(os.path.abspath(root))
+            rows = [row for row in rows if os.path.normcase(os.path.dirname(os.path.abspath(row['path']))) == root]
+        return rows
+
+    def select(self, collections=None, id_pattern=None, id_regex=None, has_model=None, has_glb=None,
+               scanned_after=None, scanned_before=None, pitch_min=None, pitch_max=None):
+        """
+        Selects specimens by their metadata. Criteria that are None are ignored.
+
+        Parameters:
+            collections (list): Collection names (see match_collections()).
+            id_pattern (str): Glob pattern the ID has to match, e.g. 'NML_ENT GBIF_Chr0001*'.
+            id_regex (str): Regular expression searched in the ID.
+            has_model (bool): With (True) or without (False) a Model/<id>.obj.
+            has_glb (bool): With (True) or without (False) a Model/<id>.glb.
+            scanned_after (datetime.date): Scanned on or after this day (time of ScanInformation.pdf,
+                or of the folder if there is no PDF).
+            scanned_before (datetime.date): Scanned before this day.
+            pitch_min (float): Minimum pixel pitch in um.
+            pitch_max (float): Maximum pixel pitch in um.
+
+        Returns:
+            list: Matching specimen rows, sorted by collection and ID.
+
+        Raises:
+            ValueError: If id_regex is not a valid regular expression.
+        """
+        if id_regex is not None:
+            try:
+                re.compile(id_regex)
+            except re.error as error:
+                raise ValueError(f"Invalid regular expression '{id_regex}': {error}") from error
+        conditions, parameters = [], []
+        if collections is not None:
+            conditions.append(f"collection IN ({', '.join('?' * len(collections))})")
+            parameters.extend(collections)
+        if id_pattern is not None:
+            conditions.append('specimen_id GLOB ?')
+            parameters.append(id_pattern)
+        if id_regex is not None:
+            conditions.append('specimen_id REGEXP ?')
+            parameters.append(id_regex)
+        for column, wanted in (('obj_bytes', has_model), ('glb_bytes', has_glb)):
+            if wanted is not None:
+                conditions.append(f"{column} IS {'NOT ' if wanted else ''}NULL")
+        for day, operator in ((scanned_after, '>='), (scanned_before, '<')):
+            if day is not None:
+                conditions.append(f'COALESCE(pdf_mtime, mtime) {operator} ?')
+                parameters.append(datetime.datetime.combine(day, datetime.time()).timestamp())
+        for value, operator in ((pitch_min, '>='), (pitch_max, '<=')):
+            if value is not None:
+                conditions.append(f'pixel_pitch {operator} ?')
+                parameters.append(value)
+        query = 'SELECT * FROM specimens'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        return self.connection.execute(query + ' ORDER BY collection, specimen_id', parameters).fetchall()
+
+    def pixel_pitch(self, specimen_folder):
+        """Returns the cataloged pixel pitch of a specimen folder, or None."""
+        row = self.specimen_by_path(specimen_folder)
+        return row['pixel_pitch'] if row is not None else None
+
+    def poses(self, specimen_folder):
+        """
+        Returns the redof poses of a specimen folder.
+
+        Returns:
+            list: (file, elevation, rotation) tuples, or None if the specimen isn't in the catalog.
+        """
+        row = self.specimen_by_path(specimen_folder)
+        if row is None:
+            return None
+        return [tuple(pose) for pose in self.connection.execute(
+            'SELECT file, elevation, rotation FROM poses WHERE collection = ? AND specimen_id = ? ORDER BY file',
+            (row['collection'], row['specimen_id']))]
+
+
+def open_catalog(path=None):
+    """
+    Opens the catalog at path or, without a path, the one given in the ORD_CATALOG environment variable.
+
+    Returns:
+        Catalog: The catalog, or None if no catalog is configured or the file doesn't exist.
+    """
+    path = path or os.environ.get('ORD_CATALOG')
+    if not path or not os.path.exists(path):
+        return None
+    return Catalog(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query the specimen catalog.")
+    parser.add_argument('--db', default=os.environ.get('ORD_CATALOG', DEFAULT_CATALOG), help="Catalog database file.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    update_parser = commands.add_parser('update', help="Scan the archive, only changed folders are rescanned.")
+    update_parser.add_argument('root', help="Archive folder containing the collections (e.g. 'Z:/01_SCANNED_AND_PROCESSED/02 FINAL').")
+    update_parser.add_argument('--full', action='store_true', help="Rescan all specimens.")
+    list_parser = commands.add_parser('list', help="List the specimens.")
+    list_parser.add_argument('--collection', help="Only list this collection.")
+    list_parser.add_argument('--missing-glb', action='store_true', help="Only list specimens without a GLB.")
+    commands.add_parser('stats', help="Print the number of specimens, images and models per collection.")
+    args = parser.parse_args()
+
+    with Catalog(args.db) as catalog:
+        if args.command == 'update':
+            start = time.perf_counter()
+            stats = catalog.update(args.root, full=args.full)
+            print(f"{stats['scanned']} scanned, {stats['unchanged']} unchanged, {stats['removed']} removed "
+                  f"in {time.perf_counter() - start:.1f} s")
+        elif args.command == 'list':
+            for row in catalog.specimens(args.collection, has_glb=False if args.missing_glb else None):
+                print(f"{row['collection']}\t{row['specimen_id']}\t{row['edof_count']}\t{row['redof_count']}\t"
+                      f"{row['pixel_pitch']}\t{row['path']}")
+        else:
+            for row in catalog.connection.execute(
+                    'SELECT collection, COUNT(*) AS specimens, SUM(edof_count) AS edof, SUM(redof_count) AS redof, '
+                    'COUNT(obj_bytes) AS obj, COUNT(glb_bytes) AS glb, COUNT(pixel_pitch) AS pitch '
+                    'FROM specimens GROUP BY collection ORDER BY collection'):
+                print(f"{row['collection']}: {row['specimens']} specimens, {row['edof']} edof / {row['redof']} redof "
+                      f"images, {row['obj']} OBJ, {row['glb']} GLB, {row['pitch']} with pixel pitch")
+
+
+if __name__ == '__main__':
+    main()
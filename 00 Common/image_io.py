@@ -0,0 +1,232 @@
+"""
+Image decoding and encoding shared by the image tools.
+
+read_image() decodes with PIL or OpenCV and can decode JPEGs at a reduced resolution (1/2, 1/4
+or 1/8, done by libjpeg while decoding) when only a smaller image is needed. save_image() keeps
+the EXIF data and ICC profile of the source image and writes PNGs with a faster zlib level.
+
+Settings (environment variables):
+    ORD_IMAGE_BACKEND=auto|pil|cv2  Decoder used by read_image() (default auto: the faster one, measured
+                                    on the first image a process decodes, PIL without OpenCV)
+    ORD_PNG_COMPRESS_LEVEL=<0-9>    zlib level of written PNGs (default 3, PIL's default is 6)
+
+Compare the backends on your own images with:
+    python image_io.py benchmark <folder with images>
+"""
+import argparse
+import io
+import os
+import sys
+import threading
+import time
+
+from PIL import Image
+
+BACKENDS = ('pil', 'cv2')
+DEFAULT_BACKEND = os.environ.get('ORD_IMAGE_BACKEND', 'auto')
+# Level 3 writes our PNGs about twice as fast as level 6 at a similar size, level 9 is several times slower
+PNG_COMPRESS_LEVEL = int(os.environ.get('ORD_PNG_COMPRESS_LEVEL', 3))
+# Metadata carried from the source image to the written image
+METADATA_KEYS = ('exif', 'icc_profile', 'dpi')
+JPEG_REDUCTIONS = (8, 4, 2)
+IMAGE_EXTENSIONS = ('.jpeg', '.jpg', '.png', '.bmp', '.tiff', '.gif')
+
+# Backend chosen by 'auto', per full/reduced resolution decodes, measured once per process
+_auto_backends = {}
+_auto_lock = threading.Lock()
+
+
+def _reduction(size, target_size):
+    """Largest JPEG scale denominator that keeps the image at least as large as target_size."""
+    if not target_size:
+        return 1
+    for factor in JPEG_REDUCTIONS:
+        if size[0] // factor >= target_size[0] and size[1] // factor >= target_size[1]:
+            return factor
+    return 1
+
+
+def _read_bytes(source):
+    if hasattr(source, 'read'):
+        return source.read()
+    with open(source, 'rb') as file:
+        return file.read()
+
+
+def _read_pil(source, mode, target_size):
+    image = Image.open(source)
+    if target_size and image.format == 'JPEG':
+        # libjpeg scales the DCT blocks while decoding, the result is at least target_size large
+        image.draft(mode if mode in ('RGB', 'L') else None, target_size)
+    image.load()
+    if mode and image.mode != mode:
+        converted = image.convert(mode)
+        converted.info.update(metadata(image))
+        image = converted
+    return image
+
+
+def _read_cv2(source, mode, target_size):
+    import cv2
+    import numpy as np
+    data = _read_bytes(source)
+    # The header (size, format, EXIF, ICC profile) is read with PIL, OpenCV drops it
+    header = Image.open(io.BytesIO(data))
+    factor = _reduction(header.size, target_size) if header.format == 'JPEG' else 1
+    flags = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4,
+             8: cv2.IMREAD_REDUCED_COLOR_8}[factor]
+    # Like PIL, keep the stored pixels: the EXIF Orientation tag is copied and applied by the viewer
+    array = cv2.imdecode(np.frombuffer(data, np.uint8), flags | cv2.IMREAD_IGNORE_ORIENTATION)
+    image = Image.fromarray(cv2.cvtColor(array, cv2.COLOR_BGR2RGB))
+    if mode and image.mode != mode:
+        image = image.convert(mode)
+    image.info.update(metadata(header))
+    return image
+
+
+def _auto_backend(data, mode, target_size):
+    """
+    Returns the faster backend for decodes like this one, measured on data the first time (the
+    better of two decodes with each backend). PIL if OpenCV isn't installed.
+    """
+    key = target_size is not None
+    with _auto_lock:
+        if key not in _auto_backends:
+            try:
+                import cv2  # noqa: F401
+            except ImportError:
+                _auto_backends[key] = 'pil'
+                return 'pil'
+            seconds = {}
+            for backend, read in (('pil', _read_pil), ('cv2', _read_cv2)):
+                timings = []
+                for _ in range(2):
+                    start = time.perf_counter()
+                    read(io.BytesIO(data), mode, target_size)
+                    timings.append(time.perf_counter() - start)
+                seconds[backend] = min(timings)
+            _auto_backends[key] = min(seconds, key=seconds.get)
+        return _auto_backends[key]
+
+
+def read_image(source, mode=None, target_size=None, backend=None):
+    """
+    Decodes an image.
+
+    Parameters:
+        source (str or file): Path or binary file object (e.g. from io_scheduler.open_file).
+        mode (str): Mode to convert the image to, e.g. 'RGB' (None keeps the mode of the file).
+        target_size (tuple): (width, height) the image is needed in at least. JPEGs are then decoded
+            at the smallest reduced resolution that is still at least this large, other formats at
+            full resolution. Resize the result to the exact size yourself.
+        backend (str): 'auto', 'pil' or 'cv2' (default: ORD_IMAGE_BACKEND). OpenCV only decodes to RGB
+            and L, other modes use PIL. 'auto' uses the backend that decoded the first full or reduced
+            resolution image of the process faster.
+
+    Returns:
+        PIL.Image: The decoded image, with the EXIF data and ICC profile in image.info.
+    """
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS + ('auto',):
+        raise ValueError(f"Invalid backend '{backend}'. Choose from auto, {', '.join(BACKENDS)}.")
+    if backend == 'auto' and mode in ('RGB', 'L'):
+        backend = _auto_backends.get(target_size is not None)
+        if backend is None:
+            # The source is read once, for the measurement and the decode
+            data = _read_bytes(source)
+            source = io.BytesIO(data)
+            backend = _auto_backend(data, mode, target_size)
+    if backend == 'cv2' and mode in ('RGB', 'L'):
+        return _read_cv2(source, mode, target_size)
+    return _read_pil(source, mode, target_size)
+
+
+def read_preview(source, max_size, mode='RGB', backend=None):
+    """Decodes an image at reduced resolution and scales it so its longer side is at most max_size."""
+    image = read_image(source, mode, (max_size, max_size), backend)
+    info = metadata(image)
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    image.info.update(info)
+    return image
+
+
+def metadata(image):
+    """Returns the EXIF data, ICC profile and resolution of an image, as accepted by Image.save."""
+    return {key: image.info[key] for key in METADATA_KEYS if image.info.get(key)}
+
+
+def copy_metadata(source, target):
+    """Copies the metadata of source to target (e.g. to an image computed with OpenCV) and returns target."""
+    target.info.update(metadata(source))
+    return target
+
+
+def save_image(image, path, image_metadata=None, **options):
+    """
+    Saves an image with its metadata, PNGs with the zlib level PNG_COMPRESS_LEVEL.
+
+    Parameters:
+        image (PIL.Image): Image to save.
+        path (str): Output path, the format is taken from the extension.
+        image_metadata (dict): Metadata to write (default: the metadata in image.info).
+        **options: Further options of Image.save, e.g. quality for JPEGs.
+    """
+    params = dict(metadata(image) if image_metadata is None else image_metadata)
+    if path.lower().endswith('.png'):
+        params['compress_level'] = PNG_COMPRESS_LEVEL
+    params.update(options)
+    image.save(path, **params)
+
+
+def benchmark(folder, count=5, target_sizes=(None, (1000, 1000), (256, 256)), png_levels=(1, 3, 6, 9)):
+    """
+    Times every backend on the first images of a folder, at full and reduced resolution, and the PNG
+    zlib levels on the first decoded image. Prints the results and returns them as list of rows.
+    """
+    paths = sorted(os.path.join(folder, file) for file in os.listdir(folder) if file.lower().endswith(IMAGE_EXTENSIONS))[:count]
+    if not paths:
+        raise ValueError(f"No images in '{folder}'.")
+    contents = []
+    for path in paths:
+        with open(path, 'rb') as file:
+            contents.append(file.read())
+
+    rows = []
+    for target_size in target_sizes:
+        for backend in BACKENDS:
+            start = time.perf_counter()
+            for data in contents:
+                image = read_image(io.BytesIO(data), 'RGB', target_size, backend)
+            seconds = (time.perf_counter() - start) / len(contents)
+            rows.append(('decode', backend, 'full' if target_size is None else f"{target_size[0]}x{target_size[1]}",
+                         f"{image.width}x{image.height}", seconds, None))
+
+    image = read_image(io.BytesIO(contents[0]), 'RGB')
+    for level in png_levels:
+        output = io.BytesIO()
+        start = time.perf_counter()
+        image.save(output, format='PNG', compress_level=level)
+        rows.append(('encode png', f"level {level}", '', f"{image.width}x{image.height}", time.perf_counter() - start,
+                     len(output.getvalue())))
+
+    print(f"{'step':<12}{'backend':<10}{'target':<12}{'decoded':<12}{'ms/image':>10}{'MB':>8}")
+    for step, backend, target, decoded, seconds, size in rows:
+        size = f"{size / 1e6:.2f}" if size else ''
+        print(f"{step:<12}{backend:<10}{target:<12}{decoded:<12}{seconds * 1000:>10.1f}{size:>8}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the image decoders and PNG levels on a folder of images.")
+    parser.add_argument('command', choices=['benchmark'])
+    parser.add_argument('folder', help="Folder with images, e.g. the edof or redof folder of a specimen.")
+    parser.add_argument('-n', '--count', type=int, default=5, help="Number of images to decode.")
+    args = parser.parse_args()
+    try:
+        benchmark(args.folder, args.count)
+    except ValueError as error:
+        sys.exit(f"Error: {error}")
+
+
+if __name__ == '__main__':
+    main()
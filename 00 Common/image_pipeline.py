@@ -0,0 +1,171 @@
+"""
+Reader -> compute -> writer pipeline for the tools that process one image after the other.
+
+Reader threads decode the next images while the current ones are filtered and the previous ones
+are encoded, so network reads, computing and writing overlap. The stages are connected by bounded
+queues and the decoded images in flight are limited to a number of bytes, so memory stays bounded
+however fast the reads are.
+
+The defaults can be changed with environment variables:
+    ORD_READ_AHEAD=<n>         Images that may wait between two stages (default 4)
+    ORD_MAX_INFLIGHT_MB=<mb>   Decoded images in the pipeline at once (default 1024 MB)
+"""
+import os
+import queue
+import threading
+
+READ_AHEAD = int(os.environ.get('ORD_READ_AHEAD', 4))
+MAX_INFLIGHT_BYTES = int(os.environ.get('ORD_MAX_INFLIGHT_MB', 1024)) * 1024 * 1024
+READERS = 2
+WORKERS = 1
+WRITERS = 1
+
+_DONE = object()
+_POLL_SECONDS = 0.1
+
+
+def size_of(data):
+    """Returns the memory size of a decoded image (PIL image or NumPy array) or of bytes."""
+    if hasattr(data, 'nbytes'):
+        return data.nbytes
+    if hasattr(data, 'getbands'):
+        width, height = data.size
+        return width * height * len(data.getbands())
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    return 0
+
+
+class _ByteBudget:
+    """Blocks the readers while the images in flight use more than the allowed bytes."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, size, stop):
+        with self.condition:
+            # A single image larger than the limit is let through when the pipeline is empty
+            while self.used and self.used + size > self.limit and not stop.is_set():
+                self.condition.wait(_POLL_SECONDS)
+            self.used += size
+
+    def release(self, size):
+        with self.condition:
+            self.used -= size
+            self.condition.notify_all()
+
+
+def _put(target, entry, stop):
+    while not stop.is_set():
+        try:
+            target.put(entry, timeout=_POLL_SECONDS)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(source, stop):
+    while not stop.is_set():
+        try:
+            return source.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            pass
+    return _DONE
+
+
+def run_pipeline(items, read, process, write, read_ahead=READ_AHEAD, max_inflight_bytes=MAX_INFLIGHT_BYTES,
+                 readers=READERS, workers=WORKERS, writers=WRITERS, on_done=None):
+    """
+    Runs read(item) -> process(data) -> write(item, result) for all items with overlapping stages.
+    The items are written in the order they finish, not necessarily in the given order.
+
+    Parameters:
+        items (iterable): Work items, e.g. (input path, output path) tuples.
+        read (callable): Reads and decodes an item, called in the reader threads.
+        process (callable): Computes the result from the decoded data, called in the worker threads.
+        write (callable): Encodes and saves the result of an item, called in the writer threads.
+        read_ahead (int): Maximum number of items waiting between two stages.
+        max_inflight_bytes (int): Maximum size of the decoded data between read and write. Each
+            reader may hold one more image while it waits for the budget.
+        readers, workers, writers (int): Number of threads per stage.
+        on_done (callable): Called with every item after it was written (e.g. to update a progress bar).
+
+    Raises:
+        The first exception raised by read, process or write, after all threads have stopped.
+    """
+    items = list(items)
+    if not items:
+        return
+
+    stop = threading.Event()
+    errors = []
+    budget = _ByteBudget(max_inflight_bytes)
+    pending = queue.Queue()
+    for item in items:
+        pending.put(item)
+    decoded = queue.Queue(maxsize=read_ahead)
+    processed = queue.Queue(maxsize=read_ahead)
+
+    def guarded(function):
+        def run():
+            try:
+                function()
+            except BaseException as error:
+                errors.append(error)
+                stop.set()
+        return run
+
+    def reader():
+        while not stop.is_set():
+            try:
+                item = pending.get_nowait()
+            except queue.Empty:
+                return
+            data = read(item)
+            size = size_of(data)
+            budget.acquire(size, stop)
+            if not _put(decoded, (item, data, size), stop):
+                return
+
+    def worker():
+        while True:
+            entry = _get(decoded, stop)
+            if entry is _DONE:
+                return
+            item, data, size = entry
+            if not _put(processed, (item, process(data), size), stop):
+                return
+
+    def writer():
+        while True:
+            entry = _get(processed, stop)
+            if entry is _DONE:
+                return
+            item, result, size = entry
+            write(item, result)
+            budget.release(size)
+            if on_done is not None:
+                on_done(item)
+
+    stages = [
+        ([threading.Thread(target=guarded(reader), daemon=True) for _ in range(max(1, readers))], decoded),
+        ([threading.Thread(target=guarded(worker), daemon=True) for _ in range(max(1, workers))], processed),
+        ([threading.Thread(target=guarded(writer), daemon=True) for _ in range(max(1, writers))], None),
+    ]
+    for threads, _ in stages:
+        for thread in threads:
+            thread.start()
+
+    # When a stage has finished, every thread of the next stage gets a marker to stop after the queued items
+    for index, (threads, target) in enumerate(stages):
+        for thread in threads:
+            thread.join()
+        if target is not None:
+            for _ in stages[index + 1][0]:
+                _put(target, _DONE, stop)
+
+    if errors:
+        raise errors[0]
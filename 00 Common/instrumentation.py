@@ -0,0 +1,195 @@
+"""
+Lightweight timing and tracing shared by the collection tools.
+
+Instrumentation is off unless a run is started with one of these environment variables set:
+    ORD_TRACE=<path>.json    Chrome trace (open in chrome://tracing or https://ui.perfetto.dev) with a summary
+    ORD_PROFILE=<path>.prof  cProfile dump of the whole run (view with snakeviz or pstats)
+    ORD_SUMMARY=1            Only print the summary table at the end of the run
+
+When it is off, span() returns a shared no-op context manager and count_bytes() returns
+immediately, so the calls can stay in the hot loops.
+"""
+import atexit
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+
+enabled = False
+
+_run_name = None
+_trace_path = None
+_profile_path = None
+_profiler = None
+_start = 0.0
+_events = []
+_counters = {}
+_lock = threading.Lock()
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def start(name, trace_path=None, profile_path=None, summary=False):
+    """
+    Starts recording a run. Without arguments the settings are taken from the environment variables.
+    The results are written by stop(), which is also called when the interpreter exits.
+
+    Parameters:
+        name (str): Name of the run (tool name), used in the trace and summary.
+        trace_path (str): Chrome trace JSON file to write.
+        profile_path (str): cProfile stats file to write.
+        summary (bool): Record and print the summary even without a trace file.
+
+    Returns:
+        bool: Whether instrumentation is enabled.
+    """
+    global enabled, _run_name, _trace_path, _profile_path, _profiler, _start
+    trace_path = trace_path or os.environ.get('ORD_TRACE')
+    profile_path = profile_path or os.environ.get('ORD_PROFILE')
+    summary = summary or os.environ.get('ORD_SUMMARY', '') not in ('', '0')
+    if not (trace_path or profile_path or summary):
+        return False
+
+    _run_name, _trace_path, _profile_path = name, trace_path, profile_path
+    _events.clear()
+    _counters.clear()
+    _start = time.perf_counter()
+    enabled = True
+    if profile_path:
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    atexit.register(stop)
+    return True
+
+
+def stop(quiet=False):
+    """
+    Stops recording and writes the trace, profile and summary. Does nothing if no run is active.
+    With quiet=True the summary isn't printed (read it with summary() before stopping).
+    """
+    global enabled, _profiler
+    if not enabled:
+        return
+    enabled = False
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(_profile_path)
+        _profiler = None
+        print(f"Profile written to {_profile_path}")
+    if _trace_path:
+        write_trace(_trace_path)
+        print(f"Trace written to {_trace_path}")
+    if not quiet:
+        print_summary()
+
+
+class _Span:
+    __slots__ = ('name', 'args', 'begin')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.begin = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        _events.append((self.name, self.begin, end - self.begin, threading.get_ident(), self.args))
+        return False
+
+
+def span(name, **args):
+    """
+    Context manager timing a block, e.g. `with span('decode'):`. Nested spans show up nested in the trace.
+
+    Parameters:
+        name (str): Stage name, spans with the same name are added up in the summary.
+        **args: Extra values stored with the event (e.g. the specimen or file name).
+    """
+    if not enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def timed(name=None):
+    """Decorator recording every call of the function as a span (named after the function by default)."""
+    def decorator(function):
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with _Span(span_name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, amount=1):
+    """Adds amount to the counter name (e.g. files copied)."""
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def count_bytes(name, path):
+    """Adds the size of a file, or of all files below a folder, to the counter name."""
+    if not enabled:
+        return
+    if os.path.isdir(path):
+        size = sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(path) for file in files)
+    else:
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+    count(name, size)
+
+
+def summary():
+    """
+    Returns the recorded totals.
+
+    Returns:
+        dict: {'run', 'wall_seconds', 'spans': {name: {'count', 'seconds', 'mean_ms', 'max_ms'}}, 'counters'}
+    """
+    spans = {}
+    for name, _, duration, _, _ in list(_events):
+        entry = spans.setdefault(name, {'count': 0, 'seconds': 0.0, 'max_ms': 0.0})
+        entry['count'] += 1
+        entry['seconds'] += duration
+        entry['max_ms'] = max(entry['max_ms'], duration * 1000)
+    for entry in spans.values():
+        entry['mean_ms'] = entry['seconds'] * 1000 / entry['count']
+    return {'run': _run_name, 'wall_seconds': time.perf_counter() - _start, 'spans': spans, 'counters': dict(_counters)}
+
+
+def write_trace(path):
+    """Writes the recorded spans and counters in the Chrome trace event format, with the summary in 'otherData'."""
+    pid = os.getpid()
+    trace_events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': _run_name}}]
+    for name, begin, duration, thread, args in list(_events):
+        trace_events.append({'name': name, 'ph': 'X', 'ts': (begin - _start) * 1e6, 'dur': duration * 1e6,
+                             'pid': pid, 'tid': thread, 'args': {key: str(value) for key, value in args.items()}})
+    end = (time.perf_counter() - _start) * 1e6
+    for name, value in _counters.items():
+        trace_events.append({'name': name, 'ph': 'C', 'ts': end, 'pid': pid, 'args': {name: value}})
+    with open(path, 'w', encoding='utf-8') as trace_file:
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms', 'otherData': summary()}, trace_file)
+
+
+def print_summary():
+    """Prints the time per stage and the counters, slowest stage first."""
+    result = summary()
+    print(f"\n{result['run']}: {result['wall_seconds']:.2f} s")
+    print(f"{'stage':<20}{'count':>8}{'total [s]':>12}{'mean [ms]':>12}{'max [ms]':>12}")
+    for name, entry in sorted(result['spans'].items(), key=lambda item: -item[1]['seconds']):
+        print(f"{name:<20}{entry['count']:>8}{entry['seconds']:>12.3f}{entry['mean_ms']:>12.2f}{entry['max_ms']:>12.2f}")
+    for name, value in sorted(result['counters'].items()):
+        if name.startswith('bytes'):
+            print(f"{name:<20}{value / 1e6:>12.1f} MB")
+        else:
+            print(f"{name:<20}{value:>12}")
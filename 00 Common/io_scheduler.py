@@ -0,0 +1,357 @@
+"""
+Bandwidth caps, open file limits and priority classes for reads from the archive share.
+
+A fetch for a researcher ('interactive') and a collection-wide sharpen/scalebar pass ('batch')
+get separate bandwidth caps, so background runs leave the share to the scanners. All reads go
+through open_file(), read_file() or copy_file(), which wait for a free file slot of the host and
+for the bandwidth of their class. Without limits they only count the bytes.
+
+The file slots are shared by all processes using the same lock folder: a slot is a locked file
+slot_<n> in <ORD_IO_LOCK_DIR>/<host>, and interactive reads waiting for a slot hold a locked
+wait_<id> file there, which makes batch reads of every process wait. The operating system
+releases the locks of a process that crashed. The bandwidth caps apply per process.
+
+The limits are set with environment variables (or configure()):
+    ORD_IO_PRIORITY=interactive|batch   Class of the run (default: batch, fetcher.py: interactive)
+    ORD_IO_INTERACTIVE_MBPS=<MB/s>      Bandwidth cap per host and process for interactive reads
+    ORD_IO_BATCH_MBPS=<MB/s>            Bandwidth cap per host and process for batch reads
+    ORD_IO_MAX_OPEN=<n>                 Files open at the same time per host, over all processes
+    ORD_IO_LOCK_DIR=<folder>            Folder of the slot files (default: ord_io_slots in the temporary
+                                        folder, shared by the processes of one machine; use a folder on
+                                        a share to coordinate several machines)
+
+Hosts are the server of UNC paths (\\\\server\\share) or the drive letter (Z:), 'local' otherwise.
+"""
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+import instrumentation
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+PRIORITIES = ('interactive', 'batch')
+CHUNK_SIZE = 1024 * 1024
+# Seconds between two attempts to get a file slot
+POLL_SECONDS = 0.05
+
+
+def _env_number(name):
+    value = os.environ.get(name, '')
+    return float(value) if value else None
+
+
+priority = os.environ.get('ORD_IO_PRIORITY', 'batch')
+bandwidth = {'interactive': _env_number('ORD_IO_INTERACTIVE_MBPS'), 'batch': _env_number('ORD_IO_BATCH_MBPS')}
+max_open = int(_env_number('ORD_IO_MAX_OPEN') or 0) or None
+lock_dir = os.environ.get('ORD_IO_LOCK_DIR') or os.path.join(tempfile.gettempdir(), 'ord_io_slots')
+
+_lock = threading.Lock()
+_buckets = {}
+_slots = {}
+_stats = {}
+
+
+def configure(run_priority=None, interactive_mbps=None, batch_mbps=None, max_open_files=None):
+    """
+    Changes the class of the run and the limits, arguments left at None keep their setting.
+    Environment variables that are set take precedence, so a run can always be tuned from outside.
+    """
+    global priority, max_open
+    with _lock:
+        if run_priority and 'ORD_IO_PRIORITY' not in os.environ:
+            if run_priority not in PRIORITIES:
+                raise ValueError(f"Invalid priority '{run_priority}'. Choose from {', '.join(PRIORITIES)}.")
+            priority = run_priority
+        if interactive_mbps and 'ORD_IO_INTERACTIVE_MBPS' not in os.environ:
+            bandwidth['interactive'] = interactive_mbps
+        if batch_mbps and 'ORD_IO_BATCH_MBPS' not in os.environ:
+            bandwidth['batch'] = batch_mbps
+        if max_open_files and 'ORD_IO_MAX_OPEN' not in os.environ:
+            max_open = max_open_files
+        _buckets.clear()
+        _slots.clear()
+
+
+def is_limited():
+    """Whether any bandwidth cap or open file limit is set."""
+    return bool(max_open or any(bandwidth.values()))
+
+
+def host_of(path):
+    """Returns the host a path is read from: the server of a UNC path, the drive letter or 'local'."""
+    drive = os.path.splitdrive(os.path.abspath(path))[0]
+    if drive.startswith(('\\\\', '//')):
+        return drive.replace('/', '\\').split('\\')[2].lower()
+    return drive.upper() or 'local'
+
+
+class _TokenBucket:
+    """Bandwidth cap with a burst of one second. Reads may overdraw it, the next reads then wait longer."""
+
+    def __init__(self, mbps):
+        self.rate = mbps * 1e6
+        self.tokens = self.rate
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, size):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate) - size
+            self.last = now
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+def _try_lock(file):
+    """Locks an open file without waiting, returns False if another open file holds the lock."""
+    try:
+        if os.name == 'nt':
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(file):
+    if os.name == 'nt':
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+    file.close()
+
+
+class _HostSlots:
+    """
+    Limits the open files of a host over all processes with the same lock folder. Interactive reads
+    get the next free slot before batch reads.
+    """
+
+    def __init__(self, limit, host):
+        self.limit = limit
+        self.folder = os.path.join(lock_dir, re.sub(r'[^\w.-]', '_', host))
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _interactive_waiting(self):
+        """Whether an interactive read of any process waits for a slot. Removes wait files of ended processes."""
+        for entry in os.scandir(self.folder):
+            if not entry.name.startswith('wait_'):
+                continue
+            try:
+                wait_file = open(entry.path, 'ab')
+            except OSError:
+                continue
+            if not _try_lock(wait_file):
+                wait_file.close()
+                return True
+            _unlock(wait_file)
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+        return False
+
+    def acquire(self, run_priority):
+        """Waits for a free slot and returns its locked file, pass it to release()."""
+        wait_file = None
+        if run_priority == 'interactive':
+            name = uuid.uuid4().hex
+            wait_path = os.path.join(self.folder, f"wait_{name}")
+            if os.name == 'nt':
+                # Files open in another process can't be removed, so a batch read can't remove it before it's locked
+                wait_file = open(wait_path, 'ab')
+                _try_lock(wait_file)
+            else:
+                # Locked before it gets the name batch reads look for
+                wait_file = open(os.path.join(self.folder, f"new_{name}"), 'ab')
+                _try_lock(wait_file)
+                os.replace(wait_file.name, wait_path)
+        try:
+            while True:
+                if run_priority != 'batch' or not self._interactive_waiting():
+                    for number in range(self.limit):
+                        slot = open(os.path.join(self.folder, f"slot_{number}"), 'ab')
+                        if _try_lock(slot):
+                            return slot
+                        slot.close()
+                time.sleep(POLL_SECONDS)
+        finally:
+            if wait_file is not None:
+                _unlock(wait_file)
+                try:
+                    os.remove(wait_path)
+                except FileNotFoundError:
+                    # Already taken for the file of an ended process by a batch read
+                    pass
+
+    def release(self, slot):
+        _unlock(slot)
+
+
+def _record(host, run_priority, size=0, wait=0.0, opened=False):
+    with _lock:
+        entry = _stats.setdefault((host, run_priority), {'bytes': 0, 'files': 0, 'wait_seconds': 0.0,
+                                                         'first': time.perf_counter(), 'last': 0.0})
+        entry['bytes'] += size
+        entry['wait_seconds'] += wait
+        entry['last'] = time.perf_counter()
+        if opened:
+            entry['files'] += 1
+
+
+def _bucket(host, run_priority):
+    mbps = bandwidth.get(run_priority)
+    if not mbps:
+        return None
+    with _lock:
+        if (host, run_priority) not in _buckets:
+            _buckets[host, run_priority] = _TokenBucket(mbps)
+        return _buckets[host, run_priority]
+
+
+def _host_slots(host):
+    if not max_open:
+        return None
+    with _lock:
+        if host not in _slots:
+            _slots[host] = _HostSlots(max_open, host)
+        return _slots[host]
+
+
+class ScheduledFile:
+    """Read-only binary file whose reads are throttled. Use it like the file returned by open()."""
+
+    def __init__(self, path, run_priority=None):
+        self.host = host_of(path)
+        self.priority = run_priority or priority
+        self._bucket = _bucket(self.host, self.priority)
+        self._slots = _host_slots(self.host)
+        if self._slots is not None:
+            start = time.perf_counter()
+            with instrumentation.span('io_wait'):
+                self._slot = self._slots.acquire(self.priority)
+            _record(self.host, self.priority, wait=time.perf_counter() - start)
+        try:
+            self._file = open(path, 'rb')
+        except BaseException:
+            if self._slots is not None:
+                self._slots.release(self._slot)
+            raise
+        _record(self.host, self.priority, opened=True)
+
+    def read(self, size=-1):
+        if self._bucket is None:
+            data = self._file.read(size)
+            _record(self.host, self.priority, len(data))
+            return data
+        # Throttled reads are split into chunks, so the bandwidth is used evenly
+        chunks = []
+        remaining = size if size is not None and size >= 0 else float('inf')
+        while remaining > 0:
+            chunk = self._file.read(int(min(remaining, CHUNK_SIZE)))
+            if not chunk:
+                break
+            with instrumentation.span('io_wait'):
+                wait = self._bucket.consume(len(chunk))
+            _record(self.host, self.priority, len(chunk), wait)
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b''.join(chunks)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return self._file.seekable()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+            if self._slots is not None:
+                self._slots.release(self._slot)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_file(path, run_priority=None):
+    """Opens a file for reading through the scheduler (use as context manager)."""
+    return ScheduledFile(path, run_priority)
+
+
+def read_file(path, run_priority=None):
+    """Reads a whole file through the scheduler."""
+    with ScheduledFile(path, run_priority) as source:
+        return source.read()
+
+
+def copy_file(src, dst, run_priority=None):
+    """
+    Copies a file like shutil.copy2 (with modification time and permissions), reading through the
+    scheduler. Also usable as copytree's copy_function.
+    """
+    if not is_limited():
+        # Nothing to wait for, keep the fast copy of the operating system
+        shutil.copy2(src, dst)
+        _record(host_of(src), run_priority or priority, os.path.getsize(dst), opened=True)
+        return dst
+    with ScheduledFile(src, run_priority) as source, open(dst, 'wb') as target:
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            target.write(chunk)
+    shutil.copystat(src, dst)
+    return dst
+
+
+def throughput():
+    """
+    Returns the achieved read throughput.
+
+    Returns:
+        dict: {(host, priority): {'bytes', 'files', 'seconds', 'mb_per_second', 'wait_seconds'}}
+    """
+    result = {}
+    with _lock:
+        for key, entry in _stats.items():
+            seconds = max(entry['last'] - entry['first'], 1e-9)
+            result[key] = {'bytes': entry['bytes'], 'files': entry['files'], 'seconds': seconds,
+                           'mb_per_second': entry['bytes'] / seconds / 1e6, 'wait_seconds': entry['wait_seconds']}
+    return result
+
+
+def print_report():
+    """Prints the read throughput per host and class and the limits it was achieved with."""
+    results = throughput()
+    if not results:
+        return
+    limits = ", ".join(f"{name} {mbps:g} MB/s" for name, mbps in bandwidth.items() if mbps) or "no bandwidth caps"
+    print(f"\nReads ({limits}, {max_open or 'unlimited'} open files per host):")
+    print(f"{'host':<16}{'class':<13}{'files':>8}{'MB':>10}{'MB/s':>9}{'waited [s]':>12}")
+    for (host, run_priority), entry in sorted(results.items()):
+        print(f"{host:<16}{run_priority:<13}{entry['files']:>8}{entry['bytes'] / 1e6:>10.1f}"
+              f"{entry['mb_per_second']:>9.1f}{entry['wait_seconds']:>12.1f}")
@@ -0,0 +1,164 @@
+"""
+Memory-mapped OBJ parser shared by mesh_stats.py and reorient_obj.py.
+
+The file is memory-mapped and its lines are grouped into blocks of consecutive lines with the same
+keyword (the usual layout: all vertices, then all UVs, normals and faces). Every block is parsed with
+one NumPy call instead of a Python loop per line. Blocks with mixed column counts (e.g. only some
+vertices carry a colour) and polygon faces fall back to slower paths, so any valid OBJ is read.
+
+    data = read_obj(obj_path)
+    data['v'], data['vt'], data['vn']   (n, 3), (n, 2), (n, 3) arrays of the parsed attributes
+    data['counts']                      {'v': n, 'vt': n, 'vn': n}, also of attributes not parsed
+    data['corners']                     (n * 3, 3) 0-based (v, vt, vn) indices of the fan-triangulated faces
+    data['mtllib']                      material libraries named in the OBJ
+"""
+import mmap
+import os
+import re
+
+import numpy as np
+
+# Bytes of the OBJ parsed at once, a block is split after about this size
+BLOCK_SIZE = 64 * 1024 * 1024
+ATTRIBUTES = ('v', 'vt', 'vn')
+COLUMNS = {'v': 3, 'vt': 2, 'vn': 3}
+
+_LINE_START = re.compile(rb'^(v|vt|vn|f|mtllib)[ \t]', re.MULTILINE)
+
+
+def line_blocks(data, block_size=BLOCK_SIZE):
+    """
+    Groups the lines of an OBJ by their keyword into byte ranges of consecutive lines.
+
+    Returns:
+        dict: {keyword: [(start, end, line_count, defined), ...]}, defined is the number of
+            (v, vt, vn) lines before the block, which negative face indices count back from.
+    """
+    blocks = {}
+    defined = dict.fromkeys(ATTRIBUTES, 0)
+    current, block_start, block_end, count = None, 0, 0, 0
+
+    def close_block():
+        blocks.setdefault(current, []).append((block_start, block_end, count, tuple(defined.values())))
+        if current in defined:
+            defined[current] += count
+
+    for match in _LINE_START.finditer(data):
+        keyword = match.group(1).decode()
+        line_end = data.find(b'\n', match.start())
+        line_end = len(data) if line_end == -1 else line_end
+        if keyword == current and match.start() <= block_end + 2 and line_end - block_start <= block_size:
+            block_end, count = line_end, count + 1
+            continue
+        if current is not None:
+            close_block()
+        current, block_start, block_end, count = keyword, match.start(), line_end, 1
+    if current is not None:
+        close_block()
+    return blocks
+
+
+def _strip_keyword(data, start, end, keyword):
+    return bytes(data[start:end]).replace(keyword.encode() + b' ', b' ').replace(keyword.encode() + b'\t', b' ')
+
+
+def _tokens_per_line(text, line_count):
+    """Number of whitespace separated tokens on every line of text."""
+    buffer = np.frombuffer(text, dtype=np.uint8)
+    space = np.isin(buffer, (9, 10, 13, 32))
+    token_start = ~space & np.concatenate(([True], space[:-1]))
+    line = np.cumsum(buffer == 10)
+    return np.bincount(line[token_start], minlength=line_count)[:line_count]
+
+
+def parse_rows(data, blocks, keyword, columns=None):
+    """
+    Parses all lines of an attribute into an (n, columns) array. Extra values (e.g. vertex colours)
+    are dropped, also if only some lines have them.
+
+    Raises:
+        ValueError: If a line has fewer than columns values.
+    """
+    columns = columns or COLUMNS[keyword]
+    parts = []
+    for start, end, count, _ in blocks.get(keyword, []):
+        text = _strip_keyword(data, start, end, keyword)
+        values = np.array(text.split(), dtype=np.float64)
+        if len(values) == count * columns:
+            parts.append(values.reshape(count, columns))
+            continue
+        lengths = _tokens_per_line(text, count)
+        if lengths.min() < columns:
+            raise ValueError(f"'{keyword}' line with fewer than {columns} values.")
+        # Mixed column counts: the first columns values of every line
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        parts.append(values[offsets[:, None] + np.arange(columns)])
+    return np.concatenate(parts) if parts else np.zeros((0, columns))
+
+
+def _face_block_corners(data, start, end, count):
+    """Returns the 1-based (v, vt, vn) indices of the triangulated corners of a face block, missing entries are 0."""
+    text = _strip_keyword(data, start, end, 'f')
+    first_corner = text.split(None, 1)[0].replace(b'//', b'/0/')
+    components = len(first_corner.split(b'/'))
+    numbers = np.array(text.replace(b'//', b'/0/').replace(b'/', b' ').split(), dtype=np.int64)
+    if len(numbers) == count * 3 * components and (_tokens_per_line(text, count) == 3).all():
+        # Only triangles with the same corner format: one reshape
+        corners = np.zeros((count * 3, 3), dtype=np.int64)
+        corners[:, :components] = numbers.reshape(-1, components)
+        return corners
+    # Polygons or mixed corner formats, triangulate line by line
+    corners = []
+    for line in text.splitlines():
+        polygon = [(corner.split(b'/') + [b'', b''])[:3] for corner in line.split()]
+        polygon = [[int(index) if index else 0 for index in corner] for corner in polygon]
+        for i in range(1, len(polygon) - 1):
+            corners.extend((polygon[0], polygon[i], polygon[i + 1]))
+    return np.array(corners, dtype=np.int64).reshape(-1, 3)
+
+
+def parse_corners(data, blocks):
+    """
+    Returns the (n * 3, 3) 0-based (v, vt, vn) indices of the corners of the fan-triangulated faces.
+    Missing entries (e.g. no vt) and the invalid index 0 become -1. Negative (relative) indices count
+    back from the attributes defined before the face, as in the OBJ specification.
+    """
+    parts = []
+    for start, end, count, defined in blocks.get('f', []):
+        corners = _face_block_corners(data, start, end, count)
+        parts.append(np.where(corners > 0, corners - 1, np.where(corners < 0, corners + np.array(defined), -1)))
+    return np.concatenate(parts) if parts else np.zeros((0, 3), dtype=np.int64)
+
+
+def material_libraries(data, blocks):
+    """Returns the file names of the mtllib lines."""
+    return [name.decode(errors='replace').strip()
+            for start, end, _, _ in blocks.get('mtllib', [])
+            for name in (line.split(maxsplit=1)[1] for line in bytes(data[start:end]).splitlines())]
+
+
+def read_obj(obj_path, attributes=ATTRIBUTES, block_size=BLOCK_SIZE):
+    """
+    Reads an OBJ file with a memory map.
+
+    Parameters:
+        obj_path (str): Path to the .obj file.
+        attributes (tuple): Attributes to parse ('v', 'vt', 'vn'), the others are only counted.
+        block_size (int): Bytes of the file parsed at once.
+
+    Returns:
+        dict: The arrays of the attributes, their 'counts', the face 'corners' and the 'mtllib' names.
+    """
+    if os.path.getsize(obj_path) == 0:
+        # mmap can't map an empty file
+        return _collect(b'', {}, attributes)
+    with open(obj_path, 'rb') as obj_file, mmap.mmap(obj_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return _collect(data, line_blocks(data, block_size), attributes)
+
+
+def _collect(data, blocks, attributes):
+    result = {keyword: parse_rows(data, blocks, keyword) for keyword in attributes}
+    result['counts'] = {keyword: sum(block[2] for block in blocks.get(keyword, [])) for keyword in ATTRIBUTES}
+    result['corners'] = parse_corners(data, blocks)
+    result['mtllib'] = material_libraries(data, blocks)
+    return result
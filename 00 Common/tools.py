@@ -0,0 +1,52 @@
+"""
+Loads the tool scripts of the other folders as modules, for the benchmarks, the watcher and
+other tools that chain them. Their main() only runs when they are started directly.
+"""
+import importlib.util
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TOOLS = {
+    'fetcher': os.path.join('01 Fetcher', 'fetcher.py'),
+    'scalebar': os.path.join('02 Scalebar', 'add_scalebars_new.py'),
+    'sharpen': os.path.join('03 Sharpen', 'sharpen.py'),
+    'convert_splats': os.path.join('04 Viewer', 'convert_splats.py'),
+    'extract_images': os.path.join('05 Thumbnail', 'extract_images.py'),
+    'render_thumbnails': os.path.join('05 Thumbnail', 'render_thumbnails.py'),
+    'reorient_obj': os.path.join('06 Blender GLB', 'reorient_obj.py'),
+    'make_tiles': os.path.join('10 Deep Zoom', 'make_tiles.py'),
+    'image_io': os.path.join('00 Common', 'image_io.py'),
+}
+
+_loaded = {}
+
+
+def tool_path(name):
+    """Returns the absolute path of a tool script."""
+    return os.path.join(REPO_ROOT, TOOLS[name])
+
+
+def load_tool(name):
+    """
+    Imports a tool script as a module (once per process).
+
+    Parameters:
+        name (str): Key of TOOLS, e.g. 'sharpen'.
+
+    Returns:
+        module: The imported tool.
+    """
+    if name not in _loaded:
+        path = tool_path(name)
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        # The tools import modules from their own folder
+        sys.path.insert(0, os.path.dirname(path))
+        try:
+            spec.loader.exec_module(module)
+        finally:
+            sys.path.remove(os.path.dirname(path))
+        _loaded[name] = module
+    return _loaded[name]
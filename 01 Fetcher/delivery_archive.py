@@ -0,0 +1,144 @@
+#Streams fetched files from the source share into ZIP/tar volumes without a local copy
+import collections
+import concurrent.futures
+import io
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '00 Common'))
+import instrumentation
+import io_scheduler
+
+#Already compressed formats are stored, everything else (OBJ, MTL, logs, ...) is deflated
+STORED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.glb', '.zip', '.gz', '.7z')
+#Files larger than this are not read ahead but streamed by the writer in chunks
+MAX_PREFETCH_BYTES = 64 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+
+def _read(path):
+    with instrumentation.span('archive_read'):
+        return io_scheduler.read_file(path)
+
+
+class DeliveryArchive:
+    """
+    Writes files into one or more ZIP or tar archives. Several reader threads read the files ahead
+    from the (network) source while a single writer adds them in the order they were added.
+
+    Parameters:
+        base_path (str): Path of the archive without extension. With a volume size the volumes
+            are named <base_path>_001.zip, <base_path>_002.zip, ...
+        archive_format (str): 'zip' or 'tar'.
+        volume_size (int): Maximum size of a volume in bytes (None for a single archive). A file
+            larger than the volume size gets a volume of its own.
+        readers (int): Number of reader threads.
+        compress_level (int): Deflate level for compressed ZIP entries.
+    """
+
+    def __init__(self, base_path, archive_format='zip', volume_size=None, readers=4, compress_level=6):
+        if archive_format not in ('zip', 'tar'):
+            raise ValueError("Invalid archive format. Choose 'zip' or 'tar'.")
+        self.base_path = base_path
+        self.archive_format = archive_format
+        self.volume_size = volume_size
+        self.compress_level = compress_level
+        self.volumes = []
+        self.errors = []
+        self.file_count = 0
+        self._archive = None
+        self._volume_bytes = 0
+        self._max_pending = 2 * readers
+        self._pending = collections.deque()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=readers)
+
+    def add(self, path, arcname):
+        """Queues a file, arcname is its path inside the archive (with forward slashes)."""
+        try:
+            size = os.path.getsize(path)
+        except OSError as error:
+            self.errors.append((arcname, error))
+            return
+        data = self._executor.submit(_read, path) if size <= MAX_PREFETCH_BYTES else None
+        self._pending.append((path, arcname, size, data))
+        while len(self._pending) > self._max_pending:
+            self._write_next()
+
+    def close(self):
+        """Writes the queued files and closes the last volume."""
+        while self._pending:
+            self._write_next()
+        self._executor.shutdown()
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _open_volume(self):
+        if self._archive is not None:
+            self._archive.close()
+        extension = '.zip' if self.archive_format == 'zip' else '.tar'
+        if self.volume_size:
+            path = "{}_{:03d}{}".format(self.base_path, len(self.volumes) + 1, extension)
+        else:
+            path = self.base_path + extension
+        if self.archive_format == 'zip':
+            self._archive = zipfile.ZipFile(path, 'w', allowZip64=True)
+        else:
+            self._archive = tarfile.open(path, 'w')
+        self.volumes.append(path)
+        self._volume_bytes = 0
+
+    def _write_next(self):
+        path, arcname, size, data = self._pending.popleft()
+        try:
+            content = data.result() if data is not None else None
+            #The uncompressed size is used for the volume limit, so volumes stay below it
+            if self._archive is None or (self.volume_size and self._volume_bytes and self._volume_bytes + size > self.volume_size):
+                self._open_volume()
+            with instrumentation.span('archive_write'):
+                if self.archive_format == 'zip':
+                    self._write_zip(path, arcname, size, content)
+                else:
+                    self._write_tar(path, arcname, size, content)
+            self._volume_bytes += size
+            self.file_count += 1
+            instrumentation.count('bytes_archived', size)
+        except Exception as error:
+            self.errors.append((arcname, error))
+
+    def _write_zip(self, path, arcname, size, content):
+        info = zipfile.ZipInfo(arcname, date_time=time.localtime(os.path.getmtime(path))[:6])
+        info.compress_type = zipfile.ZIP_STORED if arcname.lower().endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+        info.file_size = size
+        if content is not None:
+            self._archive.writestr(info, content, compresslevel=self.compress_level)
+        else:
+            with io_scheduler.open_file(path) as source, self._archive.open(info, 'w', force_zip64=True) as target:
+                shutil.copyfileobj(source, target, CHUNK_SIZE)
+
+    def _write_tar(self, path, arcname, size, content):
+        info = tarfile.TarInfo(arcname)
+        info.mtime = os.path.getmtime(path)
+        if content is not None:
+            info.size = len(content)
+            self._archive.addfile(info, io.BytesIO(content))
+            return
+        #The header holding the size is written before the data, so large files are read into a local
+        #temporary file first. A file that changed since it was listed would leave a corrupt volume.
+        with io_scheduler.open_file(path) as source, tempfile.TemporaryFile() as spool:
+            shutil.copyfileobj(source, spool, CHUNK_SIZE)
+            info.size = spool.tell()
+            spool.seek(0)
+            self._archive.addfile(info, spool)
+
@@ -9,6 +9,13 @@ import time
 import datetime
 from time import strftime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '00 Common'))
+import cas
+import instrumentation
+import io_scheduler
+from catalog import open_catalog
+from delivery_archive import DeliveryArchive
+
 ts = time.time()
 current_time = str(datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S'))
 log_file_name = 'information_{}.log'.format(current_time).replace(" ", "_").replace(":", "-")
@@ -16,13 +23,16 @@ log_file_name = 'information_{}.log'.format(current_time).replace(" ", "_").repl
 logger = logging.getLogger(__name__)
 logging.basicConfig(filename=log_file_name, format='%(levelname)s:%(message)s', encoding='utf-8', level=logging.INFO)
 
-def check_existence_of_files(id_list_path, src_dir, dest_dir, collection_nr):
-    #check if collection_nr exists in files
+def check_existence_of_files(id_list_path, src_dir, dest_dir, collection_nr, specimen_catalog=None):
+    #check if collection_nr exists in files (or in the catalog, which also knows collection ranges)
     collection_exists = False
-    for dir in os.listdir(src_dir):
-        if dir.startswith(collection_nr):
-            collection_exists = True
-            break
+    if specimen_catalog:
+        collection_exists = bool(specimen_catalog.match_collections(collection_nr))
+    else:
+        for dir in os.listdir(src_dir):
+            if dir.startswith(collection_nr):
+                collection_exists = True
+                break
 
     return not (os.path.exists(src_dir) and collection_exists and os.path.exists(id_list_path) and os.path.exists(dest_dir))
 
@@ -45,10 +55,44 @@ parser = CustomParser()
 #parser = argparse.ArgumentParser(description='Self-explanatory usage of program. Also see below for further information.')
 #parser.add_argument('-v', '--verbose', help="Increase output verbosity (for debugging)", action="store_true")
 parser.add_argument('-D', '--DEBUG', help="DEBUG mode", action="store_true")
-parser.add_argument('id_list_path', help="Indicate path to file containing identifiers. 1 identifier per line.")
-parser.add_argument('collection_nr', help="Collection number.")
+parser.add_argument('-S', '--src_dir', help="Data source parent directory (default: {}).".format(src_dir))
+parser.add_argument('-C', '--catalog', help="Specimen catalog to look up collections and IDs in instead of listing src_dir (default: ORD_CATALOG).")
+parser.add_argument('id_list_path', help="Indicate path to file containing identifiers. 1 identifier per line. With a selection query, the matching identifiers are written to this file.")
+parser.add_argument('collection_nr', help="Collection number. With a catalog also a range or list, e.g. 01-03 or 01,04 or * for all.")
 parser.add_argument('file_types', nargs='+', help="- File type(s) to ret rieve.", type=str.lower, choices=["png", "jpg", 'obj']) #Currently accepted queries
+#Selection query, resolved against the specimen catalog instead of reading IDs from id_list_path
+query = parser.add_argument_group('selection query (requires a catalog)')
+query.add_argument('--id', dest='id_pattern', help="ID glob pattern, e.g. 'NML_ENT GBIF_Chr0001*'.")
+query.add_argument('--id-regex', help="Regular expression searched in the IDs.")
+query.add_argument('--has-model', help="Only specimens with an OBJ model.", action="store_true")
+query.add_argument('--has-glb', help="Only specimens with a GLB model.", action="store_true")
+query.add_argument('--scanned-after', help="Only specimens scanned on or after this day (YYYY-MM-DD).", type=datetime.date.fromisoformat)
+query.add_argument('--scanned-before', help="Only specimens scanned before this day (YYYY-MM-DD).", type=datetime.date.fromisoformat)
+query.add_argument('--pitch-min', help="Minimum object pixel pitch [um].", type=float)
+query.add_argument('--pitch-max', help="Maximum object pixel pitch [um].", type=float)
+query.add_argument('--overwrite-list', help="Replace an existing file at id_list_path with the query result.", action="store_true")
+#Archive output, files are streamed from src_dir into <list name>.zip/.tar instead of being copied into folders
+parser.add_argument('-A', '--archive', help="Write the files into a zip or tar archive next to the list.", type=str.lower, choices=['zip', 'tar'])
+parser.add_argument('--volume-size', help="Split the archive into volumes of at most this size [MB].", type=float)
+parser.add_argument('--readers', help="Number of parallel file readers for the archive (default: 4).", type=int, default=4)
+#Read scheduling, so a fetch doesn't take the whole share from the scanners (see 00 Common/io_scheduler.py)
+parser.add_argument('--io-priority', help="Priority class of the reads (default: interactive).", choices=io_scheduler.PRIORITIES, default='interactive')
+parser.add_argument('--bandwidth', help="Maximum read bandwidth from the share [MB/s].", type=float)
+parser.add_argument('--max-open', help="Maximum number of files open on the share at the same time.", type=int)
+#Deduplicated copies, files fetched before are linked from the content store instead of copied (see 00 Common/cas.py)
+parser.add_argument('--cas', help="Content store folder (default: ORD_CAS).", type=str)
 args = parser.parse_args()
+if args.id_regex is not None:
+    #An invalid pattern would only fail inside the SQLite query
+    try:
+        re.compile(args.id_regex)
+    except re.error as error:
+        parser.error("Invalid --id-regex '{}': {}".format(args.id_regex, error))
+query_mode = args.has_model or args.has_glb or any(value is not None for value in (
+    args.id_pattern, args.id_regex, args.scanned_after, args.scanned_before, args.pitch_min, args.pitch_max))
+#The query result replaces the list file, a hand-built list must not be lost by adding a query option
+if query_mode and os.path.exists(args.id_list_path) and not args.overwrite_list:
+    parser.error("'{}' already exists, pass --overwrite-list to replace it with the query result.".format(args.id_list_path))
 
 
 #Assume: Destination of copied files are going to be in the same folder as the list file
@@ -58,7 +102,29 @@ script_name = os.path.basename(script_file_path)
 
 id_list_path = args.id_list_path
 dest_dir = os.path.dirname(id_list_path)
+if args.src_dir:
+    src_dir = args.src_dir
+
+#Records timings of the listing/copying if ORD_TRACE/ORD_PROFILE/ORD_SUMMARY is set
+instrumentation.start('fetcher')
+io_scheduler.configure(args.io_priority, max_open_files=args.max_open, **{args.io_priority + '_mbps': args.bandwidth})
+specimen_catalog = open_catalog(args.catalog)
+content_store = cas.open_store(args.cas)
+copy_file = content_store.copy_file if content_store else io_scheduler.copy_file
+collection_names = specimen_catalog.match_collections(args.collection_nr) if specimen_catalog else None
 
+if query_mode:
+    if not specimen_catalog:
+        parser.error("A selection query needs a specimen catalog (-C or ORD_CATALOG).")
+    selection = specimen_catalog.select(collection_names, args.id_pattern, args.id_regex, args.has_model or None,
+                                        args.has_glb or None, args.scanned_after, args.scanned_before, args.pitch_min, args.pitch_max)
+    #Write the selection as ID list, it is read below like a hand-built list and documents what was fetched
+    #(an ID found in several collections is only fetched once, from the first collection)
+    selected_ids = list(dict.fromkeys(row['specimen_id'] for row in selection))
+    with open(id_list_path, 'w') as f:
+        f.writelines(selected_id + "\n" for selected_id in selected_ids)
+    print("{} specimens match the query, their IDs are written to {}".format(len(selected_ids), id_list_path))
+    logger.info("\tQuery {} matched {} specimens.".format(sys.argv[1:], len(selected_ids)))
 
 print('Initiating copying process. Please wait.')
 if args.DEBUG: #For testing and debugging purposes, use a demo directory
@@ -72,7 +138,7 @@ if args.DEBUG: #For testing and debugging purposes, use a demo directory
     #Information about list, src and dest. directory
     try:
         #Check if file at id_list_path, src_dir and dest_dir exist (dest_dir is checked for future implementation, if another destination is selected)
-        if check_existence_of_files(id_list_path, src_dir, dest_dir, args.collection_nr):
+        if check_existence_of_files(id_list_path, src_dir, dest_dir, args.collection_nr, specimen_catalog):
         #if not (os.path.exists(id_list_path) and os.path.exists(src_dir) and os.path.exists(dest_dir)):
             logger.error("\tExcecption FileNotFoundError: File(s) were not found in specified locations.")
             raise FileNotFoundError("Excecption FileNotFoundError: File(s) were not found in specified locations.")
@@ -91,23 +157,35 @@ if args.DEBUG: #For testing and debugging purposes, use a demo directory
 
 try:
     #Check if file at id_list_path, src_dir and dest_dir exist (dest_dir is checked for future implementation, if another destination is selected)
-    if check_existence_of_files(id_list_path, src_dir, dest_dir, args.collection_nr):
+    if check_existence_of_files(id_list_path, src_dir, dest_dir, args.collection_nr, specimen_catalog):
     #if not (os.path.exists(id_list_path) and os.path.exists(src_dir) and os.path.exists(dest_dir)):
         logger.error("\tExcecption FileNotFoundError: File(s) were not found in specified locations.")
         raise FileNotFoundError("Excecption FileNotFoundError: File(s) were not found in specified locations.")
     
     collection_dir = None
     collection_dir_path = None
-    for dir in os.listdir(src_dir):
-        if dir.startswith(args.collection_nr):
-            collection_dir = dir
-            collection_dir_path = os.path.join(src_dir, dir)
-            break
+    if specimen_catalog:
+        #With a range of collections there is no single collection folder, the catalog knows each specimen's folder
+        if len(collection_names) == 1:
+            collection_dir = collection_names[0]
+            collection_dir_path = specimen_catalog.collection_path(collection_dir)
+    else:
+        for dir in os.listdir(src_dir):
+            if dir.startswith(args.collection_nr):
+                collection_dir = dir
+                collection_dir_path = os.path.join(src_dir, dir)
+                break
     
     if args.DEBUG:
         print(f"{collection_dir=}")
         print(f"{collection_dir_path=}")
 
+    delivery = None
+    if args.archive:
+        archive_base_path = os.path.join(dest_dir, os.path.splitext(os.path.basename(id_list_path))[0])
+        volume_size = int(args.volume_size * 1024 * 1024) if args.volume_size else None
+        delivery = DeliveryArchive(archive_base_path, args.archive, volume_size, args.readers)
+
     #Read identifier from file, line by line
     with open(id_list_path) as f:
         for line in f:
@@ -116,13 +194,20 @@ try:
             print("Fetching files for ID = {} ...".format(id))
             try: #Find folder with ID
                 id_dir_path = None
-                pattern = re.compile(id)
-                if id in os.listdir(collection_dir_path): #if ID is within src directory
+                specimen = None
+                with instrumentation.span('list', id=id):
+                    if specimen_catalog:
+                        #The catalog is updated incrementally, so fall back to the folder for IDs added since
+                        specimen = specimen_catalog.specimen(id, collection_names)
+                        id_exists = specimen is not None or (collection_dir_path is not None and os.path.isdir(os.path.join(collection_dir_path, id)))
+                    else:
+                        id_exists = id in os.listdir(collection_dir_path)
+                if id_exists: #if ID is within src directory
                     #make new folder with name ID in dest
-                    id_dir_path = os.path.join(collection_dir_path, id)
+                    id_dir_path = specimen['path'] if specimen else os.path.join(collection_dir_path, id)
                     #print(f"{id_dir_path=}")
                     new_folder_dir_id = os.path.join(dest_dir, id)
-                    if not os.path.exists(new_folder_dir_id):
+                    if not delivery and not os.path.exists(new_folder_dir_id):
                         if args.DEBUG:
                             print("Creating new directory {}".format(new_folder_dir_id))
                         os.makedirs(new_folder_dir_id)
@@ -134,7 +219,7 @@ try:
                             #print("MAKING NEW DIRECTORY WITH NAME {}".format(dest))
                             #if not os.path.exists(dest):
                             #    os.makedirs(dest)
-                            if os.path.exists(dest):
+                            if not delivery and os.path.exists(dest):
                                 logger.warning("\tID = {}: Directory {} already exists.".format(id, dest))
                                 raise Exception("ID = {}: Directory {} already exists.".format(id, dest))
                             
@@ -148,9 +233,20 @@ try:
                                     print(f"{src=}")
                                     print(f"{dest=}")
                                     #print(os.listdir(src))
+                                if delivery:
+                                    #Stream into the archive as <ID>/<file type>/<renamed file>
+                                    with instrumentation.span('list', id=id):
+                                        img_files = sorted(os.listdir(src))
+                                    print("Archiving {} files from {}".format(file_type, src))
+                                    for img_file in img_files:
+                                        delivery.add(os.path.join(src, img_file), "/".join([id, file_type, img_file.replace("image", id)]))
+                                    logger.info("\t{} files from \t{} - SUCCESSFULLY queued for the archive.".format(file_type, id))
+                                    continue
                                 try:
                                     print("Copying {} files from {} to {}".format(file_type, src, dest))
-                                    shutil.copytree(src, dest)
+                                    with instrumentation.span('copy', id=id, file_type=file_type):
+                                        shutil.copytree(src, dest, copy_function=copy_file)
+                                    instrumentation.count_bytes('bytes_copied', dest)
                                     logger.info("\t{} files from \t{} - SUCCESSFULLY copied.".format(file_type, id))
                                 except Exception as error:
                                     logger.error("\t{} files from \t{} - ERROR during copying process. {}".format(file_type, id, error))
@@ -158,12 +254,20 @@ try:
 
                                 try:
                                     #Rename files: replace "image" with identifier
-                                    for img_file in os.listdir(dest):
-                                        os.rename(os.path.join(dest, img_file), os.path.join(dest, img_file.replace("image", id)))
+                                    with instrumentation.span('rename', id=id):
+                                        for img_file in os.listdir(dest):
+                                            os.rename(os.path.join(dest, img_file), os.path.join(dest, img_file.replace("image", id)))
                                 except Exception as error:
                                     logger.error("\t{} files from \t{} - ERROR during renaming process. {}".format(file_type, id, error))
                                     print(error)
                             elif file_type == 'obj': #copy obj, mtb and png files
+                                if delivery:
+                                    for file_extension in ['obj', 'mtl', 'png']:
+                                        src = os.path.join(id_dir_path, "Model", id + ".{}".format(file_extension))
+                                        print("Archiving {} file from {}".format(file_extension, src))
+                                        delivery.add(src, "/".join([id, file_type, "{}.{}".format(id, file_extension)]))
+                                    logger.info("\tobj files from \t{} - SUCCESSFULLY queued for the archive.".format(id))
+                                    continue
                                 base_dest = os.path.join(new_folder_dir_id, file_type)
                                 if args.DEBUG:
                                     print("Creating new directory {}".format(base_dest))
@@ -180,7 +284,9 @@ try:
                                         #print(os.listdir(src))
                                     try:
                                         print("Copying {} file from {} to {}".format(file_extension, src, dest))
-                                        shutil.copyfile(src, dest)
+                                        with instrumentation.span('copy', id=id, file_type=file_extension):
+                                            copy_file(src, dest)
+                                        instrumentation.count_bytes('bytes_copied', dest)
                                         logger.info("\t{} file from \t{} - SUCCESSFULLY copied.".format(file_extension, id))
                                     except Exception as error:
                                         logger.error("\t{} file from \t{} - ERROR during copying process. {}".format(file_extension, id, error))
@@ -204,6 +310,21 @@ except Exception as error:
     os.remove(log_file_name)
     sys.exit(1)
 
+if delivery:
+    print()
+    print("Writing the remaining files into the archive. Please wait.")
+    delivery.close()
+    for arcname, error in delivery.errors:
+        logger.error("\t{} - ERROR during archiving. {}".format(arcname, error))
+        print("{} - ERROR during archiving. {}".format(arcname, error))
+    logger.info("\t{} files archived into {}".format(delivery.file_count, ", ".join(delivery.volumes)))
+    print("{} files archived into {}".format(delivery.file_count, ", ".join(delivery.volumes)))
+
+instrumentation.stop()
+io_scheduler.print_report()
+if content_store:
+    content_store.print_report()
+    content_store.close()
 logging.shutdown()
 shutil.move(log_file_name, dest_dir)
 print()
@@ -1,10 +1,19 @@
+import io
 import os
+import sys
 import warnings
 
-from PIL import Image, ImageDraw, ImageFont
-from PyPDF2 import PdfReader
+from PIL import ImageDraw, ImageFont
 from tqdm.auto import tqdm
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '00 Common'))
+import cas
+import image_io
+import instrumentation
+import io_scheduler
+from catalog import open_catalog
+from image_pipeline import run_pipeline
+
 
 DEFAULT_SCALEBAR_KWARGS = {
     'corner': 'bottom_right',
@@ -29,6 +38,9 @@ def extract_object_pixel_pitch(folder_path):
     Returns:
         str: The Object Pixel Pitch value or an error message if not found.
     """
+    # Imported here, PyPDF2 is only needed for specimens whose pixel pitch isn't in the catalog
+    from PyPDF2 import PdfReader
+
     pdf_path = os.path.join(folder_path, "ScanInformation.pdf")
     prefix = "2.5."
     sep = ": "
@@ -52,9 +64,36 @@ def extract_object_pixel_pitch(folder_path):
     return "Object Pixel Pitch value not found"
 
 
-def add_scalebar(
-        image_path,
-        output_path,
+def add_scalebar(image_path, output_path, scalebar_length, **scalebar_kwargs):
+    image = read_image(image_path)
+    draw_scalebar(image, scalebar_length, **scalebar_kwargs)
+    save_image(image, output_path)
+
+
+def read_image(image_path, store=None):
+    with instrumentation.span('decode'):
+        if store:
+            # The store remembers the digest of the bytes, to file the result under it
+            image = image_io.read_image(io.BytesIO(store.read_source(image_path)))
+        else:
+            with io_scheduler.open_file(image_path) as image_file:
+                image = image_io.read_image(image_file)
+    instrumentation.count_bytes('bytes_read', image_path)
+    return image
+
+
+def save_image(image, output_path, store=None):
+    if store:
+        # The output may be linked to the store and other outputs, it must not be overwritten in place
+        cas.release(output_path)
+    with instrumentation.span('encode'):
+        image_io.save_image(image, output_path)
+    instrumentation.count_bytes('bytes_written', output_path)
+
+
+@instrumentation.timed('draw')
+def draw_scalebar(
+        image,
         scalebar_length,
         corner=DEFAULT_SCALEBAR_KWARGS['corner'],
         text_position=DEFAULT_SCALEBAR_KWARGS['text_position'],
@@ -66,7 +105,7 @@ def add_scalebar(
         fontsize=DEFAULT_SCALEBAR_KWARGS['fontsize'],
         font_style=DEFAULT_SCALEBAR_KWARGS['font_style'],
 ):
-    image = Image.open(image_path)
+    """Draws the scalebar and its "1mm" label into the image (in place) and returns the image."""
     draw = ImageDraw.Draw(image)
 
     img_width, img_height = image.size
@@ -125,11 +164,10 @@ def add_scalebar(
     # Draw the text on the image using the specified anchor point
     draw.text((text_x, text_y), text, fill="black", font=font, anchor=text_anchor)
 
-    # Save the modified image
-    image.save(output_path)
+    return image
 
 
-def process_specimen(specimen_folder, use_edof: bool = False, verbose=True, **scalebar_kwargs):
+def process_specimen(specimen_folder, use_edof: bool = False, verbose=True, specimen_catalog=None, **scalebar_kwargs):
 
     # Check if primary folder exists; if not, use the fallback folder
     input_folder = os.path.join(specimen_folder, "edof" if use_edof else "redof")
@@ -146,12 +184,17 @@ def process_specimen(specimen_folder, use_edof: bool = False, verbose=True, **sc
     output_folder = os.path.join(specimen_folder, f"{os.path.basename(input_folder)}_scalebar")
     os.makedirs(output_folder, exist_ok=True)
 
-    object_pixel_pitch = extract_object_pixel_pitch(specimen_folder)
+    # The catalog already knows the pixel pitch of scanned specimens, parse the PDF only for the others
+    object_pixel_pitch = specimen_catalog.pixel_pitch(specimen_folder) if specimen_catalog else None
+    if object_pixel_pitch is None:
+        with instrumentation.span('pdf'):
+            object_pixel_pitch = extract_object_pixel_pitch(specimen_folder)
     scalebar_length = int(1000 / float(object_pixel_pitch))
 
     valid_extensions = {".jpeg", ".jpg", ".png", ".bmp", ".tiff", ".gif"}
-    image_files = [filename for filename in os.listdir(input_folder) if
-                   any(filename.lower().endswith(ext) for ext in valid_extensions)]
+    with instrumentation.span('list'):
+        image_files = [filename for filename in os.listdir(input_folder) if
+                       any(filename.lower().endswith(ext) for ext in valid_extensions)]
 
     if verbose:
         print(f"Input Folder: {input_folder}")
@@ -159,10 +202,32 @@ def process_specimen(specimen_folder, use_edof: bool = False, verbose=True, **sc
         print(f"Object Pixel Pitch [um]: {object_pixel_pitch}")
         print(f"Scalebar Length [px]: {scalebar_length}")
 
-    for filename in tqdm(image_files, desc="Processing images", unit="image"):
-        image_path = os.path.join(input_folder, filename)
-        output_path = os.path.join(output_folder, filename)
-        add_scalebar(image_path, output_path, scalebar_length, **scalebar_kwargs)
+    items = [(os.path.join(input_folder, filename), os.path.join(output_folder, filename)) for filename in image_files]
+    # With a content store (ORD_CAS), images with the same scalebar drawn before are linked from it
+    store = cas.default_store()
+    cache_settings = dict(scalebar_kwargs, scalebar_length=scalebar_length)
+    if store:
+        uncached = []
+        for image_path, output_path in items:
+            digest = store.source_digest(image_path)
+            if not (digest and store.materialize_derived(cas.derived_key('scalebar', digest, cache_settings), output_path)):
+                uncached.append((image_path, output_path))
+        items = uncached
+        if verbose and len(items) < len(image_files):
+            print(f"{len(image_files) - len(items)} images linked from the content store")
+
+    def write(paths, image):
+        save_image(image, paths[1], store)
+        if store:
+            store.store_derived(cas.derived_key('scalebar', store.source_digest(paths[0]), cache_settings), paths[1])
+
+    # The next images are read while the scalebar is drawn into the current one and the previous one is saved
+    with tqdm(total=len(items), desc="Processing images", unit="image") as progress:
+        run_pipeline(items,
+                     read=lambda paths: read_image(paths[0], store),
+                     process=lambda image: draw_scalebar(image, scalebar_length, **scalebar_kwargs),
+                     write=write,
+                     on_done=lambda _: progress.update())
 
 
 def parse_folder_list(file_path):
@@ -304,14 +369,27 @@ def main():
     # Prompt for optional arguments
     optional_kwargs = prompt_user_for_optional_arguments()
 
+    # Records stage timings if ORD_TRACE/ORD_PROFILE/ORD_SUMMARY is set
+    instrumentation.start('add_scalebars')
+    # Specimen catalog given in ORD_CATALOG, if any
+    specimen_catalog = open_catalog()
+
     # Process each specimen folder with a tqdm progress bar
     for folder in tqdm(specimen_folders, desc="Processing specimen folders", unit="folder"):
         if optional_kwargs['verbose']:
             print(f"Starting folder: {folder}")
-        process_specimen(
-            specimen_folder=folder,
-            **optional_kwargs
-        )
+        with instrumentation.span('specimen', folder=folder):
+            process_specimen(
+                specimen_folder=folder,
+                specimen_catalog=specimen_catalog,
+                **optional_kwargs
+            )
+
+    instrumentation.stop()
+    if io_scheduler.is_limited():
+        io_scheduler.print_report()
+    if cas.default_store():
+        cas.default_store().print_report()
 
     # Keep the command window open until the user decides to close it
     input("Processing complete! Press Enter to exit...")
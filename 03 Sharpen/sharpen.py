@@ -1,9 +1,18 @@
+import csv
+import io
 import os
+import sys
 import warnings
 from PIL import Image
-import cv2
-import numpy as np
 from tqdm.auto import tqdm
+# cv2 and numpy are imported in the filter functions, so the prompts appear without waiting for them
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '00 Common'))
+import cas
+import image_io
+import instrumentation
+import io_scheduler
+from image_pipeline import run_pipeline
 
 # Default sharpening parameters
 DEFAULT_SHARPENING_KWARGS = {
@@ -11,10 +20,60 @@ DEFAULT_SHARPENING_KWARGS = {
     'unsharp_radius': {'default': 1.5, 'description': 'Radius for Unsharp Mask, controlling the amount of blurring before sharpening.'},
     'unsharp_percent': {'default': 150, 'description': 'Strength of sharpening effect as a percentage.'},
     'highpass_radius': {'default': 1, 'description': 'Radius for High Pass filter, influencing detail retention in sharpening.'},
+    'sharpness_policy': {'default': 'off', 'description': "Per-image sharpening: 'off' (same for all images), 'skip' (copy images that are already sharp) or 'adaptive' (lighter for sharp, stronger for blurry images)."},
+    'sharp_threshold': {'default': 300.0, 'description': 'Focus measure above which an image counts as sharp.'},
+    'blurry_threshold': {'default': 50.0, 'description': 'Focus measure below which an image counts as blurry.'},
     'verbose': {'default': True, 'description': 'Display detailed information during processing.'}
 }
 
+SHARPNESS_POLICIES = ('off', 'skip', 'adaptive')
+# Unsharp percent factor per sharpness class with the 'adaptive' policy (sharp images get no high pass overlay)
+ADAPTIVE_STRENGTH = {'sharp': 0.5, 'normal': 1.0, 'blurry': 1.5}
+# Longer image side the focus measure is computed on, so it's cheap and comparable between image sizes
+FOCUS_MEASURE_SIZE = 512
+
+
+def measure_sharpness(image, max_size=FOCUS_MEASURE_SIZE):
+    """
+    Computes the variance of the Laplacian of a downsampled grayscale copy, a standard focus measure.
+
+    Parameters:
+        image (PIL.Image): RGB image.
+        max_size (int): Longer side of the copy the measure is computed on.
+
+    Returns:
+        float: Focus measure, higher values mean sharper images.
+    """
+    import cv2
+    import numpy as np
+    gray = cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2GRAY)
+    scale = max_size / max(gray.shape)
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def classify_sharpness(focus_measure, sharp_threshold, blurry_threshold):
+    """Returns 'sharp', 'normal' or 'blurry' for a focus measure."""
+    if focus_measure >= sharp_threshold:
+        return 'sharp'
+    if focus_measure <= blurry_threshold:
+        return 'blurry'
+    return 'normal'
+
+
+def write_sharpness_report(report_path, rows):
+    """Writes the focus measure and the applied sharpening of every image to a CSV file."""
+    with open(report_path, 'w', newline='') as report_file:
+        writer = csv.writer(report_file)
+        writer.writerow(['filename', 'focus_measure', 'class', 'action'])
+        for row in sorted(rows):
+            writer.writerow(row)
+
+
 def apply_unsharp_mask(image, radius=1.5, percent=150):
+    import cv2
+    import numpy as np
     image_cv = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
     blurred = cv2.GaussianBlur(image_cv, (0, 0), radius)
     sharpened = cv2.addWeighted(image_cv, 1 + percent / 100, blurred, -percent / 100, 0)
@@ -23,6 +82,8 @@ def apply_unsharp_mask(image, radius=1.5, percent=150):
 
 def apply_high_pass_filter(image, radius=1):
     """Apply High Pass filter to an image."""
+    import cv2
+    import numpy as np
     image_cv = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
     blurred = cv2.GaussianBlur(image_cv, (0, 0), radius)
     high_pass = cv2.addWeighted(image_cv, 1.5, blurred, -0.5, 0)  # Adjust weights as needed
@@ -134,29 +195,111 @@ def process_specimen(
 
     # Process images in the selected folder
     valid_extensions = {".jpeg", ".jpg", ".png", ".bmp", ".tiff", ".gif"}
-    image_files = [filename for filename in os.listdir(input_folder) if
-                   filename.lower().endswith(tuple(valid_extensions))]
+    with instrumentation.span('list'):
+        image_files = [filename for filename in os.listdir(input_folder) if
+                       filename.lower().endswith(tuple(valid_extensions))]
 
     if verbose:
         print(f"Input Folder: {input_folder}")
         print(f"Output Folder: {output_folder}")
 
-    for filename in tqdm(image_files, desc=f"Sharpening {input_folder}", unit="image"):
-        image_path = os.path.join(input_folder, filename)
-        output_path = os.path.join(output_folder, filename)
-
-        image = Image.open(image_path).convert("RGB")
+    # With a content store (ORD_CAS), images sharpened before with the same settings are linked from it
+    store = cas.default_store()
 
-        # Apply unsharp mask
-        unsharp_image = apply_unsharp_mask(image,
-                                           radius=sharpening_kwargs.get('unsharp_radius', DEFAULT_SHARPENING_KWARGS['unsharp_radius']),
-                                           percent=sharpening_kwargs.get('unsharp_percent', DEFAULT_SHARPENING_KWARGS['unsharp_percent']))
+    def read(paths):
+        image_path, _ = paths
+        with instrumentation.span('decode'):
+            if store:
+                # The store remembers the digest of the bytes, to file the result under it
+                image = image_io.read_image(io.BytesIO(store.read_source(image_path)), "RGB")
+            else:
+                with io_scheduler.open_file(image_path) as image_file:
+                    image = image_io.read_image(image_file, "RGB")
+        instrumentation.count_bytes('bytes_read', image_path)
+        return image
+
+    unsharp_radius = sharpening_kwargs.get('unsharp_radius', DEFAULT_SHARPENING_KWARGS['unsharp_radius']['default'])
+    unsharp_percent = sharpening_kwargs.get('unsharp_percent', DEFAULT_SHARPENING_KWARGS['unsharp_percent']['default'])
+    highpass_radius = sharpening_kwargs.get('highpass_radius', DEFAULT_SHARPENING_KWARGS['highpass_radius']['default'])
+    policy = sharpening_kwargs.get('sharpness_policy', DEFAULT_SHARPENING_KWARGS['sharpness_policy']['default'])
+    sharp_threshold = sharpening_kwargs.get('sharp_threshold', DEFAULT_SHARPENING_KWARGS['sharp_threshold']['default'])
+    blurry_threshold = sharpening_kwargs.get('blurry_threshold', DEFAULT_SHARPENING_KWARGS['blurry_threshold']['default'])
+    if policy not in SHARPNESS_POLICIES:
+        raise ValueError(f"Invalid sharpness_policy '{policy}'. Choose from {', '.join(SHARPNESS_POLICIES)}.")
+    report_rows = []
+    cache_settings = {'unsharp_radius': unsharp_radius, 'unsharp_percent': unsharp_percent, 'highpass_radius': highpass_radius,
+                      'sharpness_policy': policy, 'sharp_threshold': sharp_threshold, 'blurry_threshold': blurry_threshold}
+
+    def sharpen(image):
+        if policy == 'off':
+            focus_measure, sharpness = None, None
+        else:
+            with instrumentation.span('measure'):
+                focus_measure = measure_sharpness(image)
+            sharpness = classify_sharpness(focus_measure, sharp_threshold, blurry_threshold)
+
+        if policy == 'skip' and sharpness == 'sharp':
+            # Already sharp, the original file is copied by the writer
+            return focus_measure, sharpness, 'copied', None
+
+        strength = ADAPTIVE_STRENGTH[sharpness] if policy == 'adaptive' else 1.0
+        with instrumentation.span('filter'):
+            # Apply unsharp mask
+            final_image = apply_unsharp_mask(image, radius=unsharp_radius, percent=unsharp_percent * strength)
+
+            # Apply high pass overlay
+            if not (policy == 'adaptive' and sharpness == 'sharp'):
+                final_image = apply_high_pass_filter(final_image, radius=highpass_radius)
+        # The OpenCV filters drop the EXIF data and ICC profile
+        image_io.copy_metadata(image, final_image)
+        return focus_measure, sharpness, f"sharpened x{strength:g}", final_image
+
+    def write(paths, result):
+        image_path, output_path = paths
+        focus_measure, sharpness, action, final_image = result
+        if store:
+            # The output may be linked to the store and other outputs, it must not be overwritten in place
+            cas.release(output_path)
+        if final_image is None:
+            with instrumentation.span('copy'):
+                io_scheduler.copy_file(image_path, output_path)
+        else:
+            with instrumentation.span('encode'):
+                image_io.save_image(final_image, output_path)
+        instrumentation.count_bytes('bytes_written', output_path)
+        if store:
+            # The report values are kept with the output, so a later cache hit still reports them
+            store.store_derived(cas.derived_key('sharpen', store.source_digest(image_path), cache_settings), output_path,
+                                {'focus_measure': focus_measure, 'class': sharpness, 'action': action})
+        if focus_measure is not None:
+            report_rows.append((os.path.basename(image_path), round(focus_measure, 2), sharpness, action))
+
+    items = [(os.path.join(input_folder, filename), os.path.join(output_folder, filename)) for filename in image_files]
+    if store:
+        uncached = []
+        for image_path, output_path in items:
+            digest = store.source_digest(image_path)
+            key = cas.derived_key('sharpen', digest, cache_settings) if digest else None
+            if key and store.materialize_derived(key, output_path):
+                info = store.derived_info(key)
+                if info and info['focus_measure'] is not None:
+                    report_rows.append((os.path.basename(image_path), round(info['focus_measure'], 2), info['class'], info['action']))
+            else:
+                uncached.append((image_path, output_path))
+        if verbose and len(uncached) < len(items):
+            print(f"{len(items) - len(uncached)} images linked from the content store")
+        items = uncached
 
-        # Apply high pass overlay
-        final_image = apply_high_pass_filter(unsharp_image,
-                                              radius=sharpening_kwargs.get('highpass_radius', DEFAULT_SHARPENING_KWARGS['highpass_radius']))
+    # The next images are read while the current one is sharpened and the previous one is saved
+    with tqdm(total=len(items), desc=f"Sharpening {input_folder}", unit="image") as progress:
+        run_pipeline(items, read, sharpen, write, on_done=lambda _: progress.update())
 
-        final_image.save(output_path)
+    if report_rows:
+        report_path = os.path.join(output_folder, 'sharpness_report.csv')
+        write_sharpness_report(report_path, report_rows)
+        if verbose:
+            skipped = sum(row[3] == 'copied' for row in report_rows)
+            print(f"Sharpness report: {report_path} ({skipped} of {len(report_rows)} images already sharp and copied)")
 
 
 def main():
@@ -193,14 +336,24 @@ def main():
 
     print(optional_kwargs)
 
+    # Records stage timings if ORD_TRACE/ORD_PROFILE/ORD_SUMMARY is set
+    instrumentation.start('sharpen')
+
     # Process each specimen folder with a tqdm progress bar
     for folder in tqdm(specimen_folders, desc="Processing specimen folders", unit="folder"):
         if optional_kwargs['verbose']:
             print(f"Starting folder: {folder}")
-        process_specimen(
-            specimen_folder=folder,
-            **optional_kwargs
-        )
+        with instrumentation.span('specimen', folder=folder):
+            process_specimen(
+                specimen_folder=folder,
+                **optional_kwargs
+            )
+
+    instrumentation.stop()
+    if io_scheduler.is_limited():
+        io_scheduler.print_report()
+    if cas.default_store():
+        cas.default_store().print_report()
 
     # Keep the command window open until the user decides to close it
     input("Processing complete! Press Enter to exit...")
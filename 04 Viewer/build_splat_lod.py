@@ -0,0 +1,144 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from convert_splats import (DEFAULT_ALPHA_REMOVAL_THRESHOLD, find_ply_files, prune, read_ply, select,
+                            splat_attributes, write_ksplat, write_splat)
+
+# Fraction of all splats in each level, coarse to fine. The last level gets the remaining splats.
+DEFAULT_LEVEL_FRACTIONS = (0.05, 0.25)
+DEFAULT_CHUNK_SIZE = 262144  # Maximum number of splats per chunk file
+MORTON_BITS = 21  # Bits per axis, 3 * 21 fit into a 64 bit key
+
+
+def _spread_bits(values):
+    """Inserts two zero bits between each of the lower 21 bits of a uint64 array."""
+    values = values.astype(np.uint64) & np.uint64(0x1FFFFF)
+    for shift, mask in ((32, 0x1F00000000FFFF), (16, 0x1F0000FF0000FF), (8, 0x100F00F00F00F00F),
+                        (4, 0x10C30C30C30C30C3), (2, 0x1249249249249249)):
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+def morton_keys(positions):
+    """
+    Computes 63 bit Morton (Z-order) keys, so sorting by key keeps spatially close splats together.
+
+    Parameters:
+        positions (np.ndarray): (N, 3) splat centers.
+
+    Returns:
+        np.ndarray: (N,) uint64 keys.
+    """
+    minimum = positions.min(axis=0)
+    extent = float((positions.max(axis=0) - minimum).max()) or 1.0
+    cells = np.clip((positions - minimum) / extent * (2 ** MORTON_BITS - 1), 0, 2 ** MORTON_BITS - 1).astype(np.uint64)
+    return (_spread_bits(cells[:, 0]) << np.uint64(2)) | (_spread_bits(cells[:, 1]) << np.uint64(1)) | _spread_bits(cells[:, 2])
+
+
+def importance(attributes):
+    """Visual weight of each splat: opacity times the geometric mean of its scales."""
+    return attributes['colors'][:, 3].astype(np.float32) * np.cbrt(np.prod(attributes['scales'], axis=1))
+
+
+def assign_levels(attributes, level_fractions=DEFAULT_LEVEL_FRACTIONS):
+    """
+    Assigns every splat to a level of detail: the most important splats (large and opaque) to
+    the coarse levels, small and transparent ones only to the finest level. Levels are
+    additive, loading all of them gives the complete model.
+
+    Returns:
+        np.ndarray: (N,) level index per splat.
+    """
+    order = np.argsort(-importance(attributes), kind='stable')
+    bounds = np.round(np.cumsum(level_fractions) * len(order)).astype(np.int64)
+    levels = np.empty(len(order), dtype=np.int64)
+    levels[order] = np.searchsorted(bounds, np.arange(len(order)), side='right')
+    return levels
+
+
+def build_lod(ply_path, output_dir, level_fractions=DEFAULT_LEVEL_FRACTIONS, chunk_size=DEFAULT_CHUNK_SIZE,
+              alpha_threshold=DEFAULT_ALPHA_REMOVAL_THRESHOLD, chunk_format='ksplat'):
+    """
+    Splits a splat PLY into Morton-ordered chunks per level of detail and writes a manifest.json.
+
+    The manifest lists the levels coarse to fine, each with its chunk files, splat counts,
+    sizes and bounding boxes, in the order the viewer should load them.
+
+    Returns:
+        dict: The manifest.
+    """
+    attributes = prune(splat_attributes(read_ply(ply_path)), alpha_threshold)
+    if not len(attributes['positions']):
+        raise ValueError(f"'{ply_path}' has no splats above the alpha threshold.")
+    attributes = select(attributes, np.argsort(morton_keys(attributes['positions']), kind='stable'))
+    levels = assign_levels(attributes, level_fractions)
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {
+        'version': 1,
+        'source': os.path.basename(ply_path),
+        'format': chunk_format,
+        'splat_count': int(len(levels)),
+        'bounds': {'min': attributes['positions'].min(axis=0).tolist(), 'max': attributes['positions'].max(axis=0).tolist()},
+        'levels': [],
+    }
+    for level in range(len(level_fractions) + 1):
+        # Selecting with a mask keeps the Morton order, so consecutive splats form compact chunks
+        level_attributes = select(attributes, levels == level)
+        count = len(level_attributes['positions'])
+        chunks = []
+        for index, start in enumerate(range(0, count, chunk_size)):
+            chunk = select(level_attributes, slice(start, start + chunk_size))
+            file_name = f"level{level}_chunk{index:04d}.{chunk_format}"
+            chunk_path = os.path.join(output_dir, file_name)
+            if chunk_format == 'splat':
+                write_splat(chunk_path, chunk)
+            else:
+                write_ksplat(chunk_path, chunk)
+            chunks.append({
+                'file': file_name,
+                'splat_count': int(len(chunk['positions'])),
+                'bytes': os.path.getsize(chunk_path),
+                'bounds': {'min': chunk['positions'].min(axis=0).tolist(), 'max': chunk['positions'].max(axis=0).tolist()},
+            })
+        manifest['levels'].append({'level': level, 'splat_count': int(count), 'chunks': chunks})
+
+    with open(os.path.join(output_dir, 'manifest.json'), 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build progressively loadable level-of-detail chunks from splat PLY files.")
+    parser.add_argument('paths', nargs='+', help="PLY files or folders containing PLY files (searched recursively).")
+    parser.add_argument('-o', '--output-dir', help="Parent folder of the <name>_lod folders (default: next to the input).")
+    parser.add_argument('-l', '--levels', type=float, nargs='*', default=list(DEFAULT_LEVEL_FRACTIONS),
+                        help="Fraction of the splats in each coarse level, the finest level gets the rest.")
+    parser.add_argument('-c', '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Maximum number of splats per chunk.")
+    parser.add_argument('-a', '--alpha-threshold', type=int, default=DEFAULT_ALPHA_REMOVAL_THRESHOLD,
+                        help="Remove splats with an alpha (0-255) below this value.")
+    parser.add_argument('-f', '--format', choices=['ksplat', 'splat'], default='ksplat', help="Format of the chunk files.")
+    args = parser.parse_args()
+
+    if sum(args.levels) >= 1:
+        parser.error("The level fractions must add up to less than 1.")
+
+    for ply_path in find_ply_files(args.paths):
+        name = os.path.splitext(os.path.basename(ply_path))[0]
+        output_dir = os.path.join(args.output_dir or os.path.dirname(ply_path), name + '_lod')
+        try:
+            manifest = build_lod(ply_path, output_dir, args.levels, args.chunk_size, args.alpha_threshold, args.format)
+        except Exception as error:
+            print(f"Failed {ply_path}: {error}")
+            continue
+        first_level_bytes = sum(chunk['bytes'] for chunk in manifest['levels'][0]['chunks'])
+        total_bytes = sum(chunk['bytes'] for level in manifest['levels'] for chunk in level['chunks'])
+        print(f"{output_dir}: {len(manifest['levels'])} levels, first level {first_level_bytes / 1e6:.1f} MB "
+              f"of {total_bytes / 1e6:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+import argparse
+import glob
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+# Defaults of the GaussianSplats3D viewer (gaussian-splats-3d.module.js)
+DEFAULT_ALPHA_REMOVAL_THRESHOLD = 5  # Same as splatAlphaRemovalThreshold in GS-viewer-web/index.html
+DEFAULT_COMPRESSION_LEVEL = 1
+DEFAULT_BLOCK_SIZE = 5.0
+DEFAULT_BUCKET_SIZE = 256
+
+SH_C0 = 0.28209479177387814
+
+KSPLAT_HEADER_SIZE = 4096
+KSPLAT_SECTION_HEADER_SIZE = 1024
+KSPLAT_BUCKET_STORAGE_SIZE = 12
+KSPLAT_SCALE_RANGE = {0: 1, 1: 32767}
+KSPLAT_BYTES_PER_SPLAT = {0: 44, 1: 24}
+SH_COMPRESSION_HALF_RANGE = 1.5
+
+PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8',
+}
+
+
+def read_ply(ply_path):
+    """
+    Memory-maps the vertex element of a binary Gaussian splat PLY file.
+
+    Parameters:
+        ply_path (str): Path to the .ply file.
+
+    Returns:
+        np.memmap: Structured array with one field per vertex property (x, y, z, f_dc_0, opacity, ...).
+    """
+    with open(ply_path, 'rb') as ply_file:
+        if ply_file.readline().strip() != b'ply':
+            raise ValueError(f"'{ply_path}' is not a PLY file.")
+        fields, vertex_count, element, byte_order = [], None, None, None
+        while True:
+            line = ply_file.readline()
+            if not line:
+                raise ValueError(f"'{ply_path}' has no end_header.")
+            words = line.decode('ascii', errors='replace').split()
+            if not words:
+                continue
+            if words[0] == 'format':
+                if words[1] == 'binary_little_endian':
+                    byte_order = '<'
+                elif words[1] == 'binary_big_endian':
+                    byte_order = '>'
+                else:
+                    raise ValueError(f"'{ply_path}': only binary PLY files are supported.")
+            elif words[0] == 'element':
+                element = words[1]
+                if element == 'vertex':
+                    vertex_count = int(words[2])
+                elif vertex_count is None:
+                    raise ValueError(f"'{ply_path}': elements before the vertex element are not supported.")
+            elif words[0] == 'property' and element == 'vertex':
+                if words[1] == 'list':
+                    raise ValueError(f"'{ply_path}': list properties are not supported for vertices.")
+                fields.append((words[2], byte_order + PLY_TYPES[words[1]]))
+            elif words[0] == 'end_header':
+                offset = ply_file.tell()
+                break
+    if vertex_count is None:
+        raise ValueError(f"'{ply_path}' has no vertex element.")
+    return np.memmap(ply_path, dtype=np.dtype(fields), mode='r', offset=offset, shape=(vertex_count,))
+
+
+def splat_attributes(vertices):
+    """
+    Converts raw PLY vertex properties into the values the viewer renders.
+
+    Scales are exponentiated, rotations normalized (w, x, y, z), colours and
+    opacity converted to 8 bit like the viewer's PLY parser does.
+
+    Returns:
+        dict: 'positions' (N, 3) float32, 'scales' (N, 3) float32, 'rotations' (N, 4) float32, 'colors' (N, 4) uint8.
+    """
+    names = vertices.dtype.names
+    count = len(vertices)
+    positions = np.stack([vertices['x'], vertices['y'], vertices['z']], axis=1).astype(np.float32)
+
+    if 'scale_0' in names:
+        scales = np.exp(np.stack([vertices['scale_0'], vertices['scale_1'], vertices['scale_2']], axis=1).astype(np.float32))
+    else:
+        scales = np.full((count, 3), 0.01, dtype=np.float32)
+
+    if 'rot_0' in names:
+        rotations = np.stack([vertices['rot_0'], vertices['rot_1'], vertices['rot_2'], vertices['rot_3']], axis=1).astype(np.float32)
+        lengths = np.linalg.norm(rotations, axis=1, keepdims=True)
+        rotations = np.where(lengths > 0, rotations / np.where(lengths > 0, lengths, 1), np.array([1, 0, 0, 0], dtype=np.float32))
+    else:
+        rotations = np.tile(np.array([1, 0, 0, 0], dtype=np.float32), (count, 1))
+
+    colors = np.zeros((count, 4), dtype=np.float32)
+    if 'f_dc_0' in names:
+        colors[:, :3] = (0.5 + SH_C0 * np.stack([vertices['f_dc_0'], vertices['f_dc_1'], vertices['f_dc_2']], axis=1)) * 255
+    elif 'red' in names:
+        colors[:, :3] = np.stack([vertices['red'], vertices['green'], vertices['blue']], axis=1)
+    colors[:, 3] = 255 / (1 + np.exp(-vertices['opacity'].astype(np.float32))) if 'opacity' in names else 255
+    colors = np.clip(np.floor(colors), 0, 255).astype(np.uint8)
+
+    return {'positions': positions, 'scales': scales, 'rotations': rotations, 'colors': colors}
+
+
+def select(attributes, mask_or_indices):
+    """Returns the attributes of a subset of splats."""
+    return {key: values[mask_or_indices] for key, values in attributes.items()}
+
+
+def prune(attributes, alpha_threshold=DEFAULT_ALPHA_REMOVAL_THRESHOLD):
+    """Removes splats with an 8 bit alpha below the threshold, like the viewer's splatAlphaRemovalThreshold."""
+    return select(attributes, attributes['colors'][:, 3] >= alpha_threshold)
+
+
+def write_splat(splat_path, attributes):
+    """
+    Writes the 32 bytes per splat `.splat` format (position, scale, RGBA, quantized rotation).
+
+    Splats are sorted by size times opacity, so the most visible ones come first.
+    """
+    order = np.argsort(-np.prod(attributes['scales'], axis=1) * attributes['colors'][:, 3], kind='stable')
+    attributes = select(attributes, order)
+    rows = np.zeros(len(order), dtype=[('position', '<f4', 3), ('scale', '<f4', 3), ('color', 'u1', 4), ('rotation', 'u1', 4)])
+    rows['position'] = attributes['positions']
+    rows['scale'] = attributes['scales']
+    rows['color'] = attributes['colors']
+    rows['rotation'] = np.clip(attributes['rotations'] * 128 + 128, 0, 255).astype(np.uint8)
+    rows.tofile(splat_path)
+
+
+def _ksplat_buckets(positions, block_size, bucket_size):
+    """
+    Groups splats into spatial buckets the way SplatBuffer.computeBucketsForUncompressedSplatArray does.
+
+    Returns:
+        tuple: (splat order, bucket centers, number of full buckets, lengths of the partially filled buckets)
+    """
+    minimum = positions.min(axis=0)
+    blocks = np.floor((positions - minimum) / block_size).astype(np.int64)
+    block_counts = np.ceil((positions.max(axis=0) - minimum) / block_size).astype(np.int64) + 1
+    block_ids = (blocks[:, 0] * block_counts[1] + blocks[:, 1]) * block_counts[2] + blocks[:, 2]
+
+    order = np.argsort(block_ids, kind='stable')
+    unique_blocks, starts, counts = np.unique(block_ids[order], return_index=True, return_counts=True)
+    block_of_sorted = np.repeat(np.arange(len(unique_blocks)), counts)
+    rank = np.arange(len(order)) - starts[block_of_sorted]
+    full_per_block = counts // bucket_size
+    in_full_bucket = rank < (full_per_block * bucket_size)[block_of_sorted]
+
+    block_centers = (blocks[order[starts]] * block_size + minimum + block_size / 2).astype(np.float32)
+    partial_blocks = counts % bucket_size > 0
+    centers = np.concatenate([np.repeat(block_centers, full_per_block, axis=0), block_centers[partial_blocks]])
+    partial_lengths = (counts % bucket_size)[partial_blocks]
+    return (np.concatenate([order[in_full_bucket], order[~in_full_bucket]]), centers,
+            int(full_per_block.sum()), partial_lengths.astype(np.uint32))
+
+
+def _ksplat_section(attributes, compression_level, block_size, bucket_size):
+    """Encodes one section of a .ksplat file and returns (section header, section data)."""
+    count = len(attributes['positions'])
+    if compression_level == 0:
+        rows = np.zeros(count, dtype=[('center', '<f4', 3), ('scale', '<f4', 3), ('rotation', '<f4', 4), ('color', 'u1', 4)])
+        rows['center'] = attributes['positions']
+        bucket_data, bucket_count, full_buckets, partial_lengths = b'', 0, 0, np.zeros(0)
+    else:
+        order, centers, full_buckets, partial_lengths = _ksplat_buckets(attributes['positions'], block_size, bucket_size)
+        attributes = select(attributes, order)
+        bucket_count = len(centers)
+        bucket_of_splat = np.concatenate([np.repeat(np.arange(full_buckets), bucket_size),
+                                          np.repeat(np.arange(full_buckets, bucket_count), partial_lengths)])
+        scale_range = KSPLAT_SCALE_RANGE[compression_level]
+        delta = attributes['positions'] - centers[bucket_of_splat]
+        quantized = np.clip(np.round(delta * (scale_range / (block_size / 2))) + scale_range, 0, 2 * scale_range + 1)
+        rows = np.zeros(count, dtype=[('center', '<u2', 3), ('scale', '<f2', 3), ('rotation', '<f2', 4), ('color', 'u1', 4)])
+        rows['center'] = quantized.astype(np.uint16)
+        bucket_data = partial_lengths.astype('<u4').tobytes() + centers.astype('<f4').tobytes()
+    rows['scale'] = attributes['scales']
+    rows['rotation'] = attributes['rotations']
+    rows['color'] = attributes['colors']
+    data = bucket_data + rows.tobytes()
+
+    header = bytearray(KSPLAT_SECTION_HEADER_SIZE)
+    struct.pack_into('<IIII', header, 0, count, count, bucket_size if compression_level else 0, bucket_count)
+    struct.pack_into('<f', header, 16, block_size if compression_level else 0.0)
+    struct.pack_into('<H', header, 20, KSPLAT_BUCKET_STORAGE_SIZE if compression_level else 0)
+    struct.pack_into('<IIII', header, 24, KSPLAT_SCALE_RANGE[compression_level] if compression_level else 0,
+                     len(data), full_buckets, len(partial_lengths))
+    struct.pack_into('<H', header, 40, 0)  # spherical harmonics degree
+    return bytes(header), data
+
+
+def write_ksplat(ksplat_path, attributes, compression_level=DEFAULT_COMPRESSION_LEVEL,
+                 block_size=DEFAULT_BLOCK_SIZE, bucket_size=DEFAULT_BUCKET_SIZE, section_size=0):
+    """
+    Writes a GaussianSplats3D `.ksplat` file (format version 0.1, no spherical harmonics).
+
+    Splats are ordered by distance from the scene center, like the viewer's own converter, so
+    splitting into sections (`section_size` > 0) lets the viewer show the center first.
+
+    Parameters:
+        ksplat_path (str): Output path.
+        attributes (dict): Splat attributes as returned by splat_attributes.
+        compression_level (int): 0 (32 bit floats, 44 bytes/splat) or 1 (16 bit, 24 bytes/splat).
+        block_size (float): Edge length of the spatial blocks positions are quantized in (level 1).
+        bucket_size (int): Maximum number of splats per bucket (level 1).
+        section_size (int): Maximum number of splats per section, 0 writes a single section.
+    """
+    if compression_level not in KSPLAT_BYTES_PER_SPLAT:
+        raise ValueError("Invalid compression_level specified. Choose 0 or 1.")
+    count = len(attributes['positions'])
+    if count == 0:
+        raise ValueError("No splats left to write.")
+
+    distance = np.sum((np.floor(attributes['positions'] / 0.5) * 0.5) ** 2, axis=1)
+    attributes = select(attributes, np.argsort(distance, kind='stable'))
+    section_size = section_size or count
+
+    sections = [_ksplat_section(select(attributes, slice(start, start + section_size)), compression_level, block_size, bucket_size)
+                for start in range(0, count, section_size)]
+
+    header = bytearray(KSPLAT_HEADER_SIZE)
+    struct.pack_into('<BB', header, 0, 0, 1)  # version 0.1
+    struct.pack_into('<IIII', header, 4, len(sections), len(sections), count, count)
+    struct.pack_into('<H', header, 20, compression_level)
+    struct.pack_into('<fffff', header, 24, 0.0, 0.0, 0.0, -SH_COMPRESSION_HALF_RANGE, SH_COMPRESSION_HALF_RANGE)
+
+    with open(ksplat_path, 'wb') as ksplat_file:
+        ksplat_file.write(header)
+        for section_header, _ in sections:
+            ksplat_file.write(section_header)
+        for _, section_data in sections:
+            ksplat_file.write(section_data)
+
+
+def convert(ply_path, output_path, alpha_threshold=DEFAULT_ALPHA_REMOVAL_THRESHOLD, **ksplat_kwargs):
+    """
+    Converts a splat PLY to `.ksplat` or `.splat` (chosen by the extension of output_path).
+
+    Returns:
+        tuple: (number of splats written, input size in bytes, output size in bytes)
+    """
+    attributes = prune(splat_attributes(read_ply(ply_path)), alpha_threshold)
+    if output_path.lower().endswith('.splat'):
+        write_splat(output_path, attributes)
+    else:
+        write_ksplat(output_path, attributes, **ksplat_kwargs)
+    return len(attributes['positions']), os.path.getsize(ply_path), os.path.getsize(output_path)
+
+
+def find_ply_files(paths):
+    """Resolves files and folders (searched recursively) to a sorted list of .ply files."""
+    ply_files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            ply_files.update(glob.glob(os.path.join(path, '**', '*.ply'), recursive=True))
+        elif path.lower().endswith('.ply'):
+            ply_files.add(path)
+    return sorted(ply_files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert Gaussian splat PLY files to compact .ksplat/.splat files for the GS viewers.")
+    parser.add_argument('paths', nargs='+', help="PLY files or folders containing PLY files (searched recursively).")
+    parser.add_argument('-f', '--format', choices=['ksplat', 'splat'], default='ksplat', help="Output format.")
+    parser.add_argument('-o', '--output-dir', help="Write all outputs here instead of next to the inputs.")
+    parser.add_argument('-a', '--alpha-threshold', type=int, default=DEFAULT_ALPHA_REMOVAL_THRESHOLD,
+                        help="Remove splats with an alpha (0-255) below this value.")
+    parser.add_argument('-c', '--compression-level', type=int, choices=[0, 1], default=DEFAULT_COMPRESSION_LEVEL,
+                        help="ksplat compression: 0 = 32 bit floats, 1 = 16 bit quantized.")
+    parser.add_argument('--block-size', type=float, default=DEFAULT_BLOCK_SIZE, help="ksplat quantization block size.")
+    parser.add_argument('--bucket-size', type=int, default=DEFAULT_BUCKET_SIZE, help="ksplat splats per bucket.")
+    parser.add_argument('--section-size', type=int, default=0, help="ksplat splats per section (0 = one section).")
+    parser.add_argument('--force', action='store_true', help="Convert even if the output is newer than the input.")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help="Number of worker processes.")
+    args = parser.parse_args()
+
+    ksplat_kwargs = {}
+    if args.format == 'ksplat':
+        ksplat_kwargs = {'compression_level': args.compression_level, 'block_size': args.block_size,
+                         'bucket_size': args.bucket_size, 'section_size': args.section_size}
+
+    jobs = []
+    for ply_path in find_ply_files(args.paths):
+        output_dir = args.output_dir or os.path.dirname(ply_path)
+        output_path = os.path.join(output_dir, os.path.splitext(os.path.basename(ply_path))[0] + '.' + args.format)
+        if not args.force and os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(ply_path):
+            print(f"Skipping {ply_path} (up to date)")
+            continue
+        os.makedirs(output_dir, exist_ok=True)
+        jobs.append((ply_path, output_path))
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(convert, ply_path, output_path, args.alpha_threshold, **ksplat_kwargs): output_path
+                   for ply_path, output_path in jobs}
+        for future in as_completed(futures):
+            try:
+                count, size_before, size_after = future.result()
+                print(f"{futures[future]}: {count} splats, {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB")
+            except Exception as error:
+                print(f"Failed {futures[future]}: {error}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+import argparse
+import os
+import threading
+
+from flask import Flask, abort, jsonify, request, send_file, send_from_directory
+
+from convert_splats import convert
+
+# Folder containing the splat models (.ply/.splat/.ksplat, searched recursively)
+models_folder = 'models'
+# Converted .ksplat files are cached here (default: .ksplat_cache inside models_folder)
+cache_folder = None
+# Seconds browsers may cache model files before revalidating them
+cache_max_age = 3600
+
+SPLAT_EXTENSIONS = ('.ply', '.splat', '.ksplat')
+# Written by build_splat_lod.py next to the level-of-detail chunks
+LOD_MANIFEST = 'manifest.json'
+viewer_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'GS-viewer-for-quick-testing')
+
+app = Flask(__name__, static_folder=None)
+conversion_locks = {}
+conversion_locks_lock = threading.Lock()
+
+
+def list_models(folder):
+    """
+    Returns the relative paths (with forward slashes) of all splat files below folder.
+    A folder of level-of-detail chunks is listed once, by its manifest.json.
+    """
+    models = []
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        if LOD_MANIFEST in files:
+            models.append(os.path.relpath(os.path.join(root, LOD_MANIFEST), folder).replace(os.sep, '/'))
+            continue
+        for file in files:
+            if file.lower().endswith(SPLAT_EXTENSIONS):
+                models.append(os.path.relpath(os.path.join(root, file), folder).replace(os.sep, '/'))
+    return sorted(models)
+
+
+def resolve_model(relative_path):
+    """Returns the absolute path of a model, refusing paths outside models_folder."""
+    root = os.path.realpath(models_folder)
+    path = os.path.realpath(os.path.join(root, relative_path))
+    is_model = path.lower().endswith(SPLAT_EXTENSIONS) or os.path.basename(path) == LOD_MANIFEST
+    if not path.startswith(root + os.sep) or not is_model or not os.path.isfile(path):
+        abort(404)
+    return path
+
+
+def compact_path(ply_path):
+    """Converts a PLY to .ksplat on first use and returns the path of the cached file."""
+    cache = cache_folder or os.path.join(models_folder, '.ksplat_cache')
+    relative = os.path.relpath(ply_path, os.path.realpath(models_folder))
+    target = os.path.join(cache, os.path.splitext(relative)[0] + '.ksplat')
+    with conversion_locks_lock:
+        lock = conversion_locks.setdefault(target, threading.Lock())
+    # Only one request converts a model, parallel requests for the same model wait for it
+    with lock:
+        if not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(ply_path):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            temporary = target + '.part.ksplat'
+            convert(ply_path, temporary)
+            os.replace(temporary, target)
+    return target
+
+
+@app.route("/")
+def index():
+    return send_from_directory(viewer_folder, 'index.html')
+
+
+@app.route("/<path:filename>")
+def viewer_files(filename):
+    return send_from_directory(viewer_folder, filename)
+
+
+@app.route("/api/models")
+def models():
+    compact = request.args.get('compact', '1') != '0'
+    result = []
+    for relative in list_models(models_folder):
+        path = os.path.join(models_folder, relative)
+        is_ply = relative.lower().endswith('.ply')
+        if relative.endswith(LOD_MANIFEST):
+            model_format = 'manifest'
+        else:
+            model_format = 'ksplat' if compact and is_ply else os.path.splitext(relative)[1][1:].lower()
+        result.append({
+            'name': relative,
+            'url': ('/compact/' if compact and is_ply else '/models/') + relative,
+            'format': model_format,
+            'bytes': os.path.getsize(path),
+            'mtime': os.path.getmtime(path),
+        })
+    return jsonify(result)
+
+
+@app.route("/models/<path:relative_path>")
+def model_file(relative_path):
+    # conditional=True answers Range and If-None-Match/If-Modified-Since requests
+    return send_file(resolve_model(relative_path), conditional=True, max_age=cache_max_age)
+
+
+@app.route("/compact/<path:relative_path>")
+def compact_model_file(relative_path):
+    path = resolve_model(relative_path)
+    if path.lower().endswith('.ply'):
+        path = compact_path(path)
+    return send_file(path, conditional=True, max_age=cache_max_age, mimetype='application/octet-stream')
+
+
+def main():
+    global models_folder, cache_folder
+    parser = argparse.ArgumentParser(description="Serve a folder of splat models to the GS quick-testing viewer.")
+    parser.add_argument('models_folder', nargs='?', default=models_folder, help="Folder containing .ply/.splat/.ksplat files.")
+    parser.add_argument('--cache', default=cache_folder, help="Folder for converted .ksplat files.")
+    parser.add_argument('--host', default='127.0.0.1', help="Host to listen on.")
+    parser.add_argument('--port', type=int, default=8000, help="Port to listen on.")
+    args = parser.parse_args()
+
+    models_folder = args.models_folder
+    cache_folder = args.cache
+    print(f"Serving {len(list_models(models_folder))} models from {os.path.abspath(models_folder)}")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
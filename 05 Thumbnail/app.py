@@ -1,13 +1,37 @@
 import glob
 from flask import Flask, render_template, url_for
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '00 Common'))
+from catalog import open_catalog
+from mesh_stats import open_mesh_index
 
 static_folder = 'Z:/01_SCANNED_AND_PROCESSED/02 FINAL/'
+# With a mesh index, only show models whose mesh has issues
+only_suspicious = False
 
 app = Flask(__name__, static_folder=static_folder)
 project_path = static_folder
-projects = projects = glob.glob(project_path+"*\\")
-project_names = [project.split("\\")[-2] for project in projects]
+specimen_catalog = open_catalog() # Specimen catalog given in ORD_CATALOG, if any
+if specimen_catalog:
+    # Only projects with a GLB can be shown
+    project_names = [row['specimen_id'] for row in specimen_catalog.specimens(root=project_path, has_glb=True)]
+    projects = [os.path.join(project_path, name) for name in project_names]
+else:
+    projects = projects = glob.glob(project_path+"*\\")
+    project_names = [project.split("\\")[-2] for project in projects]
+mesh_index = open_mesh_index() # Mesh statistics given in ORD_MESH_INDEX, if any
+issues = {}
+if mesh_index:
+    # Show the models with the most suspicious meshes first
+    for row in mesh_index.meshes():
+        issues.setdefault(row['specimen_id'], (row['suspicion'], row['issues']))
+    order = sorted(range(len(project_names)), key=lambda i: -issues.get(project_names[i], (0, ''))[0])
+    if only_suspicious:
+        order = [i for i in order if issues.get(project_names[i], (0, ''))[0] > 0]
+    projects = [projects[i] for i in order]
+    project_names = [project_names[i] for i in order]
 curr = -1
 
 @app.route("/")
@@ -19,7 +43,8 @@ def getNext():
     global curr
     if curr < len(projects) - 1:
         curr += 1
-        return render_template('viewer.html', path=url_for('static', filename=project_names[curr] + '/' + 'Model/' + project_names[curr] +'.glb'), name=project_names[curr])
+        return render_template('viewer.html', path=url_for('static', filename=project_names[curr] + '/' + 'Model/' + project_names[curr] +'.glb'), name=project_names[curr],
+                               issues=issues.get(project_names[curr], (0, ''))[1])
     else:
         return "Finished!"
 
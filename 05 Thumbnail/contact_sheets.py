@@ -0,0 +1,240 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '00 Common'))
+import image_io
+import io_scheduler
+
+####
+# Settings
+####
+# Folder with the images written by extract_images.py (<project>_<view>.jpg)
+image_path = "C:\\InsectScanner\\NoahSchluessel\\Quality control glb\\Lucerne Last 24\\JPG\\"
+# Folder the contact sheets are written to
+output_path = 'contact_sheets'
+
+VIEW_SUFFIXES = ['side_image', 'bottom_image', 'top_image']
+# Size of one view in a sheet and height of the ID label below the views
+tile_size = 256
+label_height = 28
+font_style = 'arial.ttf'
+# Specimens per row and rows per sheet
+columns = 4
+rows = 8
+BACKGROUND = 255
+MISSING = 200
+MANIFEST = 'contact_sheets.json'
+
+
+def find_view_specimens(folder, suffixes=VIEW_SUFFIXES):
+    """Returns {project: [image per suffix or None]} of the images extract_images.py writes to folder."""
+    specimens = {}
+    for index, suffix in enumerate(suffixes):
+        for path in glob.glob(os.path.join(folder, f"*_{suffix}.jpg")):
+            project = os.path.basename(path)[:-len(f"_{suffix}.jpg")]
+            specimens.setdefault(project, [None] * len(suffixes))[index] = path
+    return specimens
+
+
+def find_edof_specimens(root, count=1):
+    """Returns {specimen: [first count edof images, None for missing ones]} of all specimen folders in root (redof if there is no edof)."""
+    specimens = {}
+    for entry in sorted(os.scandir(root), key=lambda entry: entry.name):
+        if not entry.is_dir():
+            continue
+        for folder in ('edof', 'redof'):
+            image_folder = os.path.join(entry.path, folder)
+            if os.path.isdir(image_folder):
+                files = sorted(file for file in os.listdir(image_folder) if file.lower().endswith(image_io.IMAGE_EXTENSIONS))
+                if files:
+                    paths = [os.path.join(image_folder, file) for file in files[:count]]
+                    # Specimens with fewer images get grey squares, so all tiles have the same width
+                    specimens[entry.name] = paths + [None] * (count - len(paths))
+                    break
+    return specimens
+
+
+def tile_key(label, paths, settings):
+    """Hash of the inputs of a specimen tile, it changes when an image is replaced or the layout changes."""
+    state = [label, settings]
+    for path in paths:
+        state.append([path, os.path.getmtime(path), os.path.getsize(path)] if path and os.path.exists(path) else None)
+    return hashlib.sha1(json.dumps(state).encode()).hexdigest()[:16]
+
+
+def tile_file(tiles_folder, label):
+    """Cached tile of a specimen, named by a hash of its ID so any ID is a valid file name."""
+    return os.path.join(tiles_folder, hashlib.sha1(label.encode()).hexdigest()[:16] + '.png')
+
+
+def build_tile(label, paths, tile_size=tile_size, label_height=label_height, font_style=font_style):
+    """
+    Renders the tile of one specimen: its images side by side, each decoded at reduced resolution and
+    fitted into tile_size x tile_size, with the ID below.
+
+    Returns:
+        numpy.ndarray: (tile_size + label_height, len(paths) * tile_size, 3) uint8 RGB array.
+    """
+    tile = np.full((tile_size + label_height, len(paths) * tile_size, 3), BACKGROUND, dtype=np.uint8)
+    for index, path in enumerate(paths):
+        x = index * tile_size
+        if path is None:
+            # Specimen with fewer images, shown as a grey square
+            tile[:tile_size, x:x + tile_size] = MISSING
+            continue
+        try:
+            with io_scheduler.open_file(path) as image_file:
+                view = np.asarray(image_io.read_preview(image_file, tile_size))
+        except OSError:
+            # Missing or unreadable image
+            tile[:tile_size, x:x + tile_size] = MISSING
+            continue
+        top, left = (tile_size - view.shape[0]) // 2, (tile_size - view.shape[1]) // 2
+        tile[top:top + view.shape[0], x + left:x + left + view.shape[1]] = view
+
+    label_image = Image.fromarray(tile[tile_size:])
+    try:
+        font = ImageFont.truetype(font_style, size=int(label_height * 0.7))
+    except IOError:
+        font = ImageFont.load_default()
+    ImageDraw.Draw(label_image).text((tile.shape[1] // 2, label_height // 2), label, fill='black', font=font, anchor='mm')
+    tile[tile_size:] = np.asarray(label_image)
+    return tile
+
+
+def _render_tile(label, paths, path, settings):
+    tile = build_tile(label, paths, settings['tile_size'], settings['label_height'], settings['font_style'])
+    image_io.save_image(Image.fromarray(tile), path)
+    return label
+
+
+def compose_page(tiles, columns, rows, tile_shape):
+    """Places the specimen tiles row by row into one preallocated canvas."""
+    height, width = tile_shape[:2]
+    canvas = np.full((rows * height, columns * width, 3), BACKGROUND, dtype=np.uint8)
+    for index, tile in enumerate(tiles):
+        row, column = divmod(index, columns)
+        canvas[row * height:(row + 1) * height, column * width:(column + 1) * width] = tile
+    # Cut off empty rows of the last page
+    used_rows = (len(tiles) + columns - 1) // columns
+    return canvas[:used_rows * height]
+
+
+def build_contact_sheets(specimens, output_folder, columns=columns, rows=rows, tile_size=tile_size,
+                         label_height=label_height, font_style=font_style, workers=None, quality=90):
+    """
+    Writes paginated contact sheets contact_sheet_001.jpg, ... of the specimens, sorted by ID.
+
+    The tile of every specimen is cached in <output_folder>/tiles together with a hash of its
+    images' modification times, and a page is only composed again if one of its tiles changed
+    (or specimens moved to another page), so adding specimens only renders the affected pages.
+
+    Parameters:
+        specimens (dict): {label: [image paths]}, every specimen with the same number of images.
+        output_folder (str): Folder of the sheets, the tile cache and the manifest.
+        workers (int): Number of processes decoding images (default: number of CPU cores).
+
+    A specimen whose tile can't be rendered is left out of the manifest and shown as a grey tile,
+    so the other specimens are still written and the next run tries it again.
+
+    Returns:
+        dict: Number of 'tiles' rendered, 'failed' tiles, 'pages' written and 'unchanged' pages.
+    """
+    tiles_folder = os.path.join(output_folder, 'tiles')
+    os.makedirs(tiles_folder, exist_ok=True)
+    manifest_path = os.path.join(output_folder, MANIFEST)
+    manifest = {'tiles': {}, 'pages': {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+
+    settings = {'tile_size': tile_size, 'label_height': label_height, 'font_style': font_style}
+    labels = sorted(specimens)
+    keys = {label: tile_key(label, specimens[label], settings) for label in labels}
+    tile_files = {label: tile_file(tiles_folder, label) for label in labels}
+    outdated = [label for label in labels
+                if manifest['tiles'].get(label) != keys[label] or not os.path.exists(tile_files[label])]
+
+    failed = set()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_render_tile, label, specimens[label], tile_files[label], settings): label for label in outdated}
+        for future in as_completed(futures):
+            label = futures[future]
+            try:
+                future.result()
+            except Exception as error:
+                print(f"Tile of '{label}' failed: {error!r}")
+                failed.add(label)
+                manifest['tiles'].pop(label, None)
+                continue
+            manifest['tiles'][label] = keys[label]
+
+    stats = {'tiles': len(outdated) - len(failed), 'failed': len(failed), 'pages': 0, 'unchanged': 0}
+    tile_shape = (tile_size + label_height, len(specimens[labels[0]]) * tile_size, 3)
+    per_page = columns * rows
+    pages = {}
+    for number, start in enumerate(range(0, len(labels), per_page), 1):
+        page_labels = labels[start:start + per_page]
+        page_file = f"contact_sheet_{number:03d}.jpg"
+        # A failed tile has no key, so its page is composed again once the tile exists
+        pages[page_file] = [keys[label] if label not in failed else None for label in page_labels] + [columns]
+        if manifest['pages'].get(page_file) == pages[page_file] and os.path.exists(os.path.join(output_folder, page_file)):
+            stats['unchanged'] += 1
+            continue
+        tiles = [np.asarray(Image.open(tile_files[label]).convert('RGB')) if label not in failed
+                 else np.full(tile_shape, MISSING, dtype=np.uint8) for label in page_labels]
+        page = compose_page(tiles, columns, rows, tile_shape)
+        image_io.save_image(Image.fromarray(page), os.path.join(output_folder, page_file), quality=quality)
+        stats['pages'] += 1
+
+    # Pages beyond the new last page and tiles of removed specimens
+    for page_file in set(manifest['pages']) - set(pages):
+        if os.path.exists(os.path.join(output_folder, page_file)):
+            os.remove(os.path.join(output_folder, page_file))
+    for label in set(manifest['tiles']) - set(labels):
+        if os.path.exists(tile_file(tiles_folder, label)):
+            os.remove(tile_file(tiles_folder, label))
+        del manifest['tiles'][label]
+    manifest['pages'] = pages
+    with open(manifest_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tile the views or edof images of many specimens into paginated contact sheets.")
+    parser.add_argument('source', choices=['views', 'edof'],
+                        help="'views': the images of extract_images.py in a folder, 'edof': edof images of specimen folders.")
+    parser.add_argument('path', nargs='?', default=image_path, help="Folder with the view images, or folder with the specimen folders.")
+    parser.add_argument('-o', '--output', default=output_path, help="Folder the sheets are written to.")
+    parser.add_argument('--suffixes', nargs='+', default=VIEW_SUFFIXES, help="View image suffixes, e.g. side_3d bottom_3d top_3d for render_thumbnails.py.")
+    parser.add_argument('--edof-count', type=int, default=1, help="Number of edof images per specimen.")
+    parser.add_argument('-c', '--columns', type=int, default=columns, help="Specimens per row.")
+    parser.add_argument('-r', '--rows', type=int, default=rows, help="Rows per sheet.")
+    parser.add_argument('-s', '--size', type=int, default=tile_size, help="Size of one image in pixels.")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help="Number of decoding processes.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.source == 'views':
+        specimens = find_view_specimens(args.path, args.suffixes)
+    else:
+        specimens = find_edof_specimens(args.path, args.edof_count)
+    if not specimens:
+        sys.exit(f"No images found in '{args.path}'.")
+    stats = build_contact_sheets(specimens, args.output, args.columns, args.rows, args.size, workers=args.workers)
+    print(f"{len(specimens)} specimens: {stats['tiles']} tiles rendered, {stats['failed']} failed, {stats['pages']} sheets written, "
+          f"{stats['unchanged']} unchanged in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,21 @@
 import glob
+import os
 import shutil
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '00 Common'))
+import image_io
+import instrumentation
+from catalog import open_catalog
 
 # Path to the images created by "create_preview"
 image_path = "C:\\InsectScanner\\NoahSchluessel\\Quality control glb\\Lucerne Last 24\\JPG\\"
 # Path to the folder containing the projects
 project_path = "Z:\\01_SCANNED_AND_PROCESSED\\02 FINAL\\"
+# Longer side of the extracted images in pixels, they are decoded at reduced resolution (None copies the full images)
+preview_size = None
+ref_values = [(0, 180), (-50, 30), (50, 120)] # The positions that should be extracted
+ref_strings = ['side_image', 'bottom_image', 'top_image'] # How the images should be named
 
 
 # Returns the index, elevation and rotation of the closest image
@@ -23,26 +34,47 @@ def get_closest(elevation, rotation, ref):
         return best_index, best_ele, best_rot
 
 # Extracts the closest image for every reference value
-def extract_images(image_path, ref_values):
-    images = glob.glob(image_path+"*.jpeg")
-    elevation = []
-    rotation = []
-    for image in images:
-        image = image.split("\\")[-1]
-        image = '.'.join(image.split(".")[:-1])
-        image = image.split("_")
-        elevation.append(float(image[-2]))
-        rotation.append(float(image[-1]))
+def extract_images(image_path, ref_values, specimen_catalog=None):
+    # Use the poses stored in the catalog instead of listing the folder, if the specimen is cataloged
+    poses = specimen_catalog.poses(os.path.dirname(os.path.normpath(image_path))) if specimen_catalog else None
+    if poses:
+        images = [os.path.join(image_path, file) for file, _, _ in poses]
+        elevation = [pose[1] for pose in poses]
+        rotation = [pose[2] for pose in poses]
+    else:
+        with instrumentation.span('list'):
+            images = glob.glob(image_path+"*.jpeg")
+        elevation = []
+        rotation = []
+        for image in images:
+            image = image.split("\\")[-1]
+            image = '.'.join(image.split(".")[:-1])
+            image = image.split("_")
+            elevation.append(float(image[-2]))
+            rotation.append(float(image[-1]))
     res = []
-    for ref in ref_values:
-        index, _, _ = get_closest(elevation, rotation, ref)
-        res.append(images[index])
+    with instrumentation.span('select'):
+        for ref in ref_values:
+            index, _, _ = get_closest(elevation, rotation, ref)
+            res.append(images[index])
     return res
 
+# Writes the closest image of every reference value to <output_prefix><ref_string>.jpg
+def extract_project(image_folder, output_prefix, specimen_catalog=None):
+    images = extract_images(image_folder, ref_values, specimen_catalog)
+    for ref_string, image in zip(ref_strings, images):
+        if preview_size:
+            with instrumentation.span('preview'):
+                image_io.save_image(image_io.read_preview(image, preview_size), output_prefix + ref_string + ".jpg", quality=90)
+        else:
+            with instrumentation.span('copy'):
+                shutil.copy(image, output_prefix + ref_string + ".jpg")
+            instrumentation.count_bytes('bytes_copied', image)
+
 if __name__ == '__main__':
-    ref_values = [(0, 180), (-50, 30), (50, 120)] # The positions that should be extracted
-    ref_strings = ['side_image', 'bottom_image', 'top_image'] # How the images should be named
     image_folder = "redof\\" # Folder to extract the images from
+    instrumentation.start('extract_images') # Records timings if ORD_TRACE/ORD_PROFILE/ORD_SUMMARY is set
+    specimen_catalog = open_catalog() # Specimen catalog given in ORD_CATALOG, if any
     images = glob.glob(image_path+"*.jpg") # Create a list of all images
     projects = set([image.removesuffix('.jpg').
                     removesuffix('_bottom_3d').
@@ -55,6 +87,6 @@ if __name__ == '__main__':
     
     for project in projects:
         print("Project ", project)
-        images = extract_images(project_path + project + "\\" + image_folder, ref_values)
-        for ref_string, image in zip(ref_strings, images):
-            shutil.copy(image, image_path + project + "_" + ref_string +".jpg")
+        with instrumentation.span('specimen', project=project):
+            extract_project(project_path + project + "\\" + image_folder, image_path + project + "_", specimen_catalog)
+    instrumentation.stop()
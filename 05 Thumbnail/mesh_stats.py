@@ -0,0 +1,261 @@
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '00 Common'))
+from catalog import open_catalog
+from obj_parser import read_obj
+
+# Path to the folder containing the projects (same layout as in app.py)
+project_path = 'Z:/01_SCANNED_AND_PROCESSED/02 FINAL/'
+# Index of the mesh statistics, used by app.py to show suspicious models first
+index_path = os.environ.get('ORD_MESH_INDEX', 'mesh_stats.sqlite')
+
+# A face is degenerate if its area is below this fraction of the squared bounding box diagonal
+DEGENERATE_AREA = 1e-12
+# Models with more degenerate faces than this ratio are flagged
+MAX_DEGENERATE_RATIO = 0.01
+MIN_FACES = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meshes (
+    obj_path TEXT PRIMARY KEY,
+    specimen_id TEXT NOT NULL,
+    obj_mtime REAL NOT NULL,
+    obj_bytes INTEGER NOT NULL,
+    vertex_count INTEGER,
+    uv_count INTEGER,
+    face_count INTEGER,
+    degenerate_faces INTEGER,
+    degenerate_ratio REAL,
+    invalid_indices INTEGER,
+    min_x REAL, min_y REAL, min_z REAL,
+    max_x REAL, max_y REAL, max_z REAL,
+    texture_path TEXT,
+    texture_width INTEGER,
+    texture_height INTEGER,
+    issues TEXT NOT NULL,
+    suspicion INTEGER NOT NULL,
+    parse_seconds REAL,
+    scanned_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS meshes_suspicion ON meshes(suspicion DESC);
+"""
+
+def _texture_size(obj_path, mtl_files):
+    """Returns (path, width, height) of the map_Kd texture of the OBJ's material library, or Nones."""
+    for mtl_file in mtl_files:
+        mtl_path = os.path.join(os.path.dirname(obj_path), mtl_file)
+        if not os.path.isfile(mtl_path):
+            continue
+        with open(mtl_path, 'r', errors='replace') as mtl:
+            for mtl_line in mtl:
+                if mtl_line.strip().startswith('map_Kd'):
+                    texture_path = os.path.join(os.path.dirname(obj_path), mtl_line.strip().split(maxsplit=1)[1])
+                    if not os.path.isfile(texture_path):
+                        return texture_path, None, None
+                    # Only the header is read, not the image data
+                    with Image.open(texture_path) as texture:
+                        return texture_path, texture.width, texture.height
+    return None, None, None
+
+
+def mesh_statistics(obj_path):
+    """
+    Computes the statistics of an OBJ file. The file is memory-mapped and the vertex and face blocks
+    are parsed with NumPy by obj_parser, without a Python loop per line (except for polygon faces).
+
+    Parameters:
+        obj_path (str): Path to the .obj file.
+
+    Returns:
+        dict: Counts, bounding box, degenerate faces, texture size, the found issues and a suspicion
+            score (higher means more likely broken), in the columns of the index.
+    """
+    start = time.perf_counter()
+    stats = {'obj_bytes': os.path.getsize(obj_path)}
+    issues = []
+    # Only the positions are needed, UVs and normals are only counted
+    obj = read_obj(obj_path, attributes=('v',))
+    vertices = obj['v']
+    vertex_count = len(vertices)
+    stats['vertex_count'] = vertex_count
+    stats['uv_count'] = obj['counts']['vt']
+    faces = obj['corners'][:, 0].reshape(-1, 3)
+    stats['texture_path'], stats['texture_width'], stats['texture_height'] = _texture_size(obj_path, obj['mtllib'])
+
+    stats['face_count'] = len(faces)
+    invalid = (faces < 0) | (faces >= vertex_count)
+    stats['invalid_indices'] = int(invalid.sum())
+    if vertex_count:
+        low, high = vertices.min(axis=0), vertices.max(axis=0)
+        stats.update(zip(('min_x', 'min_y', 'min_z'), low.tolist()))
+        stats.update(zip(('max_x', 'max_y', 'max_z'), high.tolist()))
+        diagonal = float(np.linalg.norm(high - low))
+    else:
+        diagonal = 0.0
+
+    valid_faces = faces[~invalid.any(axis=1)]
+    if len(valid_faces):
+        corners = vertices[valid_faces]
+        areas = 0.5 * np.linalg.norm(np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1)
+        degenerate = int((areas <= DEGENERATE_AREA * diagonal ** 2).sum())
+    else:
+        degenerate = 0
+    stats['degenerate_faces'] = degenerate
+    stats['degenerate_ratio'] = degenerate / len(faces) if len(faces) else 0.0
+
+    suspicion = 0
+    if vertex_count == 0 or len(faces) == 0:
+        issues.append('empty mesh')
+        suspicion += 100
+    elif len(faces) < MIN_FACES:
+        issues.append(f'only {len(faces)} faces')
+        suspicion += 50
+    if stats['invalid_indices']:
+        issues.append(f"{stats['invalid_indices']} invalid indices")
+        suspicion += 80
+    if vertex_count and diagonal == 0:
+        issues.append('zero size')
+        suspicion += 80
+    if stats['degenerate_ratio'] > MAX_DEGENERATE_RATIO:
+        issues.append(f"{stats['degenerate_ratio']:.1%} degenerate faces")
+        suspicion += int(min(50, stats['degenerate_ratio'] * 100))
+    if stats['texture_path'] is None:
+        issues.append('no texture')
+        suspicion += 20
+    elif stats['texture_width'] is None:
+        issues.append('texture missing')
+        suspicion += 40
+    stats['issues'] = ', '.join(issues)
+    stats['suspicion'] = suspicion
+    stats['parse_seconds'] = time.perf_counter() - start
+    return stats
+
+
+class MeshIndex:
+    """
+    SQLite index of the mesh statistics, updated incrementally by modification time and size of the OBJ.
+
+    Parameters:
+        path (str): Path of the database file, created if it doesn't exist.
+    """
+
+    def __init__(self, path=index_path):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def outdated(self, obj_paths):
+        """Returns the OBJ files that are new or changed since they were indexed."""
+        known = {row['obj_path']: (row['obj_mtime'], row['obj_bytes'])
+                 for row in self.connection.execute('SELECT obj_path, obj_mtime, obj_bytes FROM meshes')}
+        return [path for path in obj_paths if known.get(path) != (os.path.getmtime(path), os.path.getsize(path))]
+
+    def store(self, obj_path, stats, obj_mtime):
+        row = dict(stats, obj_path=obj_path, obj_mtime=obj_mtime,
+                   specimen_id=os.path.splitext(os.path.basename(obj_path))[0], scanned_at=time.time())
+        self.connection.execute(f"INSERT OR REPLACE INTO meshes ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                                list(row.values()))
+
+    def remove_missing(self, obj_paths, root):
+        """Removes the entries below root whose OBJ is not in obj_paths anymore."""
+        existing = set(obj_paths)
+        root = os.path.normcase(os.path.abspath(root))
+        missing = [row['obj_path'] for row in self.connection.execute('SELECT obj_path FROM meshes')
+                   if os.path.normcase(os.path.abspath(row['obj_path'])).startswith(root) and row['obj_path'] not in existing]
+        self.connection.executemany('DELETE FROM meshes WHERE obj_path = ?', [(path,) for path in missing])
+        return len(missing)
+
+    def suspicion(self, specimen_id):
+        """Returns the row of a specimen's mesh, or None if it isn't indexed."""
+        return self.connection.execute('SELECT * FROM meshes WHERE specimen_id = ? ORDER BY suspicion DESC',
+                                       (specimen_id,)).fetchone()
+
+    def meshes(self, min_suspicion=0):
+        """Returns the indexed meshes, the most suspicious first."""
+        return self.connection.execute('SELECT * FROM meshes WHERE suspicion >= ? ORDER BY suspicion DESC, specimen_id',
+                                       (min_suspicion,)).fetchall()
+
+
+def find_obj_files(root, specimen_catalog=None):
+    """Returns the Model/<id>.obj files of all projects in root (from the catalog if one is given)."""
+    if specimen_catalog:
+        rows = specimen_catalog.specimens(root=root)
+        return [os.path.join(row['path'], 'Model', row['specimen_id'] + '.obj') for row in rows if row['obj_bytes'] is not None]
+    obj_files = []
+    for entry in sorted(os.scandir(root), key=lambda entry: entry.name):
+        obj_path = os.path.join(entry.path, 'Model', entry.name + '.obj')
+        if entry.is_dir() and os.path.isfile(obj_path):
+            obj_files.append(obj_path)
+    return obj_files
+
+
+def _index_entry(obj_path):
+    mtime = os.path.getmtime(obj_path)
+    return obj_path, mesh_statistics(obj_path), mtime
+
+
+def open_mesh_index(path=None):
+    """Opens the index at path or ORD_MESH_INDEX, None if it doesn't exist."""
+    path = path or os.environ.get('ORD_MESH_INDEX')
+    if not path or not os.path.exists(path):
+        return None
+    return MeshIndex(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index vertex/face counts, bounding boxes, degenerate faces and texture sizes of the project OBJ files.")
+    parser.add_argument('project_path', nargs='?', default=project_path, help="Folder containing the project folders.")
+    parser.add_argument('--db', default=index_path, help="Index database file (default: ORD_MESH_INDEX or mesh_stats.sqlite).")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help="Number of worker processes.")
+    parser.add_argument('--list', action='store_true', help="Only list the indexed models, the most suspicious first.")
+    parser.add_argument('--min-suspicion', type=int, default=1, help="With --list, only models with at least this suspicion.")
+    args = parser.parse_args()
+
+    with MeshIndex(args.db) as index:
+        if args.list:
+            for row in index.meshes(args.min_suspicion):
+                print(f"{row['suspicion']:>4}\t{row['specimen_id']}\t{row['vertex_count']}\t{row['face_count']}\t{row['issues']}")
+            return
+
+        start = time.perf_counter()
+        obj_files = find_obj_files(args.project_path, open_catalog())
+        outdated = index.outdated(obj_files)
+        removed = index.remove_missing(obj_files, args.project_path)
+        print(f"{len(obj_files)} models, {len(outdated)} new or changed, {removed} removed")
+        failed = 0
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = {executor.submit(_index_entry, obj_path): obj_path for obj_path in outdated}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    index.store(*future.result())
+                except Exception as error:
+                    failed += 1
+                    print(f"Failed: {futures[future]}: {error}")
+                if done % 100 == 0:
+                    index.connection.commit()
+        index.connection.commit()
+        flagged = len(index.meshes(1))
+        print(f"Indexed in {time.perf_counter() - start:.1f} s, {failed} failed, {flagged} models with issues")
+
+
+if __name__ == '__main__':
+    main()
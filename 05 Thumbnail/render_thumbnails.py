@@ -0,0 +1,455 @@
+import argparse
+import glob
+import io
+import json
+import math
+import os
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '00 Common'))
+import instrumentation
+
+# Path to the folder containing the projects (same layout as in app.py)
+project_path = 'Z:/01_SCANNED_AND_PROCESSED/02 FINAL/'
+# Folder the rendered images are written to
+output_path = 'thumbnails'
+
+# (azimuth, polar) angles in degrees, taken from the camera-orbit attributes in templates/viewer.html
+VIEWS = {
+    'side': (90, 90),
+    'bottom': (-50, 120),
+    'top': (50, -120),
+}
+
+BACKGROUNDS = ['black', 'white', 'gradient']
+
+# OBJ files come straight from the scanner. Blender imports them with forward_axis='X', up_axis='Z'
+# (see rotate_obj_blender.py) and the glTF exporter converts back to Y-up, i.e. (x, y, z) -> (-y, z, -x).
+OBJ_TO_GLTF = np.array([[0, -1, 0],
+                        [0, 0, 1],
+                        [-1, 0, 0]], dtype=np.float64)
+
+GLTF_COMPONENT_TYPES = {5120: np.int8, 5121: np.uint8, 5122: np.int16, 5123: np.uint16, 5125: np.uint32, 5126: np.float32}
+GLTF_TYPE_SIZES = {'SCALAR': 1, 'VEC2': 2, 'VEC3': 3, 'VEC4': 4, 'MAT4': 16}
+
+
+class MeshPart:
+    """One textured (or flat coloured) triangle soup of a model."""
+
+    def __init__(self, vertices, triangles, uvs=None, uv_triangles=None, texture=None, color=(0.7, 0.7, 0.7)):
+        self.vertices = np.asarray(vertices, dtype=np.float64)
+        self.triangles = np.asarray(triangles, dtype=np.int64)
+        self.uvs = None if uvs is None else np.asarray(uvs, dtype=np.float64)
+        # glTF shares indices between positions and UVs, OBJ does not
+        self.uv_triangles = self.triangles if uv_triangles is None else np.asarray(uv_triangles, dtype=np.int64)
+        self.texture = texture
+        self.color = np.asarray(color[:3], dtype=np.float64)
+
+
+def _load_texture(source):
+    """Loads an image (path or file-like) into a float RGB array in [0, 1]."""
+    with Image.open(source) as image:
+        return np.asarray(image.convert('RGB'), dtype=np.float32) / 255.0
+
+
+def load_obj(obj_path):
+    """
+    Loads a triangulated textured mesh from an OBJ file.
+
+    Polygons are fan-triangulated, UVs are flipped to the glTF convention and the
+    vertices are converted to the Y-up orientation used by the exported GLB files.
+
+    Parameters:
+        obj_path (str): Path to the .obj file.
+
+    Returns:
+        list: A list with a single MeshPart.
+    """
+    vertices, uvs, faces, uv_faces = [], [], [], []
+    mtl_files = []
+    with open(obj_path, 'r', errors='replace') as obj_file:
+        for line in obj_file:
+            if line.startswith('v '):
+                vertices.append(line[2:].split()[:3])
+            elif line.startswith('vt '):
+                uvs.append(line[3:].split()[:2])
+            elif line.startswith('f '):
+                corners = [corner.split('/') for corner in line[2:].split()]
+                for i in range(1, len(corners) - 1):
+                    triangle = (corners[0], corners[i], corners[i + 1])
+                    faces.append([int(c[0]) for c in triangle])
+                    if all(len(c) > 1 and c[1] for c in triangle):
+                        uv_faces.append([int(c[1]) for c in triangle])
+            elif line.startswith('mtllib '):
+                mtl_files.append(line[7:].strip())
+
+    vertices = np.array(vertices, dtype=np.float64) @ OBJ_TO_GLTF.T
+    faces = np.array(faces, dtype=np.int64).reshape(-1, 3)
+    # OBJ indices are 1-based, negative indices count from the end
+    faces = np.where(faces > 0, faces - 1, faces + len(vertices))
+
+    texture = None
+    for mtl_file in mtl_files:
+        mtl_path = os.path.join(os.path.dirname(obj_path), mtl_file)
+        if not os.path.isfile(mtl_path):
+            continue
+        with open(mtl_path, 'r', errors='replace') as mtl:
+            for line in mtl:
+                if line.strip().startswith('map_Kd'):
+                    texture_path = os.path.join(os.path.dirname(obj_path), line.strip().split(maxsplit=1)[1])
+                    if os.path.isfile(texture_path):
+                        texture = _load_texture(texture_path)
+                    break
+
+    if texture is None or not uvs or len(uv_faces) != len(faces):
+        return [MeshPart(vertices, faces)]
+
+    uvs = np.array(uvs, dtype=np.float64)
+    uvs[:, 1] = 1.0 - uvs[:, 1]
+    uv_faces = np.array(uv_faces, dtype=np.int64)
+    uv_faces = np.where(uv_faces > 0, uv_faces - 1, uv_faces + len(uvs))
+    return [MeshPart(vertices, faces, uvs, uv_faces, texture)]
+
+
+def _node_matrix(node):
+    """Returns the local 4x4 transform of a glTF node."""
+    if 'matrix' in node:
+        return np.array(node['matrix'], dtype=np.float64).reshape(4, 4).T
+    x, y, z, w = node.get('rotation', [0, 0, 0, 1])
+    rotation = np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+        [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+        [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+    ])
+    matrix = np.eye(4)
+    matrix[:3, :3] = rotation * np.array(node.get('scale', [1, 1, 1]))
+    matrix[:3, 3] = node.get('translation', [0, 0, 0])
+    return matrix
+
+
+def load_glb(glb_path):
+    """
+    Loads all triangle primitives of a binary glTF file, with node transforms applied.
+
+    Parameters:
+        glb_path (str): Path to the .glb file.
+
+    Returns:
+        list: A list of MeshPart objects.
+
+    Raises:
+        ValueError: If the file is not a GLB or uses an unsupported compression extension.
+    """
+    with open(glb_path, 'rb') as glb_file:
+        data = glb_file.read()
+
+    magic, _, length = struct.unpack_from('<4sII', data, 0)
+    if magic != b'glTF':
+        raise ValueError(f"'{glb_path}' is not a binary glTF file.")
+
+    gltf, binary, offset = None, b'', 12
+    while offset < length:
+        chunk_length, chunk_type = struct.unpack_from('<II', data, offset)
+        chunk = data[offset + 8:offset + 8 + chunk_length]
+        if chunk_type == 0x4E4F534A:  # JSON
+            gltf = json.loads(chunk)
+        elif chunk_type == 0x004E4942:  # BIN
+            binary = chunk
+        offset += 8 + chunk_length
+
+    if any(ext in gltf.get('extensionsUsed', []) for ext in ('KHR_draco_mesh_compression', 'EXT_meshopt_compression')):
+        raise ValueError(f"'{glb_path}' uses compressed geometry, which is not supported.")
+
+    def buffer_view_bytes(index):
+        view = gltf['bufferViews'][index]
+        start = view.get('byteOffset', 0)
+        return binary[start:start + view['byteLength']], view.get('byteStride')
+
+    def read_accessor(index):
+        accessor = gltf['accessors'][index]
+        dtype = np.dtype(GLTF_COMPONENT_TYPES[accessor['componentType']])
+        size = GLTF_TYPE_SIZES[accessor['type']]
+        view, stride = buffer_view_bytes(accessor['bufferView'])
+        start = accessor.get('byteOffset', 0)
+        if stride and stride != dtype.itemsize * size:
+            rows = np.frombuffer(view, dtype=np.uint8, count=stride * (accessor['count'] - 1) + dtype.itemsize * size, offset=start)
+            rows = np.lib.stride_tricks.as_strided(rows, shape=(accessor['count'], dtype.itemsize * size), strides=(stride, 1))
+            values = np.ascontiguousarray(rows).view(dtype)
+        else:
+            values = np.frombuffer(view, dtype=dtype, count=accessor['count'] * size, offset=start)
+        values = values.reshape(accessor['count'], size).astype(np.float64)
+        if accessor.get('normalized') and dtype.kind in 'iu':
+            values /= np.iinfo(dtype).max
+        return values
+
+    textures = {}
+
+    def read_texture(texture_index):
+        if texture_index not in textures:
+            image = gltf['images'][gltf['textures'][texture_index]['source']]
+            if 'bufferView' not in image:
+                textures[texture_index] = None
+            else:
+                textures[texture_index] = _load_texture(io.BytesIO(buffer_view_bytes(image['bufferView'])[0]))
+        return textures[texture_index]
+
+    parts = []
+
+    def visit(node_index, parent_matrix):
+        node = gltf['nodes'][node_index]
+        matrix = parent_matrix @ _node_matrix(node)
+        if 'mesh' in node:
+            for primitive in gltf['meshes'][node['mesh']]['primitives']:
+                if primitive.get('mode', 4) != 4:
+                    continue
+                positions = read_accessor(primitive['attributes']['POSITION'])
+                positions = positions @ matrix[:3, :3].T + matrix[:3, 3]
+                if 'indices' in primitive:
+                    triangles = read_accessor(primitive['indices']).astype(np.int64).reshape(-1, 3)
+                else:
+                    triangles = np.arange(len(positions)).reshape(-1, 3)
+                material = gltf['materials'][primitive['material']] if 'material' in primitive else {}
+                pbr = material.get('pbrMetallicRoughness', {})
+                texture = None
+                if 'baseColorTexture' in pbr and 'TEXCOORD_0' in primitive['attributes']:
+                    texture = read_texture(pbr['baseColorTexture']['index'])
+                if texture is not None:
+                    uvs = read_accessor(primitive['attributes']['TEXCOORD_0'])
+                    parts.append(MeshPart(positions, triangles, uvs, texture=texture))
+                else:
+                    parts.append(MeshPart(positions, triangles, color=pbr.get('baseColorFactor', (0.7, 0.7, 0.7))))
+        for child in node.get('children', []):
+            visit(child, matrix)
+
+    scene = gltf.get('scenes', [{}])[gltf.get('scene', 0)]
+    for root in scene.get('nodes', range(len(gltf.get('nodes', [])))):
+        visit(root, np.eye(4))
+    return parts
+
+
+def _camera_basis(azimuth, polar):
+    """Returns (right, up, towards_camera) unit vectors for a model-viewer style camera orbit."""
+    theta = math.radians(azimuth)
+    # model-viewer clamps the polar angle to [0, 180] degrees
+    phi = math.radians(min(max(polar, 0), 180))
+    towards_camera = np.array([math.sin(phi) * math.sin(theta), math.cos(phi), math.sin(phi) * math.cos(theta)])
+    world_up = np.array([0.0, 1.0, 0.0])
+    if abs(towards_camera @ world_up) > 0.999:
+        # Looking straight up or down: keep the screen aligned with the azimuth
+        world_up = -np.array([math.sin(theta), 0.0, math.cos(theta)]) * np.sign(towards_camera[1])
+    right = np.cross(world_up, towards_camera)
+    right /= np.linalg.norm(right)
+    up = np.cross(towards_camera, right)
+    return right, up, towards_camera
+
+
+def _barycentric_grid(subdivisions):
+    """Returns barycentric sample weights covering a triangle with the given number of edge subdivisions."""
+    steps = np.arange(subdivisions + 1)
+    i, j = np.meshgrid(steps, steps, indexing='ij')
+    mask = i + j <= subdivisions
+    a = i[mask] / subdivisions
+    b = j[mask] / subdivisions
+    return np.stack([1 - a - b, a, b], axis=1)
+
+
+def render_view(parts, azimuth, polar, size=1024, background='black', margin=0.05, supersample=2, max_samples=4_000_000):
+    """
+    Renders a mesh from a given camera orbit with a vectorized z-buffer rasterizer.
+
+    Every triangle is covered with barycentric samples spaced at most one pixel apart, the
+    closest sample per pixel wins. Shading is a headlight Lambert term on the texture colour.
+
+    Parameters:
+        parts (list): MeshPart objects as returned by load_obj or load_glb.
+        azimuth (float): Camera azimuth in degrees.
+        polar (float): Camera polar angle in degrees (0 = top, 180 = bottom).
+        size (int): Width and height of the output image in pixels.
+        background (str): 'black', 'white' or 'gradient' (white with a subtle grey gradient).
+        margin (float): Empty border around the model as a fraction of the image size.
+        supersample (int): Render at this multiple of `size` and downscale for anti-aliasing.
+        max_samples (int): Upper bound for the number of samples processed at once (memory limit).
+
+    Returns:
+        PIL.Image.Image: The rendered RGB image.
+    """
+    if background not in BACKGROUNDS:
+        raise ValueError(f"Invalid background specified. Choose from {', '.join(BACKGROUNDS)}.")
+
+    res = size * supersample
+    right, up, towards_camera = _camera_basis(azimuth, polar)
+    view = np.stack([right, up, towards_camera])
+
+    all_vertices = np.concatenate([part.vertices for part in parts])
+    center = (all_vertices.min(axis=0) + all_vertices.max(axis=0)) / 2
+    projected = (all_vertices - center) @ view.T
+    extent = np.abs(projected[:, :2]).max() or 1.0
+    scale = res * (1 - 2 * margin) / (2 * extent)
+
+    depth_buffer = np.full(res * res, np.inf)
+    color_buffer = np.zeros((res * res, 3), dtype=np.float32)
+
+    for part in parts:
+        screen = (part.vertices - center) @ view.T
+        screen[:, 0] = screen[:, 0] * scale + res / 2
+        screen[:, 1] = res / 2 - screen[:, 1] * scale
+        triangles = screen[part.triangles]  # (T, 3, 3)
+
+        # Headlight shading from the face normals, double-sided
+        world = part.vertices[part.triangles]
+        normals = np.cross(world[:, 1] - world[:, 0], world[:, 2] - world[:, 0])
+        lengths = np.linalg.norm(normals, axis=1)
+        lengths[lengths == 0] = 1
+        shading = 0.3 + 0.7 * np.abs(normals @ towards_camera) / lengths
+
+        edges = np.stack([triangles[:, 1, :2] - triangles[:, 0, :2],
+                          triangles[:, 2, :2] - triangles[:, 1, :2],
+                          triangles[:, 0, :2] - triangles[:, 2, :2]], axis=1)
+        longest = np.linalg.norm(edges, axis=2).max(axis=1)
+        # Round the subdivisions up to powers of two so triangles can be processed in a few groups
+        subdivisions = 2 ** np.ceil(np.log2(np.maximum(longest, 1))).astype(np.int64)
+
+        for subdivision in np.unique(subdivisions):
+            group = np.flatnonzero(subdivisions == subdivision)
+            weights = _barycentric_grid(int(subdivision))
+            batch = max(1, max_samples // len(weights))
+            for start in range(0, len(group), batch):
+                indices = group[start:start + batch]
+                samples = np.einsum('sk,tkd->tsd', weights, triangles[indices]).reshape(-1, 3)
+                x = samples[:, 0].astype(np.int64)
+                y = samples[:, 1].astype(np.int64)
+                inside = (x >= 0) & (x < res) & (y >= 0) & (y < res)
+                pixel = (y * res + x)[inside]
+                # Larger view-space z means closer to the camera
+                depth = -samples[inside, 2]
+                sample_triangle = np.repeat(indices, len(weights))[inside]
+                sample_weight = np.tile(np.arange(len(weights)), len(indices))[inside]
+
+                # Keep the closest sample per pixel within this batch
+                order = np.lexsort((depth, pixel))
+                pixel, depth = pixel[order], depth[order]
+                first = np.ones(len(pixel), dtype=bool)
+                first[1:] = pixel[1:] != pixel[:-1]
+                pixel, depth, order = pixel[first], depth[first], order[first]
+                closer = depth < depth_buffer[pixel]
+                pixel, depth, order = pixel[closer], depth[closer], order[closer]
+                if not len(pixel):
+                    continue
+
+                triangle_index = sample_triangle[order]
+                if part.texture is not None:
+                    uv = np.einsum('sk,skd->sd', weights[sample_weight[order]], part.uvs[part.uv_triangles[triangle_index]])
+                    height, width = part.texture.shape[:2]
+                    columns = np.clip((uv[:, 0] % 1.0) * (width - 1), 0, width - 1).astype(np.int64)
+                    rows = np.clip((uv[:, 1] % 1.0) * (height - 1), 0, height - 1).astype(np.int64)
+                    colors = part.texture[rows, columns]
+                else:
+                    colors = np.broadcast_to(part.color, (len(pixel), 3))
+
+                depth_buffer[pixel] = depth
+                color_buffer[pixel] = colors * shading[triangle_index, None]
+
+    covered = np.isfinite(depth_buffer).reshape(res, res, 1)
+    if background == 'black':
+        canvas = np.zeros((res, res, 3), dtype=np.float32)
+    elif background == 'white':
+        canvas = np.ones((res, res, 3), dtype=np.float32)
+    else:
+        canvas = np.broadcast_to(np.linspace(1.0, 0.85, res, dtype=np.float32)[:, None, None], (res, res, 3))
+    image = np.where(covered, color_buffer.reshape(res, res, 3), canvas)
+
+    image = Image.fromarray((np.clip(image, 0, 1) * 255).astype(np.uint8))
+    if supersample > 1:
+        image = image.resize((size, size), Image.LANCZOS)
+    return image
+
+
+def find_model_files(project):
+    """Returns the GLB and OBJ candidates of a project folder, GLB first."""
+    name = os.path.basename(os.path.normpath(project))
+    candidates = [os.path.join(project, 'Model', name + '.glb')]
+    candidates += sorted(glob.glob(os.path.join(project, 'Model', '*.glb')))
+    candidates += [os.path.join(project, 'Model', name + '.obj')]
+    candidates += sorted(glob.glob(os.path.join(project, 'Model', '*.obj')))
+    unique = []
+    for candidate in candidates:
+        if os.path.isfile(candidate) and candidate not in unique:
+            unique.append(candidate)
+    return unique
+
+
+def load_model(project):
+    """Loads the first readable model of a project, falling back from GLB to OBJ."""
+    errors = []
+    for model_file in find_model_files(project):
+        try:
+            return load_glb(model_file) if model_file.lower().endswith('.glb') else load_obj(model_file)
+        except (ValueError, KeyError, IndexError, struct.error) as error:
+            errors.append(f"{os.path.basename(model_file)}: {error}")
+    raise FileNotFoundError(f"No readable model in '{project}'. {' '.join(errors)}")
+
+
+def render_project(project, output_folder, views=tuple(VIEWS), image_format='jpg', skip_existing=False, **render_kwargs):
+    """
+    Renders the requested views of one project and writes them as `<name>_<view>_3d.<format>`.
+
+    Returns:
+        list: Paths of the written images.
+    """
+    name = os.path.basename(os.path.normpath(project))
+    targets = {view: os.path.join(output_folder, f"{name}_{view}_3d.{image_format}") for view in views}
+    if skip_existing and all(os.path.exists(target) for target in targets.values()):
+        return []
+
+    with instrumentation.span('load'):
+        parts = load_model(project)
+    written = []
+    for view, target in targets.items():
+        azimuth, polar = VIEWS[view]
+        with instrumentation.span('render'):
+            image = render_view(parts, azimuth, polar, **render_kwargs)
+        with instrumentation.span('encode'):
+            if image_format == 'jpg':
+                image.save(target, quality=95)
+            else:
+                image.save(target)
+        written.append(target)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render side/bottom/top thumbnails of all project models without a browser.")
+    parser.add_argument('project_path', nargs='?', default=project_path, help="Folder containing the project folders.")
+    parser.add_argument('-o', '--output', default=output_path, help="Folder the images are written to.")
+    parser.add_argument('-s', '--size', type=int, default=1024, help="Image width and height in pixels.")
+    parser.add_argument('-b', '--background', choices=BACKGROUNDS, default='gradient', help="Background of the images.")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help="Number of worker processes.")
+    parser.add_argument('-f', '--format', dest='image_format', choices=['jpg', 'png'], default='jpg', help="Image format.")
+    parser.add_argument('--views', nargs='+', choices=list(VIEWS), default=list(VIEWS), help="Views to render.")
+    parser.add_argument('--supersample', type=int, default=2, help="Supersampling factor for anti-aliasing.")
+    parser.add_argument('--skip-existing', action='store_true', help="Skip projects whose images already exist.")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    projects = sorted(path for path in glob.glob(os.path.join(args.project_path, '*')) if os.path.isdir(path))
+    render_kwargs = {'size': args.size, 'background': args.background, 'supersample': args.supersample}
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(render_project, project, args.output, args.views, args.image_format,
+                                   args.skip_existing, **render_kwargs): project for project in projects}
+        for future in as_completed(futures):
+            project = os.path.basename(futures[future])
+            try:
+                written = future.result()
+                print(f"Project {project}: {len(written)} image(s) written")
+            except Exception as error:
+                print(f"Project {project}: skipped ({error})")
+
+
+if __name__ == '__main__':
+    main()
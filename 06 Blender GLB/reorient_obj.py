@@ -0,0 +1,280 @@
+import argparse
+import glob
+import json
+import mmap
+import os
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '00 Common'))
+from obj_parser import read_obj
+
+####################################################################
+# Settings (same axes as the obj_import call in rotate_obj_blender.py)
+forward_axis = 'X'
+up_axis = 'Z'
+model_path = "Model"
+chunk_size = 64 * 1024 * 1024  # Bytes of the OBJ processed at once
+####################################################################
+
+AXES = {
+    'X': (1, 0, 0), 'Y': (0, 1, 0), 'Z': (0, 0, 1),
+    '-X': (-1, 0, 0), '-Y': (0, -1, 0), '-Z': (0, 0, -1),
+}
+
+# Blender (Z-up, Y-forward) to the Y-up convention of glTF and most OBJ viewers, as done by Blender's exporters
+BLENDER_TO_Y_UP = np.array([[1, 0, 0],
+                            [0, 0, 1],
+                            [0, -1, 0]], dtype=np.float64)
+
+TEXTURE_MIME_TYPES = {'.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg'}
+
+
+def axis_conversion(forward=forward_axis, up=up_axis, target_up='Y'):
+    """
+    Returns the rotation matrix Blender's OBJ importer applies for the given axes.
+
+    Parameters:
+        forward (str): Forward axis of the OBJ file (e.g. 'X', '-Z').
+        up (str): Up axis of the OBJ file.
+        target_up (str): 'Z' for Blender's coordinate system, 'Y' for glTF/OBJ viewers.
+
+    Returns:
+        np.ndarray: A 3x3 rotation matrix applied as `matrix @ vertex`.
+    """
+    forward_vector = np.array(AXES[forward], dtype=np.float64)
+    up_vector = np.array(AXES[up], dtype=np.float64)
+    if forward_vector @ up_vector != 0:
+        raise ValueError("Forward and up axis must be perpendicular.")
+    # The source basis (right, forward, up) is mapped onto Blender's (X, Y, Z)
+    to_blender = np.stack([np.cross(forward_vector, up_vector), forward_vector, up_vector])
+    if target_up == 'Z':
+        return to_blender
+    if target_up == 'Y':
+        return BLENDER_TO_Y_UP @ to_blender
+    raise ValueError("Invalid target_up specified. Choose 'Y' or 'Z'.")
+
+
+def _transform_run(prefix, payloads, rotation, precision):
+    """Rotates a run of consecutive `v`/`vn` lines and returns them formatted as bytes."""
+    values = np.array(b' '.join(payloads).split(), dtype=np.float64)
+    if len(values) % len(payloads) or len(values) // len(payloads) < 3:
+        if len(payloads) == 1:
+            raise ValueError(f"Invalid '{prefix.decode()}' line with fewer than 3 values: {payloads[0].strip().decode(errors='replace')}")
+        # Mixed column counts (e.g. only some vertices have colours), fall back to line by line
+        return b''.join(_transform_run(prefix, [payload], rotation, precision) for payload in payloads)
+
+    values = values.reshape(len(payloads), -1)
+    values[:, :3] = values[:, :3] @ rotation.T
+    if prefix == b'vn':
+        # Keep normals exactly unit length after the rotation
+        lengths = np.linalg.norm(values[:, :3], axis=1, keepdims=True)
+        values[:, :3] /= np.where(lengths == 0, 1, lengths)
+    row_format = prefix.decode() + (' %.{}f'.format(precision) * values.shape[1]) + '\n'
+    return ''.join(row_format % tuple(row) for row in values.tolist()).encode()
+
+
+def reorient_obj(obj_path, output_path, rotation, precision=6, block_size=chunk_size):
+    """
+    Streams an OBJ file and writes a copy with rotated vertices and normals.
+
+    The input is memory-mapped and processed in blocks of complete lines. Runs of
+    consecutive `v`/`vn` lines are converted with NumPy, all other lines are copied unchanged.
+
+    Parameters:
+        obj_path (str): Path to the input .obj file.
+        output_path (str): Path of the reoriented .obj file.
+        rotation (np.ndarray): 3x3 rotation matrix, see axis_conversion.
+        precision (int): Number of decimals written for the coordinates.
+        block_size (int): Approximate number of bytes processed at once.
+    """
+    with open(obj_path, 'rb') as src, open(output_path, 'wb') as dest:
+        if os.fstat(src.fileno()).st_size == 0:
+            return
+        with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            while start < len(mm):
+                end = mm.find(b'\n', min(start + block_size, len(mm)) - 1)
+                end = len(mm) if end == -1 else end + 1
+                lines = mm[start:end].splitlines(keepends=True)
+                start = end
+
+                run_prefix, run = None, []
+                for line in lines:
+                    prefix = b'v' if line.startswith(b'v ') else b'vn' if line.startswith(b'vn ') else None
+                    if prefix != run_prefix and run:
+                        dest.write(_transform_run(run_prefix, run, rotation, precision))
+                        run = []
+                    run_prefix = prefix
+                    if prefix is None:
+                        dest.write(line)
+                    else:
+                        run.append(line[len(prefix) + 1:])
+                if run:
+                    dest.write(_transform_run(run_prefix, run, rotation, precision))
+
+
+def _read_obj_arrays(obj_path, block_size=chunk_size):
+    """
+    Reads positions, UVs, normals and triangulated (v, vt, vn) face corners of an OBJ with the
+    memory-mapped block parser of obj_parser (polygon faces line by line).
+    """
+    obj = read_obj(obj_path, block_size=block_size)
+    return obj['v'], obj['vt'], obj['vn'], obj['corners'], obj['mtllib']
+
+
+def _find_texture(obj_path, mtl_files):
+    """Returns the path of the first diffuse texture referenced by the OBJ's material files."""
+    folder = os.path.dirname(obj_path)
+    for mtl_file in mtl_files:
+        mtl_path = os.path.join(folder, mtl_file)
+        if not os.path.isfile(mtl_path):
+            continue
+        with open(mtl_path, 'r', errors='replace') as mtl:
+            for line in mtl:
+                if line.strip().startswith('map_Kd'):
+                    texture_path = os.path.join(folder, line.strip().split(maxsplit=1)[1])
+                    if os.path.isfile(texture_path):
+                        return texture_path
+    return None
+
+
+def write_glb(obj_path, output_path, rotation):
+    """
+    Converts an OBJ (and its diffuse texture) into a reoriented binary glTF file.
+
+    Parameters:
+        obj_path (str): Path to the input .obj file.
+        output_path (str): Path of the .glb file.
+        rotation (np.ndarray): 3x3 rotation matrix, see axis_conversion (use target_up='Y').
+    """
+    positions, uvs, normals, triples, mtl_files = _read_obj_arrays(obj_path)
+    use_uvs = len(uvs) > 0 and (triples[:, 1] >= 0).all()
+    use_normals = len(normals) > 0 and (triples[:, 2] >= 0).all()
+    columns = [0] + ([1] if use_uvs else []) + ([2] if use_normals else [])
+
+    # glTF shares one index per vertex, so every distinct (v, vt, vn) combination becomes a vertex
+    unique, indices = np.unique(triples[:, columns], axis=0, return_inverse=True)
+    attributes = {'POSITION': (positions[unique[:, 0]] @ rotation.T).astype(np.float32)}
+    if use_normals:
+        attributes['NORMAL'] = (normals[unique[:, columns.index(2)]] @ rotation.T).astype(np.float32)
+    if use_uvs:
+        texcoords = uvs[unique[:, columns.index(1)]].astype(np.float32)
+        texcoords[:, 1] = 1.0 - texcoords[:, 1]  # glTF's UV origin is the top left corner
+        attributes['TEXCOORD_0'] = texcoords
+
+    gltf = {'asset': {'version': '2.0', 'generator': 'reorient_obj.py'}, 'scene': 0,
+            'scenes': [{'nodes': [0]}], 'nodes': [{'mesh': 0, 'name': os.path.splitext(os.path.basename(obj_path))[0]}],
+            'meshes': [{'primitives': [{'attributes': {}, 'mode': 4}]}],
+            'accessors': [], 'bufferViews': [], 'buffers': []}
+    primitive = gltf['meshes'][0]['primitives'][0]
+    binary = bytearray()
+
+    def add_buffer_view(data, target=None):
+        view = {'buffer': 0, 'byteOffset': len(binary), 'byteLength': len(data)}
+        if target:
+            view['target'] = target
+        binary.extend(data)
+        binary.extend(b'\0' * (-len(binary) % 4))
+        gltf['bufferViews'].append(view)
+        return len(gltf['bufferViews']) - 1
+
+    for name, values in attributes.items():
+        accessor = {'bufferView': add_buffer_view(values.tobytes(), 34962), 'componentType': 5126,
+                    'count': len(values), 'type': 'VEC3' if values.shape[1] == 3 else 'VEC2'}
+        if name == 'POSITION':
+            accessor['min'] = values.min(axis=0).tolist()
+            accessor['max'] = values.max(axis=0).tolist()
+        gltf['accessors'].append(accessor)
+        primitive['attributes'][name] = len(gltf['accessors']) - 1
+
+    index_array = indices.reshape(-1).astype(np.uint32)
+    gltf['accessors'].append({'bufferView': add_buffer_view(index_array.tobytes(), 34963), 'componentType': 5125,
+                              'count': len(index_array), 'type': 'SCALAR'})
+    primitive['indices'] = len(gltf['accessors']) - 1
+
+    texture_path = _find_texture(obj_path, mtl_files) if use_uvs else None
+    mime_type = TEXTURE_MIME_TYPES.get(os.path.splitext(texture_path or '')[1].lower())
+    if mime_type:
+        with open(texture_path, 'rb') as texture:
+            gltf['images'] = [{'bufferView': add_buffer_view(texture.read()), 'mimeType': mime_type}]
+        gltf['textures'] = [{'source': 0}]
+        gltf['materials'] = [{'pbrMetallicRoughness': {'baseColorTexture': {'index': 0}, 'metallicFactor': 0.0}}]
+        primitive['material'] = 0
+
+    gltf['buffers'].append({'byteLength': len(binary)})
+    json_chunk = json.dumps(gltf, separators=(',', ':')).encode()
+    json_chunk += b' ' * (-len(json_chunk) % 4)
+    with open(output_path, 'wb') as dest:
+        dest.write(struct.pack('<4sII', b'glTF', 2, 12 + 8 + len(json_chunk) + 8 + len(binary)))
+        dest.write(struct.pack('<II', len(json_chunk), 0x4E4F534A))
+        dest.write(json_chunk)
+        dest.write(struct.pack('<II', len(binary), 0x004E4942))
+        dest.write(binary)
+
+
+def find_obj_files(paths):
+    """Resolves OBJ files, project folders (with a Model folder) and parent folders of projects to OBJ paths."""
+    obj_files = []
+    for path in paths:
+        if os.path.isfile(path):
+            obj_files.append(path)
+        elif os.path.isdir(os.path.join(path, model_path)):
+            obj_files.extend(sorted(glob.glob(os.path.join(path, model_path, '*.obj')))[:1])
+        elif os.path.isdir(path):
+            for project in sorted(glob.glob(os.path.join(path, '*', ''))):
+                found = sorted(glob.glob(os.path.join(project, model_path, '*.obj')))
+                if found:
+                    obj_files.append(found[0])
+                else:
+                    # If there is no obj file, skip the folder
+                    print("Skipping folder " + project)
+    return obj_files
+
+
+def process_obj(obj_path, formats, forward, up, output_dir=None):
+    """Writes the reoriented OBJ and/or GLB next to the input (or into output_dir) and returns the written paths."""
+    name = os.path.splitext(os.path.basename(obj_path))[0]
+    output_dir = output_dir or os.path.dirname(obj_path)
+    written = []
+    if 'obj' in formats:
+        output_path = os.path.join(output_dir, name + '_reoriented.obj')
+        reorient_obj(obj_path, output_path, axis_conversion(forward, up, target_up='Y'))
+        written.append(output_path)
+    if 'glb' in formats:
+        output_path = os.path.join(output_dir, name + '.glb')
+        write_glb(obj_path, output_path, axis_conversion(forward, up, target_up='Y'))
+        written.append(output_path)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reorient OBJ models like rotate_obj_blender.py, without Blender.")
+    parser.add_argument('paths', nargs='+', help="OBJ files, project folders or folders containing projects.")
+    parser.add_argument('-f', '--formats', nargs='+', choices=['obj', 'glb'], default=['glb'], help="Output formats.")
+    parser.add_argument('--forward', choices=list(AXES), default=forward_axis, help="Forward axis of the OBJ files.")
+    parser.add_argument('--up', choices=list(AXES), default=up_axis, help="Up axis of the OBJ files.")
+    parser.add_argument('-o', '--output-dir', help="Write all outputs here instead of next to the inputs.")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help="Number of worker processes.")
+    args = parser.parse_args()
+
+    obj_files = find_obj_files(args.paths)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(process_obj, obj_path, args.formats, args.forward, args.up, args.output_dir): obj_path
+                   for obj_path in obj_files}
+        for future in as_completed(futures):
+            try:
+                for written in future.result():
+                    print("Written " + written)
+            except Exception as error:
+                print("Failed {}: {}".format(futures[future], error))
+
+
+if __name__ == '__main__':
+    main()
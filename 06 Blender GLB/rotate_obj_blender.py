@@ -1,32 +1,115 @@
 import bpy
 import os
+import sys
 import glob
+import json
+import time
 import shutil
+import argparse
 
 ####################################################################
 # Settings
 import_path = "C:\\InsectScanner\\Data\DataCurrent\\0_PREPROCESS\\0.5_BLENDER_CHRISTIAN\\" # Where the projects currently are.
 export_path =  "C:\\InsectScanner\Data\DataCurrent\\0_PREPROCESS\\1_READY_FOR_BLENDER\\" # Where the projects are after the script finishes.
 model_path = "Model\\"
+
+# GLB export (written to Model\\<name>.glb next to the .blend)
+export_glb = True
+draco_compression = False # Draco geometry compression (meshopt is not available in Blender's glTF exporter). render_thumbnails.py can't read Draco GLBs and renders the OBJ instead.
+draco_level = 6 # 0 (fastest) to 10 (smallest).
+texture_max_size = 4096 # Textures larger than this (in pixels) are downscaled. 0 keeps the original size.
+texture_format = 'JPEG' # 'AUTO' keeps the original format, 'JPEG' or 'WEBP' recompress the textures.
+texture_quality = 85 # Quality for JPEG/WEBP textures.
+target_triangles = 0 # Decimate meshes with more triangles than this. 0 disables decimation.
 ####################################################################
 
-projects = glob.glob(import_path+"*\\")
+# Optional arguments after "--", used by run_blender_batch.py:
+# blender -b --python rotate_obj_blender.py -- --projects shard.txt --results shard.jsonl --no-move
+parser = argparse.ArgumentParser()
+parser.add_argument('--projects', help="Text file with one project folder per line (default: all projects in import_path).")
+parser.add_argument('--results', help="JSON lines file the result of every project is appended to.")
+parser.add_argument('--no-move', action='store_true', help="Do not move the projects to export_path.")
+args = parser.parse_args(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+
+if args.projects:
+    with open(args.projects, encoding='utf-8') as f:
+        projects = [os.path.join(line.strip(), '') for line in f if line.strip()]
+else:
+    projects = glob.glob(import_path+"*\\")
+
+
+def write_result(project, status, start, error=None, **extra):
+    if not args.results:
+        return
+    with open(args.results, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'project': project, 'status': status, 'seconds': round(time.time() - start, 3), 'error': error, **extra}) + "\n")
+
+
+def export_optimized_glb(obj_path, glb_path):
+    """Decimates the imported meshes, downscales the textures and exports a compressed GLB. Returns (size before, size after) in bytes."""
+    meshes = [obj for obj in bpy.context.scene.objects if obj.type == 'MESH']
+    if target_triangles:
+        triangles = sum(len(polygon.vertices) - 2 for obj in meshes for polygon in obj.data.polygons)
+        if triangles > target_triangles:
+            for obj in meshes:
+                modifier = obj.modifiers.new(name="Decimate", type='DECIMATE')
+                modifier.ratio = target_triangles / triangles
+    if texture_max_size:
+        for image in bpy.data.images:
+            width, height = image.size
+            if max(width, height) > texture_max_size:
+                factor = texture_max_size / max(width, height)
+                image.scale(max(1, int(width * factor)), max(1, int(height * factor)))
+
+    # Size of the obj and all files it references (mtl, textures)
+    sources = {obj_path} | {bpy.path.abspath(image.filepath) for image in bpy.data.images if image.filepath}
+    mtl_path = os.path.splitext(obj_path)[0] + '.mtl'
+    if os.path.exists(mtl_path):
+        sources.add(mtl_path)
+    size_before = sum(os.path.getsize(path) for path in sources if os.path.isfile(path))
+
+    bpy.ops.export_scene.gltf(
+        filepath=glb_path,
+        export_format='GLB',
+        export_apply=True, # applies the decimate modifiers
+        export_image_format=texture_format,
+        export_image_quality=texture_quality,
+        export_draco_mesh_compression_enable=draco_compression,
+        export_draco_mesh_compression_level=draco_level,
+    )
+    return size_before, os.path.getsize(glb_path)
+
 
 for project in projects:
-    name = project.split("\\")[-2]
+    start = time.time()
+    name = os.path.basename(os.path.dirname(project))
     try:
         obj_path = glob.glob(os.path.join(project, model_path, '*.obj'))[0]
     except:
         # If there is no obj file, skip the folder
         print("Skipping folder " + project)
+        write_result(project, 'skipped', start, "No obj file found")
+        continue
+    try:
+        # Import the obj with the correct orienation
+        bpy.ops.wm.obj_import(filepath=obj_path, forward_axis='X', up_axis='Z')
+        # Set the transform orientation to local
+        bpy.data.scenes["Scene"].transform_orientation_slots[0].type = 'LOCAL'
+        # Save the blend file
+        bpy.ops.wm.save_as_mainfile(filepath=os.path.join(project, model_path, (name + '.blend')))
+        # Export an optimized GLB in the same pass (after saving, so the .blend keeps the full mesh)
+        sizes = {}
+        if export_glb:
+            size_before, size_after = export_optimized_glb(obj_path, os.path.join(project, model_path, (name + '.glb')))
+            sizes = {'size_before': size_before, 'size_after': size_after}
+            print("{}: {:.1f} MB -> {:.1f} MB GLB".format(name, size_before / 1e6, size_after / 1e6))
+    except Exception as error:
+        print("Failed folder " + project + ": " + str(error))
+        write_result(project, 'failed', start, str(error))
+        bpy.ops.wm.read_factory_settings(use_empty=True)
         continue
-    # Import the obj with the correct orienation
-    bpy.ops.wm.obj_import(filepath=obj_path, forward_axis='X', up_axis='Z')
-    # Set the transform orientation to local
-    bpy.data.scenes["Scene"].transform_orientation_slots[0].type = 'LOCAL'
-    # Save the blend file
-    bpy.ops.wm.save_as_mainfile(filepath=os.path.join(project, model_path, (name + '.blend')))
     # Reset Blender and move folder
     bpy.ops.wm.read_factory_settings(use_empty=True)
-    shutil.move(project, os.path.join(export_path, name))
-
+    write_result(project, 'success', start, **sizes)
+    if not args.no_move:
+        shutil.move(project, os.path.join(export_path, name))
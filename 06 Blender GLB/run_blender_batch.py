@@ -0,0 +1,119 @@
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import time
+
+####################################################################
+# Settings (defaults, can be overridden on the command line)
+blender_path = "C:\\Program Files\\Blender Foundation\\Blender 4.1\\blender.exe"
+import_path = "C:\\InsectScanner\\Data\\DataCurrent\\0_PREPROCESS\\0.5_BLENDER_CHRISTIAN\\"  # Where the projects currently are.
+export_path = "C:\\InsectScanner\\Data\\DataCurrent\\0_PREPROCESS\\1_READY_FOR_BLENDER\\"  # Where the projects are after the script finishes.
+script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rotate_obj_blender.py")
+####################################################################
+
+
+def shard(items, count):
+    """Splits items round-robin into at most `count` non-empty lists."""
+    shards = [items[i::count] for i in range(count)]
+    return [s for s in shards if s]
+
+
+def run_shards(projects, instances, work_dir, attempt, blender=blender_path, script=script_path):
+    """
+    Runs rotate_obj_blender.py on the projects in `instances` parallel background Blender processes.
+
+    Projects are not moved by the Blender processes. A project without a result line
+    (e.g. because Blender crashed while processing it) is reported as 'crashed'.
+
+    Returns:
+        dict: Project path -> result dictionary (status, seconds, error).
+    """
+    processes = []
+    for i, shard_projects in enumerate(shard(projects, instances)):
+        shard_file = os.path.join(work_dir, f"attempt{attempt}_shard{i}.txt")
+        results_file = os.path.join(work_dir, f"attempt{attempt}_shard{i}.jsonl")
+        log_file = os.path.join(work_dir, f"attempt{attempt}_shard{i}.log")
+        with open(shard_file, 'w', encoding='utf-8') as f:
+            f.write("\n".join(shard_projects) + "\n")
+        if os.path.exists(results_file):
+            os.remove(results_file)  # left over from a previous run
+        command = [blender, '-b', '--factory-startup', '--python', script, '--',
+                   '--projects', shard_file, '--results', results_file, '--no-move']
+        log = open(log_file, 'w', encoding='utf-8')
+        processes.append((subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT), log, results_file, shard_projects))
+
+    results = {}
+    for process, log, results_file, shard_projects in processes:
+        return_code = process.wait()
+        log.close()
+        if os.path.exists(results_file):
+            with open(results_file, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        result = json.loads(line)
+                        results[result.pop('project')] = result
+        for project in shard_projects:
+            if os.path.join(project, '') not in results:
+                results[os.path.join(project, '')] = {
+                    'status': 'crashed', 'seconds': None,
+                    'error': f"No result, Blender exited with code {return_code} (see {log.name})"}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run rotate_obj_blender.py in several background Blender instances.")
+    parser.add_argument('-n', '--instances', type=int, default=max(1, (os.cpu_count() or 2) // 2), help="Number of parallel Blender processes.")
+    parser.add_argument('-r', '--retries', type=int, default=1, help="How often failed or crashed projects are retried.")
+    parser.add_argument('--blender', default=blender_path, help="Path to blender.exe.")
+    parser.add_argument('--import-path', default=import_path, help="Folder with the projects to process.")
+    parser.add_argument('--export-path', default=export_path, help="Folder successful projects are moved to.")
+    parser.add_argument('--results', default='blender_results.json', help="File the per-project results are written to.")
+    args = parser.parse_args()
+
+    projects = [os.path.join(p, '') for p in sorted(glob.glob(os.path.join(args.import_path, '*', '')))]
+    print(f"Processing {len(projects)} projects with {args.instances} Blender instances.")
+
+    summary = {}
+    pending = projects
+    start = time.time()
+    # Shard lists, per-shard results and Blender logs are kept next to the results file
+    work_dir = os.path.splitext(args.results)[0] + '_logs'
+    os.makedirs(work_dir, exist_ok=True)
+    for attempt in range(args.retries + 1):
+        if not pending:
+            break
+        if attempt:
+            print(f"Retrying {len(pending)} failed projects (attempt {attempt + 1}).")
+        results = run_shards(pending, args.instances, work_dir, attempt, blender=args.blender)
+        for project, result in results.items():
+            result['attempts'] = attempt + 1
+            summary[project] = result
+        pending = [p for p, r in results.items() if r['status'] in ('failed', 'crashed')]
+
+    # Only move projects once all Blender processes are done, so a crash never leaves half-moved projects
+    for project, result in summary.items():
+        result['moved'] = False
+        if result['status'] != 'success':
+            continue
+        name = os.path.basename(os.path.dirname(project))
+        try:
+            shutil.move(project, os.path.join(args.export_path, name))
+            result['moved'] = True
+        except Exception as error:
+            result['error'] = f"Move failed: {error}"
+
+    with open(args.results, 'w', encoding='utf-8') as f:
+        json.dump({'seconds': round(time.time() - start, 3), 'projects': summary}, f, indent=2)
+
+    counts = {}
+    for result in summary.values():
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    print(", ".join(f"{status}: {count}" for status, count in sorted(counts.items())))
+    print(f"Results written to {args.results}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import os
+
+import numpy as np
+from PIL import Image
+
+# Layout of the archive, see 01 Fetcher/fetcher.py and 02 Scalebar/add_scalebars_new.py
+DEFAULT_COLLECTION = '02_NML_ENT'
+DEFAULT_ID_PREFIX = 'NML_ENT GBIF_Chr'
+POSES = [(elevation, rotation) for elevation in (-50, -25, 0, 25, 50) for rotation in range(0, 360, 30)]
+
+
+def specimen_image(rng, width, height):
+    """Returns a specimen-like RGB image: a textured dark ellipse with legs on a light, slightly noisy background."""
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    cx, cy = width * rng.uniform(0.4, 0.6), height * rng.uniform(0.4, 0.6)
+    rx, ry = width * rng.uniform(0.15, 0.25), height * rng.uniform(0.1, 0.2)
+    body = ((x - cx) / rx) ** 2 + ((y - cy) / ry) ** 2 < 1
+    legs = np.zeros_like(body)
+    for angle in rng.uniform(0, np.pi, 6):
+        distance = np.abs((x - cx) * np.sin(angle) - (y - cy) * np.cos(angle))
+        legs |= (distance < max(2, width / 300)) & (np.hypot(x - cx, y - cy) < 1.6 * max(rx, ry))
+
+    image = np.full((height, width, 3), 225, dtype=np.float32)
+    image += rng.normal(0, 3, (height, width, 1))
+    texture = 60 + 40 * np.sin(x / rng.uniform(3, 9)) * np.cos(y / rng.uniform(3, 9))
+    color = rng.uniform(0.5, 1.0, 3)
+    image[body | legs] = (texture[body | legs, None] * color)
+    return Image.fromarray(np.clip(image, 0, 255).astype(np.uint8))
+
+
+def scan_information_pdf(pixel_pitch, specimen_id):
+    """Returns a minimal one page PDF with the lines of a ScanInformation.pdf, including the pixel pitch line."""
+    lines = [
+        "Scan Information",
+        f"1. Specimen: {specimen_id}",
+        "2. Optics",
+        "2.1. Objective: 5x",
+        f"2.5. Object Pixel Pitch: {pixel_pitch}",
+        "3. Stacking",
+    ]
+    text = "BT /F1 11 Tf 14 TL 50 780 Td " + " ".join(f"({line}) Tj T*" for line in lines) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>",
+        f"<< /Length {len(text)} >>\nstream\n{text}\nendstream",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, content in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{content}\nendobj\n".encode('latin-1')
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return pdf
+
+
+def write_model(model_folder, specimen_id, rng, segments=48):
+    """Writes a textured ellipsoid as <id>.obj/.mtl/.png."""
+    rings = segments // 2
+    theta, phi = np.meshgrid(np.linspace(0, np.pi, rings + 1), np.linspace(0, 2 * np.pi, segments + 1), indexing='ij')
+    radii = rng.uniform(0.5, 2.0, 3)
+    vertices = np.stack([np.sin(theta) * np.cos(phi) * radii[0], np.sin(theta) * np.sin(phi) * radii[1],
+                         np.cos(theta) * radii[2]], axis=-1).reshape(-1, 3)
+    uvs = np.stack([phi / (2 * np.pi), 1 - theta / np.pi], axis=-1).reshape(-1, 2)
+    with open(os.path.join(model_folder, specimen_id + '.obj'), 'w') as obj:
+        obj.write(f"mtllib {specimen_id}.mtl\nusemtl material0\n")
+        obj.writelines(f"v {x:.6f} {y:.6f} {z:.6f}\n" for x, y, z in vertices)
+        obj.writelines(f"vt {u:.6f} {v:.6f}\n" for u, v in uvs)
+        for i in range(rings):
+            for j in range(segments):
+                a = i * (segments + 1) + j + 1
+                b, c, d = a + 1, a + segments + 1, a + segments + 2
+                obj.write(f"f {a}/{a} {b}/{b} {d}/{d} {c}/{c}\n")
+    with open(os.path.join(model_folder, specimen_id + '.mtl'), 'w') as mtl:
+        mtl.write(f"newmtl material0\nKd 1.000 1.000 1.000\nmap_Kd {specimen_id}.png\n")
+    specimen_image(rng, 512, 512).save(os.path.join(model_folder, specimen_id + '.png'))
+
+
+def make_collection(root, specimens=5, edof_images=4, redof_images=12, width=2000, height=1500,
+                    collection=DEFAULT_COLLECTION, id_prefix=DEFAULT_ID_PREFIX, with_models=True, seed=0):
+    """
+    Creates a fake archive: <root>/<collection>/<id>/ with edof (PNG), redof (pose-named JPEG frames),
+    ScanInformation.pdf and Model/<id>.obj|mtl|png.
+
+    The content only depends on the arguments, so repeated runs produce identical files.
+
+    Returns:
+        list: The specimen IDs.
+    """
+    rng = np.random.default_rng(seed)
+    collection_folder = os.path.join(root, collection)
+    ids = []
+    for index in range(specimens):
+        specimen_id = f"{id_prefix}{10000 + index:08d}"
+        ids.append(specimen_id)
+        specimen_folder = os.path.join(collection_folder, specimen_id)
+        for folder in ('edof', 'redof', 'Model'):
+            os.makedirs(os.path.join(specimen_folder, folder), exist_ok=True)
+
+        for i in range(edof_images):
+            specimen_image(rng, width, height).save(os.path.join(specimen_folder, 'edof', f"image_{i:03d}.png"))
+        for i in range(redof_images):
+            # Spread the frames over all poses, like a full turntable capture
+            elevation, rotation = POSES[(i * len(POSES)) // redof_images % len(POSES)]
+            name = f"image_{i:03d}_{elevation}_{rotation}.jpeg"
+            specimen_image(rng, width, height).save(os.path.join(specimen_folder, 'redof', name), quality=95)
+
+        pixel_pitch = round(float(rng.uniform(2.5, 8.0)), 3)
+        with open(os.path.join(specimen_folder, 'ScanInformation.pdf'), 'wb') as pdf:
+            pdf.write(scan_information_pdf(pixel_pitch, specimen_id))
+        if with_models:
+            write_model(os.path.join(specimen_folder, 'Model'), specimen_id, rng)
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a fake specimen collection for benchmarks and tests.")
+    parser.add_argument('root', help="Folder the collection is created in (acts as '02 FINAL').")
+    parser.add_argument('-n', '--specimens', type=int, default=5, help="Number of specimen folders.")
+    parser.add_argument('--edof', type=int, default=4, help="Number of edof images per specimen.")
+    parser.add_argument('--redof', type=int, default=12, help="Number of redof images per specimen.")
+    parser.add_argument('--width', type=int, default=2000, help="Image width in pixels.")
+    parser.add_argument('--height', type=int, default=1500, help="Image height in pixels.")
+    parser.add_argument('--collection', default=DEFAULT_COLLECTION, help="Name of the collection folder.")
+    parser.add_argument('--no-models', action='store_true', help="Do not create Model folders.")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed.")
+    args = parser.parse_args()
+
+    ids = make_collection(args.root, args.specimens, args.edof, args.redof, args.width, args.height,
+                          args.collection, with_models=not args.no_models, seed=args.seed)
+    print(f"Created {len(ids)} specimens in {os.path.join(args.root, args.collection)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+import argparse
+import contextlib
+import datetime
+import hashlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from make_fake_collection import DEFAULT_COLLECTION, make_collection
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '00 Common'))
+import instrumentation
+from tools import REPO_ROOT, load_tool, tool_path
+
+RESULTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+IMAGE_EXTENSIONS = ('.jpeg', '.jpg', '.png', '.bmp', '.tiff', '.gif')
+
+
+class Timer:
+    """Accumulates wall clock time per stage."""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+
+def run_instrumented(timer, function):
+    """
+    Times function as 'end_to_end' and adds the stages the tools record with instrumentation spans
+    (decode, filter, encode, ...), so the stages are measured in the real run.
+    """
+    instrumentation.start('benchmark', summary=True)
+    try:
+        with timer.stage('end_to_end'):
+            function()
+    finally:
+        spans = instrumentation.summary()['spans']
+        instrumentation.stop(quiet=True)
+    timer.stages = {**{name: entry['seconds'] for name, entry in spans.items()}, **timer.stages}
+
+
+def image_files(folder):
+    return sorted(f for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def collect_outputs(folders, base):
+    """Returns {relative path: absolute path} of all files below the given folders."""
+    outputs = {}
+    for folder in folders:
+        for root, _, files in os.walk(folder):
+            for file in files:
+                path = os.path.join(root, file)
+                outputs[os.path.relpath(path, base).replace(os.sep, '/')] = path
+    return outputs
+
+
+def fingerprint(path):
+    """SHA-256 of a file plus, for images, a 16x16 grayscale thumbnail used for tolerance comparisons."""
+    with open(path, 'rb') as f:
+        result = {'sha256': hashlib.sha256(f.read()).hexdigest()}
+    if path.lower().endswith(IMAGE_EXTENSIONS):
+        with Image.open(path) as image:
+            result['size'] = list(image.size)
+            result['thumbnail'] = np.asarray(image.convert('L').resize((16, 16), Image.BOX)).ravel().tolist()
+    return result
+
+
+def bench_scalebar(collection, ids, work_dir):
+    scalebar = load_tool('scalebar')
+    timer = Timer()
+    folders = [os.path.join(collection, specimen_id) for specimen_id in ids]
+    pitches = [float(scalebar.extract_object_pixel_pitch(folder)) for folder in folders]
+
+    def run():
+        for folder in folders:
+            scalebar.process_specimen(folder, use_edof=False, verbose=False, **scalebar.DEFAULT_SCALEBAR_KWARGS)
+    run_instrumented(timer, run)
+    outputs = [os.path.join(folder, 'redof_scalebar') for folder in folders]
+    return timer, outputs, {'pixel_pitches': pitches}
+
+
+def bench_sharpen(collection, ids, work_dir):
+    sharpen = load_tool('sharpen')
+    kwargs = {key: config['default'] for key, config in sharpen.DEFAULT_SHARPENING_KWARGS.items()}
+    kwargs['verbose'] = False
+    timer = Timer()
+    folders = [os.path.join(collection, specimen_id) for specimen_id in ids]
+
+    def run():
+        for folder in folders:
+            sharpen.process_specimen(specimen_folder=folder, **kwargs)
+    run_instrumented(timer, run)
+    outputs = [os.path.join(folder, 'edof_sharpen') for folder in folders]
+    return timer, outputs, {}
+
+
+def bench_fetcher(collection, ids, work_dir):
+    fetch_dir = os.path.join(work_dir, 'fetch')
+    os.makedirs(fetch_dir)
+    id_list = os.path.join(fetch_dir, 'ids.txt')
+    with open(id_list, 'w') as f:
+        f.write("\n".join(ids) + "\n")
+    collection_nr = os.path.basename(collection).split('_')[0]
+    command = [sys.executable, tool_path('fetcher'), id_list, collection_nr, 'png', 'jpg', 'obj',
+               '--src_dir', os.path.dirname(collection)]
+    timer = Timer()
+    with timer.stage('end_to_end'):
+        subprocess.run(command, cwd=work_dir, check=True, stdout=subprocess.DEVNULL)
+    return timer, [os.path.join(fetch_dir, specimen_id) for specimen_id in ids], {}
+
+
+def bench_extract_images(collection, ids, work_dir):
+    extract = load_tool('extract_images')
+    output = os.path.join(work_dir, 'extracted')
+    os.makedirs(output)
+    timer = Timer()
+
+    def run():
+        for specimen_id in ids:
+            extract.extract_project(os.path.join(collection, specimen_id, 'redof', ''), os.path.join(output, f"{specimen_id}_"))
+    run_instrumented(timer, run)
+    return timer, [output], {}
+
+
+def bench_render_thumbnails(collection, ids, work_dir):
+    render = load_tool('render_thumbnails')
+    output = os.path.join(work_dir, 'thumbnails')
+    os.makedirs(output)
+    timer = Timer()
+
+    def run():
+        for specimen_id in ids:
+            render.render_project(os.path.join(collection, specimen_id), output, size=256, image_format='png')
+    run_instrumented(timer, run)
+    return timer, [output], {}
+
+
+def bench_image_io(collection, ids, work_dir):
+    image_io = load_tool('image_io')
+    timer = Timer()
+    folders = [os.path.join(collection, specimen_id, 'redof') for specimen_id in ids]
+    for folder in folders:
+        for filename in image_files(folder):
+            with open(os.path.join(folder, filename), 'rb') as f:
+                data = f.read()
+            for backend in image_io.BACKENDS:
+                with timer.stage(f'decode_{backend}'):
+                    image = image_io.read_image(io.BytesIO(data), 'RGB', backend=backend)
+                with timer.stage(f'decode_{backend}_quarter'):
+                    image_io.read_image(io.BytesIO(data), 'RGB', (image.width // 4, image.height // 4), backend)
+            for level in (3, 6):
+                with timer.stage(f'encode_png_{level}'):
+                    image.save(io.BytesIO(), format='PNG', compress_level=level)
+    return timer, [], {}
+
+
+BENCHMARKS = {
+    'scalebar': bench_scalebar,
+    'sharpen': bench_sharpen,
+    'fetcher': bench_fetcher,
+    'extract_images': bench_extract_images,
+    'render_thumbnails': bench_render_thumbnails,
+    'image_io': bench_image_io,
+}
+
+
+def compare_golden(golden, outputs, tolerance):
+    """Returns a list of differences between the golden fingerprints and the current outputs."""
+    problems = []
+    for name in sorted(set(golden) | set(outputs)):
+        if name not in outputs:
+            problems.append(f"missing output {name}")
+        elif name not in golden:
+            problems.append(f"unexpected output {name}")
+        elif golden[name]['sha256'] != outputs[name]['sha256']:
+            expected, actual = golden[name].get('thumbnail'), outputs[name].get('thumbnail')
+            if expected is None or actual is None or golden[name]['size'] != outputs[name]['size']:
+                problems.append(f"{name} differs")
+            else:
+                difference = max(abs(a - b) for a, b in zip(expected, actual))
+                if difference > tolerance:
+                    problems.append(f"{name} differs by {difference} gray levels")
+    return problems
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_comparison(result, previous):
+    print(f"\n{'benchmark':<20}{'stage':<14}{'previous [s]':>14}{'current [s]':>14}{'ratio':>8}")
+    for name, bench in result['benchmarks'].items():
+        for stage, seconds in bench['stages'].items():
+            before = previous.get('benchmarks', {}).get(name, {}).get('stages', {}).get(stage)
+            ratio = f"{seconds / before:.2f}" if before else '-'
+            before = f"{before:.3f}" if before is not None else '-'
+            print(f"{name:<20}{stage:<14}{before:>14}{seconds:>14.3f}{ratio:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the collection tools on a generated fake collection.")
+    parser.add_argument('benchmarks', nargs='*', default=[],
+                        help=f"Benchmarks to run: {', '.join(BENCHMARKS)} (default: all).")
+    parser.add_argument('-n', '--specimens', type=int, default=5, help="Number of specimens.")
+    parser.add_argument('--edof', type=int, default=4, help="edof images per specimen.")
+    parser.add_argument('--redof', type=int, default=12, help="redof images per specimen.")
+    parser.add_argument('--width', type=int, default=2000, help="Image width.")
+    parser.add_argument('--height', type=int, default=1500, help="Image height.")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed of the collection.")
+    parser.add_argument('--results', default=RESULTS_FOLDER, help="Folder the result JSON files are written to.")
+    parser.add_argument('--compare', help="Previous result JSON file to compare the timings with.")
+    parser.add_argument('--update-golden', action='store_true', help="Store the current outputs as the golden outputs.")
+    parser.add_argument('--tolerance', type=float, default=0, help="Allowed gray level difference of image outputs.")
+    parser.add_argument('--keep', action='store_true', help="Keep the generated collection and outputs.")
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown benchmark(s) {', '.join(unknown)}. Choose from {', '.join(BENCHMARKS)}.")
+
+    params = {key: getattr(args, key) for key in ('specimens', 'edof', 'redof', 'width', 'height', 'seed')}
+    names = args.benchmarks or list(BENCHMARKS)
+    work_dir = tempfile.mkdtemp(prefix='ord_benchmark_')
+    result = {'commit': git_commit(), 'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(), 'platform': platform.platform(), 'params': params, 'benchmarks': {}}
+    golden_path = os.path.join(args.results, 'golden_{}.json'.format(
+        hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]))
+    golden = {}
+    if os.path.exists(golden_path):
+        with open(golden_path) as f:
+            golden = json.load(f)
+    failed = False
+
+    try:
+        print(f"Generating collection in {work_dir} ...")
+        start = time.perf_counter()
+        root = os.path.join(work_dir, 'archive')
+        ids = make_collection(root, args.specimens, args.edof, args.redof, args.width, args.height, seed=args.seed)
+        collection = os.path.join(root, DEFAULT_COLLECTION)
+        print(f"Generated {len(ids)} specimens in {time.perf_counter() - start:.1f} s")
+
+        for name in names:
+            bench_dir = os.path.join(work_dir, name)
+            os.makedirs(bench_dir)
+            timer, output_folders, extra = BENCHMARKS[name](collection, ids, bench_dir)
+            # Paths relative to the work folder, so the goldens don't depend on the temporary folder name
+            outputs = {path: fingerprint(absolute) for path, absolute in collect_outputs(output_folders, work_dir).items()}
+            result['benchmarks'][name] = {'stages': {stage: round(seconds, 4) for stage, seconds in timer.stages.items()},
+                                          'outputs': len(outputs), **extra}
+            if args.update_golden:
+                golden[name] = outputs
+            elif name in golden:
+                problems = compare_golden(golden[name], outputs, args.tolerance)
+                result['benchmarks'][name]['golden'] = 'ok' if not problems else problems
+                failed |= bool(problems)
+            # Derived outputs are written into the specimen folders, remove them for the next benchmark
+            for folder in output_folders:
+                if folder.startswith(collection):
+                    shutil.rmtree(folder, ignore_errors=True)
+            golden_status = result['benchmarks'][name].get('golden', '-')
+            stages = ", ".join(f"{stage} {seconds:.3f} s" for stage, seconds in timer.stages.items())
+            print(f"{name}: {stages} [golden: {'differs' if isinstance(golden_status, list) else golden_status}]")
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    os.makedirs(args.results, exist_ok=True)
+    result_path = os.path.join(args.results, f"{datetime.datetime.now():%Y%m%d-%H%M%S}_{result['commit']}.json")
+    with open(result_path, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to {result_path}")
+    if args.update_golden:
+        with open(golden_path, 'w') as f:
+            json.dump(golden, f)
+        print(f"Golden outputs written to {golden_path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(result, json.load(f))
+    if failed:
+        for name, bench in result['benchmarks'].items():
+            if isinstance(bench.get('golden'), list):
+                print(f"{name}: " + "; ".join(bench['golden']))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,417 @@
+import argparse
+import concurrent.futures
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '00 Common'))
+from image_io import IMAGE_EXTENSIONS
+from tools import load_tool
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+####
+# Settings
+####
+# Processed scans, containing the collection folders with the specimen folders
+watch_root = 'Z:\\01_SCANNED_AND_PROCESSED\\02 FINAL'
+# Persistent job queue, survives restarts of the watcher
+queue_path = 'watcher_queue.sqlite'
+# Stages run for every new specimen, in this order (see STAGES)
+stages = ['sharpen', 'scalebar', 'thumbnail']
+# A specimen is processed once its input files didn't change for this many seconds
+settle_seconds = 300
+# Seconds between scans of the whole archive (with inotify only to catch missed events)
+poll_interval = 60
+rescan_interval = 900
+# Number of specimens processed in parallel
+workers = 2
+# Failed stages are retried this often, waiting retry_delay * attempt seconds in between
+max_attempts = 3
+retry_delay = 600
+# Folder for the rendered thumbnails (None: <specimen>/thumbnails)
+thumbnail_folder = None
+
+logger = logging.getLogger('watcher')
+
+
+def _count_images(folder):
+    """Number of images in folder (not reports like sharpness_report.csv), -1 if it doesn't exist."""
+    try:
+        return sum(file.lower().endswith(IMAGE_EXTENSIONS) for file in os.listdir(folder))
+    except OSError:
+        return -1
+
+
+def _image_input_folder(specimen_folder, use_edof):
+    """Returns the folder the sharpen/scalebar tools read, with their fallback from edof to redof and back."""
+    folder = os.path.join(specimen_folder, "edof" if use_edof else "redof")
+    if not os.path.exists(folder):
+        folder = os.path.join(specimen_folder, "redof" if use_edof else "edof")
+    return folder
+
+
+def stage_sharpen(specimen_folder):
+    sharpen = load_tool('sharpen')
+    kwargs = {key: config['default'] for key, config in sharpen.DEFAULT_SHARPENING_KWARGS.items()}
+    kwargs['verbose'] = False
+    input_folder = _image_input_folder(specimen_folder, kwargs['use_edof'])
+    if _count_images(input_folder + '_sharpen') >= _count_images(input_folder):
+        return 'skipped'
+    sharpen.process_specimen(specimen_folder=specimen_folder, **kwargs)
+    return 'done'
+
+
+def stage_scalebar(specimen_folder):
+    scalebar = load_tool('scalebar')
+    input_folder = _image_input_folder(specimen_folder, False)
+    if _count_images(input_folder + '_scalebar') >= _count_images(input_folder):
+        return 'skipped'
+    scalebar.process_specimen(specimen_folder, use_edof=False, verbose=False, **scalebar.DEFAULT_SCALEBAR_KWARGS)
+    return 'done'
+
+
+def stage_thumbnail(specimen_folder):
+    render_thumbnails = load_tool('render_thumbnails')
+    output_folder = thumbnail_folder or os.path.join(specimen_folder, 'thumbnails')
+    os.makedirs(output_folder, exist_ok=True)
+    written = render_thumbnails.render_project(specimen_folder, output_folder, skip_existing=True, background='gradient')
+    return 'done' if written else 'skipped'
+
+
+def stage_reorient(specimen_folder):
+    reorient_obj = load_tool('reorient_obj')
+    name = os.path.basename(os.path.normpath(specimen_folder))
+    obj_path = os.path.join(specimen_folder, 'Model', name + '.obj')
+    glb_path = os.path.join(specimen_folder, 'Model', name + '.glb')
+    if os.path.exists(glb_path) and os.path.getmtime(glb_path) >= os.path.getmtime(obj_path):
+        return 'skipped'
+    reorient_obj.process_obj(obj_path, ['glb'], reorient_obj.forward_axis, reorient_obj.up_axis)
+    return 'done'
+
+
+STAGES = {
+    'reorient': stage_reorient,
+    'sharpen': stage_sharpen,
+    'scalebar': stage_scalebar,
+    'thumbnail': stage_thumbnail,
+}
+
+
+def _init_worker():
+    # The tools show tqdm bars per specimen, which only clutter the log of the watcher
+    os.environ['TQDM_DISABLE'] = '1'
+
+
+def run_stage(stage, specimen_folder):
+    """Runs one stage on one specimen in a worker process and returns its result ('done' or 'skipped')."""
+    return STAGES[stage](specimen_folder)
+
+
+def input_signature(specimen_folder):
+    """
+    Summarizes the inputs of a specimen (edof/redof images, ScanInformation.pdf, Model OBJ/MTL/texture)
+    as count, total size and newest modification time. Outputs written by the stages (e.g. edof_sharpen,
+    the GLB) are not part of it, so processing a specimen doesn't trigger it again.
+
+    Returns:
+        str: The signature, or None if the specimen is not complete yet (no PDF or no images).
+    """
+    name = os.path.basename(os.path.normpath(specimen_folder))
+    files = [os.path.join(specimen_folder, 'ScanInformation.pdf')]
+    files += [os.path.join(specimen_folder, 'Model', name + extension) for extension in ('.obj', '.mtl', '.png')]
+    image_count = 0
+    for folder in ('edof', 'redof'):
+        try:
+            entries = list(os.scandir(os.path.join(specimen_folder, folder)))
+        except OSError:
+            continue
+        image_count += len(entries)
+        files += [entry.path for entry in entries]
+
+    count, size, newest = 0, 0, 0.0
+    for path in files:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        count += 1
+        size += stat.st_size
+        newest = max(newest, stat.st_mtime)
+    if not image_count or not os.path.exists(files[0]):
+        return None
+    return f"{count}:{size}:{newest:.3f}"
+
+
+def folder_mtimes(specimen_folder):
+    """Modification times of a specimen folder and its input folders, a cheap first check for changes."""
+    mtimes = []
+    for folder in ('', 'edof', 'redof', 'Model'):
+        try:
+            mtimes.append(os.stat(os.path.join(specimen_folder, folder)).st_mtime)
+        except OSError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+
+def find_specimen_folders(root):
+    """Returns all <root>/<collection>/<specimen> folders."""
+    folders = []
+    for collection in os.scandir(root):
+        if collection.is_dir():
+            try:
+                folders.extend(entry.path for entry in os.scandir(collection.path) if entry.is_dir())
+            except OSError:
+                continue
+    return folders
+
+
+class JobQueue:
+    """
+    SQLite queue with one job per specimen. A job runs its stages one after another and remembers
+    the finished stages, so after a restart or a failure it continues with the next stage.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                folder TEXT PRIMARY KEY,
+                signature TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stages_done TEXT NOT NULL DEFAULT '',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                not_before REAL NOT NULL DEFAULT 0,
+                enqueued_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, enqueued_at);
+        """)
+        # Jobs that were running when the watcher stopped are started again
+        self.connection.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running'")
+        self.connection.commit()
+
+    def signature(self, folder):
+        row = self.connection.execute('SELECT signature FROM jobs WHERE folder = ?', (folder,)).fetchone()
+        return row['signature'] if row else None
+
+    def is_empty(self):
+        return self.connection.execute('SELECT COUNT(*) FROM jobs').fetchone()[0] == 0
+
+    def record(self, folder, signature):
+        """Stores a specimen as already processed, without running the stages."""
+        now = time.time()
+        self.connection.execute("INSERT OR IGNORE INTO jobs (folder, signature, status, enqueued_at, updated_at) "
+                                "VALUES (?, ?, 'existing', ?, ?)", (folder, signature, now, now))
+
+    def enqueue(self, folder, signature):
+        """Adds a specimen, or restarts all stages if its inputs changed since it was enqueued."""
+        now = time.time()
+        self.connection.execute(
+            "INSERT INTO jobs (folder, signature, status, enqueued_at, updated_at) VALUES (?, ?, 'pending', ?, ?) "
+            "ON CONFLICT(folder) DO UPDATE SET signature = excluded.signature, status = 'pending', stages_done = '', "
+            "attempts = 0, error = NULL, not_before = 0, enqueued_at = excluded.enqueued_at, updated_at = excluded.updated_at",
+            (folder, signature, now, now))
+        self.connection.commit()
+
+    def next_jobs(self, limit, exclude):
+        """Returns up to limit pending jobs that may run now, oldest first."""
+        rows = self.connection.execute(
+            "SELECT * FROM jobs WHERE status = 'pending' AND not_before <= ? ORDER BY enqueued_at",
+            (time.time(),)).fetchall()
+        return [row for row in rows if row['folder'] not in exclude][:limit]
+
+    def update(self, folder, **values):
+        values['updated_at'] = time.time()
+        assignments = ', '.join(f"{column} = ?" for column in values)
+        self.connection.execute(f"UPDATE jobs SET {assignments} WHERE folder = ?", (*values.values(), folder))
+        self.connection.commit()
+
+    def counts(self):
+        return dict(self.connection.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+
+class _ChangeHandler(FileSystemEventHandler if Observer else object):
+    """Marks the specimen folder of every file system event as changed."""
+
+    def __init__(self, root, changed, lock):
+        self.root = os.path.abspath(root)
+        self.changed = changed
+        self.lock = lock
+
+    def on_any_event(self, event):
+        relative = os.path.relpath(os.path.abspath(event.src_path), self.root).split(os.sep)
+        if len(relative) >= 2 and relative[0] != '..':
+            with self.lock:
+                self.changed.add(os.path.join(self.root, relative[0], relative[1]))
+
+
+class Watcher:
+    """
+    Watches the archive, waits until new or changed specimens are complete and runs the stages
+    on them in a process pool.
+    """
+
+    def __init__(self, root, queue, stage_names, worker_count, use_inotify=True):
+        self.root = os.path.abspath(root)
+        self.queue = queue
+        self.stage_names = stage_names
+        self.worker_count = worker_count
+        # folder: (signature, time the signature was first seen)
+        self.candidates = {}
+        # folder: folder_mtimes() of the last scan
+        self.mtimes = {}
+        self.changed = set()
+        self.lock = threading.Lock()
+        self.running = {}
+        self.observer = None
+        if use_inotify and Observer is not None:
+            self.observer = Observer()
+            self.observer.schedule(_ChangeHandler(self.root, self.changed, self.lock), self.root, recursive=True)
+
+    def record_existing(self):
+        """Stores all complete specimens of the archive as processed, so only new ones are processed."""
+        folders = find_specimen_folders(self.root)
+        for folder in folders:
+            self.mtimes[folder] = folder_mtimes(folder)
+            signature = input_signature(folder)
+            if signature is not None:
+                self.queue.record(folder, signature)
+        self.queue.connection.commit()
+        logger.info(f"Recorded {len(folders)} existing specimens as processed")
+
+    def scan(self):
+        """Returns the specimen folders whose folder modification times changed since the last scan."""
+        changed = []
+        for folder in find_specimen_folders(self.root):
+            mtimes = folder_mtimes(folder)
+            if self.mtimes.get(folder) != mtimes:
+                self.mtimes[folder] = mtimes
+                changed.append(folder)
+        return changed
+
+    def check(self, folders):
+        """Updates the signatures of folders and enqueues the ones that settled."""
+        now = time.time()
+        for folder in folders:
+            signature = input_signature(folder)
+            if signature is None:
+                self.candidates.pop(folder, None)
+                continue
+            previous = self.candidates.get(folder)
+            if previous is None or previous[0] != signature:
+                self.candidates[folder] = (signature, now)
+        for folder, (signature, since) in list(self.candidates.items()):
+            if now - since < settle_seconds:
+                continue
+            del self.candidates[folder]
+            if self.queue.signature(folder) != signature:
+                logger.info(f"Enqueued {folder}")
+                self.queue.enqueue(folder, signature)
+
+    def dispatch(self, pool):
+        """Collects finished stages and starts the next stage of pending jobs."""
+        for future, (folder, stage) in list(self.running.items()):
+            if not future.done():
+                continue
+            del self.running[future]
+            job = self.queue.connection.execute('SELECT * FROM jobs WHERE folder = ?', (folder,)).fetchone()
+            try:
+                result = future.result()
+            except Exception as error:
+                attempts = job['attempts'] + 1
+                status = 'failed' if attempts >= max_attempts else 'pending'
+                logger.error(f"{stage} failed for {folder} (attempt {attempts}): {error!r}")
+                self.queue.update(folder, status=status, attempts=attempts, error=f"{stage}: {error!r}",
+                                  not_before=time.time() + retry_delay * attempts)
+                continue
+            stages_done = [name for name in job['stages_done'].split(',') if name] + [stage]
+            finished = all(name in stages_done for name in self.stage_names)
+            logger.info(f"{stage} {result} for {folder}")
+            self.queue.update(folder, stages_done=','.join(stages_done), status='done' if finished else 'pending')
+
+        busy = {folder for folder, _ in self.running.values()}
+        for job in self.queue.next_jobs(self.worker_count - len(self.running), busy):
+            stages_done = job['stages_done'].split(',')
+            remaining = [name for name in self.stage_names if name not in stages_done]
+            if not remaining:
+                # Finished all stages of this run already (e.g. pending again after a restart with fewer stages)
+                self.queue.update(job['folder'], status='done')
+                continue
+            stage = remaining[0]
+            self.queue.update(job['folder'], status='running')
+            self.running[pool.submit(run_stage, stage, job['folder'])] = (job['folder'], stage)
+
+    def run(self, backfill=False):
+        """
+        Runs until interrupted with Ctrl+C.
+
+        Parameters:
+            backfill (bool): With a new queue, also process the specimens that already exist.
+        """
+        logger.info(f"Watching {self.root} ({'inotify' if self.observer else 'polling'}), stages: {', '.join(self.stage_names)}")
+        if self.queue.is_empty() and not backfill:
+            self.record_existing()
+        if self.observer:
+            self.observer.start()
+        last_scan = 0.0
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.worker_count, initializer=_init_worker) as pool:
+            try:
+                while True:
+                    with self.lock:
+                        folders = list(self.changed)
+                        self.changed.clear()
+                    if time.time() - last_scan >= (rescan_interval if self.observer else poll_interval):
+                        folders += self.scan()
+                        last_scan = time.time()
+                    # Specimens waiting to settle are checked again until their signature is stable
+                    self.check(set(folders) | set(self.candidates))
+                    self.dispatch(pool)
+                    time.sleep(1 if self.running or self.candidates else 5)
+            except KeyboardInterrupt:
+                logger.info("Stopping, running stages are finished first")
+            finally:
+                if self.observer:
+                    self.observer.stop()
+                    self.observer.join()
+
+
+def main():
+    global settle_seconds, poll_interval
+    parser = argparse.ArgumentParser(description="Watch the archive and process new specimens as they land.")
+    parser.add_argument('root', nargs='?', default=watch_root, help="Folder containing the collection folders.")
+    parser.add_argument('-q', '--queue', default=queue_path, help="Job queue database.")
+    parser.add_argument('-s', '--stages', nargs='+', default=stages, choices=list(STAGES), help="Stages to run, in this order.")
+    parser.add_argument('-w', '--workers', type=int, default=workers, help="Number of specimens processed in parallel.")
+    parser.add_argument('--settle', type=float, default=settle_seconds, help="Seconds without changes before a specimen is processed.")
+    parser.add_argument('--interval', type=float, default=poll_interval, help="Seconds between scans when polling.")
+    parser.add_argument('--poll', action='store_true', help="Poll instead of using inotify (e.g. for network shares).")
+    parser.add_argument('--backfill', action='store_true', help="With a new queue, also process the existing specimens.")
+    parser.add_argument('--status', action='store_true', help="Print the number of jobs per status and exit.")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s', level=logging.INFO)
+    settle_seconds, poll_interval = args.settle, args.interval
+    queue = JobQueue(args.queue)
+    if args.status:
+        for status, count in sorted(queue.counts().items()):
+            print(f"{status}: {count}")
+        for row in queue.connection.execute("SELECT folder, error FROM jobs WHERE status = 'failed'"):
+            print(f"failed: {row['folder']}: {row['error']}")
+        return
+    if not args.poll and Observer is None:
+        logger.warning("watchdog is not installed, polling the archive instead (pip install watchdog)")
+    Watcher(args.root, queue, args.stages, args.workers, use_inotify=not args.poll).run(backfill=args.backfill)
+
+
+if __name__ == '__main__':
+    main()
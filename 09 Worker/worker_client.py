@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+
+# Only the standard library is imported here, so the client starts instantly
+DEFAULT_URL = 'http://127.0.0.1:8765'
+
+
+def request(url, data=None):
+    """Sends a GET (or a POST with JSON data) request and returns the decoded JSON answer."""
+    body = json.dumps(data).encode('utf-8') if data is not None else None
+    http_request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(http_request) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        raise RuntimeError(json.loads(error.read()).get('error', str(error)))
+
+
+def resolve_specimen_folders(path):
+    """
+    Returns the absolute specimen folders for a single specimen folder, a parent directory of
+    specimen folders or a .txt/.csv file with folder paths (like the sharpen and scalebar tools).
+    """
+    if os.path.isdir(path):
+        if any(os.path.isdir(os.path.join(path, folder)) for folder in ('edof', 'redof')):
+            return [os.path.abspath(path)]
+        return sorted(os.path.abspath(os.path.join(path, subdir)) for subdir in os.listdir(path)
+                      if os.path.isdir(os.path.join(path, subdir)))
+    if path.endswith(('.txt', '.csv')):
+        base = os.path.dirname(os.path.abspath(path))
+        folders = []
+        with open(path, 'r') as file:
+            for line in file:
+                folders.extend(part.strip() for part in line.split(',') if part.strip())
+        # Relative paths are relative to the list, the server runs in another folder
+        return [os.path.abspath(os.path.join(base, folder)) for folder in folders]
+    raise ValueError(f"'{path}' is neither a folder nor a .txt/.csv file.")
+
+
+def parse_option(text):
+    """Parses key=value, the value as JSON if possible (numbers, true/false) and as string otherwise."""
+    key, _, value = text.partition('=')
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run sharpen/scalebar/extract jobs on the warm worker server.")
+    parser.add_argument('tool', choices=['sharpen', 'scalebar', 'extract', 'status', 'shutdown'], help="Tool to run.")
+    parser.add_argument('path', nargs='?', help="Specimen folder, parent folder or .txt/.csv list of specimen folders.")
+    parser.add_argument('-o', '--option', action='append', default=[], type=parse_option,
+                        help="Tool option as key=value, e.g. -o unsharp_radius=2 -o use_edof=false. Repeatable.")
+    parser.add_argument('--output', help="Output folder of 'extract' (default: next to the specimen folders).")
+    parser.add_argument('--url', default=os.environ.get('ORD_WORKER_URL', DEFAULT_URL), help="URL of the worker server.")
+    parser.add_argument('--no-wait', action='store_true', help="Only submit the job.")
+    args = parser.parse_args()
+
+    try:
+        if args.tool == 'status':
+            print(json.dumps(request(args.url + '/status'), indent=2))
+            return
+        if args.tool == 'shutdown':
+            request(args.url + '/shutdown', {})
+            return
+        if not args.path:
+            parser.error("A path is required.")
+        folders = resolve_specimen_folders(args.path)
+        if not folders:
+            raise ValueError(f"No specimen folders found in '{args.path}'.")
+        options = dict(args.option)
+        if args.output:
+            options['output_folder'] = os.path.abspath(args.output)
+        job = request(args.url + '/jobs', {'tool': args.tool, 'folders': folders, 'options': options})
+    except urllib.error.URLError as error:
+        sys.exit(f"The worker server at {args.url} is not reachable ({error.reason}). Start it with: python worker_server.py")
+    except (RuntimeError, ValueError) as error:
+        sys.exit(f"Error: {error}")
+
+    print(f"Job {job['id']}: {args.tool} on {job['total']} specimen folders")
+    if args.no_wait:
+        return
+    while job['status'] != 'finished':
+        time.sleep(0.5)
+        job = request(f"{args.url}/jobs/{job['id']}")
+        print(f"\r{job['done']}/{job['total']} specimen folders", end='', flush=True)
+    print(f"\nFinished in {job['finished'] - job['submitted']:.1f} s")
+    for error in job['errors']:
+        print(f"Failed: {error['folder']}: {error['error']}")
+    if job['errors']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import concurrent.futures
+import itertools
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '00 Common'))
+from tools import load_tool
+
+####
+# Settings
+####
+host = '127.0.0.1'  # Only accept jobs from this computer
+port = 8765
+workers = os.cpu_count()
+
+# Tools loaded by every worker process when the server starts
+WARM_TOOLS = ['sharpen', 'scalebar', 'extract_images']
+# Same positions and names as in extract_images.py
+EXTRACT_REF_VALUES = [(0, 180), (-50, 30), (50, 120)]
+EXTRACT_REF_STRINGS = ['side_image', 'bottom_image', 'top_image']
+
+
+def _warm_up():
+    """Initializer of the worker processes: imports the tools and the libraries they import lazily."""
+    # The progress is reported by the client, the tqdm bars of the tools would only end up in the server log
+    os.environ['TQDM_DISABLE'] = '1'
+    for name in WARM_TOOLS:
+        load_tool(name)
+    import cv2  # noqa: F401 (imported by the sharpen filters on first use)
+    import numpy  # noqa: F401
+    import PyPDF2  # noqa: F401 (imported by the scalebar tool on first use)
+
+
+def _ping():
+    # Busy for a moment, so the pool starts a new process for every ping instead of reusing an idle one
+    time.sleep(0.2)
+    return os.getpid()
+
+
+def task_sharpen(specimen_folder, options):
+    sharpen = load_tool('sharpen')
+    kwargs = {key: config['default'] for key, config in sharpen.DEFAULT_SHARPENING_KWARGS.items()}
+    kwargs.update(options)
+    kwargs['verbose'] = False
+    sharpen.process_specimen(specimen_folder=specimen_folder, **kwargs)
+
+
+def task_scalebar(specimen_folder, options):
+    scalebar = load_tool('scalebar')
+    kwargs = dict(scalebar.DEFAULT_SCALEBAR_KWARGS)
+    kwargs.update(options)
+    use_edof = kwargs.pop('use_edof', False)
+    kwargs.pop('verbose', None)
+    scalebar.process_specimen(specimen_folder, use_edof=use_edof, verbose=False, **kwargs)
+
+
+def task_extract(specimen_folder, options):
+    extract_images = load_tool('extract_images')
+    output_folder = options.get('output_folder') or os.path.dirname(os.path.normpath(specimen_folder))
+    os.makedirs(output_folder, exist_ok=True)
+    project = os.path.basename(os.path.normpath(specimen_folder))
+    images = extract_images.extract_images(os.path.join(specimen_folder, 'redof', ''), options.get('ref_values', EXTRACT_REF_VALUES))
+    for ref_string, image in zip(EXTRACT_REF_STRINGS, images):
+        shutil.copy(image, os.path.join(output_folder, project + "_" + ref_string + ".jpg"))
+
+
+TASKS = {
+    'sharpen': task_sharpen,
+    'scalebar': task_scalebar,
+    'extract': task_extract,
+}
+
+
+class JobManager:
+    """Splits jobs into one task per specimen folder and runs them in the warm process pool."""
+
+    def __init__(self, worker_count):
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=worker_count, initializer=_warm_up)
+        self.worker_count = worker_count
+        self.jobs = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def warm_up(self):
+        """Starts all worker processes now, so the first job doesn't pay for their startup."""
+        start = time.perf_counter()
+        futures = [self.pool.submit(_ping) for _ in range(self.worker_count)]
+        processes = {future.result() for future in futures}
+        print(f"{len(processes)} worker processes ready after {time.perf_counter() - start:.1f} s")
+
+    def submit(self, tool, folders, options):
+        if tool not in TASKS:
+            raise ValueError(f"Unknown tool '{tool}'. Choose from {', '.join(TASKS)}.")
+        if not folders:
+            raise ValueError("No specimen folders given.")
+        with self.lock:
+            job_id = str(next(self.ids))
+            job = {'id': job_id, 'tool': tool, 'total': len(folders), 'done': 0, 'errors': [],
+                   'status': 'running', 'submitted': time.time(), 'finished': None}
+            self.jobs[job_id] = job
+        for folder in folders:
+            future = self.pool.submit(TASKS[tool], folder, options)
+            future.add_done_callback(lambda future, folder=folder: self._task_done(job, folder, future))
+        return job
+
+    def _task_done(self, job, folder, future):
+        with self.lock:
+            job['done'] += 1
+            if future.exception() is not None:
+                job['errors'].append({'folder': folder, 'error': repr(future.exception())})
+            if job['done'] == job['total']:
+                job['status'] = 'finished'
+                job['finished'] = time.time()
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job, errors=list(job['errors'])) if job else None
+
+    def status(self):
+        with self.lock:
+            running = sum(job['status'] == 'running' for job in self.jobs.values())
+        return {'pid': os.getpid(), 'workers': self.worker_count, 'tools': list(TASKS), 'jobs': len(self.jobs),
+                'running_jobs': running}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    manager = None
+
+    def _send(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/status':
+            self._send(200, self.manager.status())
+        elif self.path.startswith('/jobs/'):
+            job = self.manager.get(self.path[len('/jobs/'):])
+            if job:
+                self._send(200, job)
+            else:
+                self._send(404, {'error': 'Unknown job'})
+        else:
+            self._send(404, {'error': 'Unknown path'})
+
+    def do_POST(self):
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except ValueError:
+            self._send(400, {'error': 'Invalid JSON'})
+            return
+        if self.path == '/jobs':
+            try:
+                job = self.manager.submit(request.get('tool'), request.get('folders', []), request.get('options', {}))
+            except ValueError as error:
+                self._send(400, {'error': str(error)})
+                return
+            self._send(202, job)
+        elif self.path == '/shutdown':
+            self._send(200, {'status': 'shutting down'})
+            threading.Thread(target=self.server.shutdown).start()
+        else:
+            self._send(404, {'error': 'Unknown path'})
+
+    def log_message(self, format, *args):
+        # Job submissions are printed, the status polling of the clients is not
+        if self.command == 'POST':
+            super().log_message(format, *args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the sharpen/scalebar/extract tools loaded and run jobs from worker_client.py.")
+    parser.add_argument('--host', default=host, help="Host to listen on.")
+    parser.add_argument('--port', type=int, default=port, help="Port to listen on.")
+    parser.add_argument('-w', '--workers', type=int, default=workers, help="Number of worker processes.")
+    args = parser.parse_args()
+
+    manager = JobManager(args.workers)
+    manager.warm_up()
+    RequestHandler.manager = manager
+    server = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+    print(f"Worker server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        manager.pool.shutdown(cancel_futures=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+import argparse
+import concurrent.futures
+import math
+import os
+import shutil
+import sys
+import warnings
+
+from PIL import Image
+from tqdm.auto import tqdm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '00 Common'))
+import image_io
+import instrumentation
+import io_scheduler
+from catalog import open_catalog
+from tools import load_tool
+
+####
+# Settings
+####
+# Tile size without overlap and overlap in pixels, the defaults of OpenSeadragon/deepzoom
+tile_size = 254
+overlap = 1
+tile_format = 'jpg'
+jpeg_quality = 90
+# Number of images tiled in parallel
+workers = os.cpu_count()
+
+VALID_EXTENSIONS = (".jpeg", ".jpg", ".png", ".bmp", ".tiff", ".gif")
+DZI_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{format}" Overlap="{overlap}" TileSize="{tile_size}">\n'
+    '  <Size Width="{width}" Height="{height}"/>\n'
+    '</Image>\n'
+)
+
+
+def find_specimen_folders(path):
+    """
+    Returns the specimen folders for a single specimen folder, a parent directory of specimen
+    folders or a .txt/.csv file with folder paths (like the sharpen and scalebar tools).
+    """
+    if os.path.isdir(path):
+        if any(os.path.isdir(os.path.join(path, folder)) for folder in ('edof', 'redof')):
+            return [path]
+        return sorted(os.path.join(path, subdir) for subdir in os.listdir(path) if os.path.isdir(os.path.join(path, subdir)))
+    folders = []
+    with open(path, 'r') as file:
+        for line in file:
+            folders.extend(part.strip() for part in line.split(',') if part.strip())
+    return folders
+
+
+def image_input_folder(specimen_folder, use_edof):
+    """Returns the edof (or redof) folder of a specimen, with the same fallback as the sharpen and scalebar tools."""
+    input_folder = os.path.join(specimen_folder, "edof" if use_edof else "redof")
+    if not os.path.exists(input_folder):
+        input_folder = os.path.join(specimen_folder, "redof" if use_edof else "edof")
+    return input_folder if os.path.exists(input_folder) else None
+
+
+def level_count(width, height):
+    """Number of pyramid levels, level 0 is 1x1 pixels and the last level has the full size."""
+    return int(math.ceil(math.log2(max(width, height)))) + 1
+
+
+def save_level_tiles(image, level_folder, tile_size, overlap, tile_format, jpeg_quality):
+    """Cuts one pyramid level into tiles named <column>_<row>.<format>, returns the number of tiles."""
+    os.makedirs(level_folder, exist_ok=True)
+    width, height = image.size
+    columns = int(math.ceil(width / tile_size))
+    rows = int(math.ceil(height / tile_size))
+    for column in range(columns):
+        for row in range(rows):
+            box = (max(0, column * tile_size - overlap), max(0, row * tile_size - overlap),
+                   min(width, (column + 1) * tile_size + overlap), min(height, (row + 1) * tile_size + overlap))
+            tile_path = os.path.join(level_folder, f"{column}_{row}.{tile_format}")
+            if tile_format == 'jpg':
+                image.crop(box).save(tile_path, quality=jpeg_quality)
+            else:
+                image.crop(box).save(tile_path)
+    return columns * rows
+
+
+def make_pyramid(image_path, dzi_path, tile_size=tile_size, overlap=overlap, tile_format=tile_format,
+                 jpeg_quality=jpeg_quality, scalebar_length=None, scalebar_kwargs=None):
+    """
+    Writes the Deep Zoom pyramid of an image: <name>.dzi and the tiles in <name>_files/<level>/.
+    Every level is downsampled from the next larger level, not from the full image. The .dzi
+    file is written last, so an interrupted pyramid is recognised as missing and redone.
+
+    Parameters:
+        image_path (str): Full resolution image.
+        dzi_path (str): Path of the .dzi file to write.
+        scalebar_length (int): Length of a 1 mm scalebar in pixels to draw into the full resolution
+            level (None for no scalebar).
+        scalebar_kwargs (dict): Position, size and font of the scalebar (see add_scalebars_new.py).
+
+    Returns:
+        int: Number of tiles written.
+    """
+    with instrumentation.span('decode'):
+        with io_scheduler.open_file(image_path) as image_file:
+            image = image_io.read_image(image_file)
+    if tile_format == 'jpg' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    if scalebar_length:
+        load_tool('scalebar').draw_scalebar(image, scalebar_length, **(scalebar_kwargs or {}))
+
+    tiles_folder = dzi_path[:-len('.dzi')] + '_files'
+    # Tiles of an older pyramid (e.g. another tile size) must not stay next to the new ones
+    shutil.rmtree(tiles_folder, ignore_errors=True)
+    width, height = image.size
+    tile_count = 0
+    level = image
+    for level_index in reversed(range(level_count(width, height))):
+        with instrumentation.span('tile', level=level_index):
+            tile_count += save_level_tiles(level, os.path.join(tiles_folder, str(level_index)), tile_size, overlap,
+                                           tile_format, jpeg_quality)
+        if level_index:
+            with instrumentation.span('downsample'):
+                level = level.resize((max(1, (level.width + 1) // 2), max(1, (level.height + 1) // 2)), Image.LANCZOS)
+
+    with open(dzi_path, 'w', encoding='utf-8') as dzi_file:
+        dzi_file.write(DZI_TEMPLATE.format(format=tile_format, overlap=overlap, tile_size=tile_size, width=width, height=height))
+    return tile_count
+
+
+def is_up_to_date(image_path, dzi_path):
+    """A pyramid is up to date if its .dzi file exists and is newer than the image."""
+    return os.path.exists(dzi_path) and os.path.getmtime(dzi_path) >= os.path.getmtime(image_path)
+
+
+def collect_images(specimen_folder, use_edof, with_scalebar, specimen_catalog=None, force=False):
+    """
+    Returns the (image_path, dzi_path, scalebar_length) of all images of a specimen that need a new pyramid.
+    The pyramids are written to <input folder>_dzi (or <input folder>_scalebar_dzi) in the specimen folder.
+    """
+    input_folder = image_input_folder(specimen_folder, use_edof)
+    if input_folder is None:
+        warnings.warn(f"'{specimen_folder}' doesn't contain an `edof` or `redof` folder. Skipping this specimen folder.")
+        return []
+    suffix = '_scalebar_dzi' if with_scalebar else '_dzi'
+    output_folder = os.path.join(specimen_folder, os.path.basename(input_folder) + suffix)
+
+    jobs = []
+    scalebar_length = None
+    for filename in sorted(os.listdir(input_folder)):
+        if not filename.lower().endswith(VALID_EXTENSIONS):
+            continue
+        image_path = os.path.join(input_folder, filename)
+        dzi_path = os.path.join(output_folder, os.path.splitext(filename)[0] + '.dzi')
+        if not force and is_up_to_date(image_path, dzi_path):
+            continue
+        if with_scalebar and scalebar_length is None:
+            # Pixel pitch from the catalog, or from ScanInformation.pdf like the scalebar tool
+            pitch = specimen_catalog.pixel_pitch(specimen_folder) if specimen_catalog else None
+            if pitch is None:
+                pitch = load_tool('scalebar').extract_object_pixel_pitch(specimen_folder)
+            try:
+                scalebar_length = int(1000 / float(pitch))
+            except (ValueError, ZeroDivisionError):
+                # extract_object_pixel_pitch returns the error message if the PDF is missing or unreadable
+                warnings.warn(f"No pixel pitch for '{specimen_folder}' ({pitch}). Skipping this specimen folder.")
+                return []
+        jobs.append((image_path, dzi_path, scalebar_length))
+    if jobs:
+        os.makedirs(output_folder, exist_ok=True)
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate Deep Zoom (DZI) tile pyramids of the edof/redof images of specimens.")
+    parser.add_argument('path', help="Specimen folder, parent folder of specimen folders or .txt/.csv list of specimen folders.")
+    parser.add_argument('--redof', action='store_true', help="Tile the redof images instead of the edof images.")
+    parser.add_argument('--scalebar', action='store_true', help="Draw a 1 mm scalebar into the full resolution level.")
+    parser.add_argument('--tile-size', type=int, default=tile_size, help="Tile size in pixels, without the overlap.")
+    parser.add_argument('--overlap', type=int, default=overlap, help="Overlap of neighbouring tiles in pixels.")
+    parser.add_argument('--format', choices=['jpg', 'png'], default=tile_format, help="Tile image format.")
+    parser.add_argument('--quality', type=int, default=jpeg_quality, help="JPEG quality of the tiles.")
+    parser.add_argument('-w', '--workers', type=int, default=workers, help="Number of images tiled in parallel.")
+    parser.add_argument('--force', action='store_true', help="Also redo pyramids that are newer than their image.")
+    args = parser.parse_args()
+
+    # Records stage timings if ORD_TRACE/ORD_PROFILE/ORD_SUMMARY is set (only with -w 1, the workers aren't traced)
+    instrumentation.start('make_tiles')
+    # Specimen catalog given in ORD_CATALOG, if any
+    specimen_catalog = open_catalog()
+
+    jobs = []
+    for folder in find_specimen_folders(args.path):
+        jobs.extend(collect_images(folder, not args.redof, args.scalebar, specimen_catalog, args.force))
+    print(f"{len(jobs)} images to tile")
+
+    scalebar_kwargs = dict(load_tool('scalebar').DEFAULT_SCALEBAR_KWARGS) if args.scalebar else None
+    options = dict(tile_size=args.tile_size, overlap=args.overlap, tile_format=args.format, jpeg_quality=args.quality,
+                   scalebar_kwargs=scalebar_kwargs)
+    failed = 0
+    tile_count = 0
+    if args.workers <= 1:
+        for image_path, dzi_path, scalebar_length in tqdm(jobs, desc="Tiling images", unit="image"):
+            try:
+                tile_count += make_pyramid(image_path, dzi_path, scalebar_length=scalebar_length, **options)
+            except Exception as error:
+                failed += 1
+                print(f"Failed: {image_path}: {error}")
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = {executor.submit(make_pyramid, image_path, dzi_path, scalebar_length=scalebar_length, **options): image_path
+                       for image_path, dzi_path, scalebar_length in jobs}
+            for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc="Tiling images", unit="image"):
+                try:
+                    tile_count += future.result()
+                except Exception as error:
+                    failed += 1
+                    print(f"Failed: {futures[future]}: {error}")
+    instrumentation.count('tiles', tile_count)
+    instrumentation.stop()
+    print(f"{tile_count} tiles written, {failed} images failed")
+
+
+if __name__ == '__main__':
+    main()